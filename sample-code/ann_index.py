@@ -0,0 +1,155 @@
+"""
+文書ベクトルの近似最近傍探索インデックス（IVF: 転置ファイル方式）
+ベクトルを k-means でいくつかのリストに分け、問い合わせに近い n_probe 個のリストだけを
+探索することで、全件比較せずに類似文書の上位k件を求めます
+n_probe を大きくするほど全件探索の結果に近づき（再現率が上がり）、遅くなります
+"""
+
+import json
+import os
+
+import numpy as np
+
+from similarity_search import SIMILARITY_MEMORY_BUDGET, normalize_rows, top_k_from_block
+from vector_clustering import assign_clusters, spherical_kmeans
+
+# --- 設定 ---
+DEFAULT_N_PROBE = 8          # 問い合わせ時に探索するリスト数
+KMEANS_TRAINING_POINTS_PER_LIST = 256  # k-means の学習に使う1リストあたりの標本数
+ANN_INDEX_SEED = 42
+ANN_INDEX_META_FILE = 'meta.json'
+ANN_INDEX_ARRAYS = ('vectors', 'ids', 'centroids', 'list_offsets')
+
+
+def default_n_lists(n_vectors):
+    """
+    ベクトル数に応じたリスト数（およそ √n）
+    """
+    return max(1, int(np.sqrt(n_vectors)))
+
+
+class IVFIndex:
+    """
+    転置ファイル方式の近似最近傍探索インデックス
+
+    vectors はリストごとに並べ替えた正規化済みベクトルで、
+    list_offsets[c]:list_offsets[c+1] の範囲がリスト c に属する
+    ids は並べ替え後の行から元の行番号への対応、names は元の行番号ごとの文書名
+    """
+
+    def __init__(self, vectors, ids, centroids, list_offsets, names, n_probe=DEFAULT_N_PROBE):
+        self.vectors = vectors
+        self.ids = ids
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.names = list(names)
+        self.name_to_id = {name: i for i, name in enumerate(self.names)}
+        self.n_probe = n_probe
+        self._rows = None
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def build(cls, vectors, names, n_lists=None, n_probe=DEFAULT_N_PROBE, seed=ANN_INDEX_SEED,
+              memory_budget=SIMILARITY_MEMORY_BUDGET):
+        """
+        ベクトル行列と行ごとの名前からインデックスを作成する
+        """
+        normed = normalize_rows(vectors)
+        if len(normed) != len(names):
+            raise ValueError("ベクトル数と名前の数が一致しません")
+        if len(normed) == 0:
+            raise ValueError("インデックスに登録するベクトルがありません")
+
+        n_lists = min(n_lists or default_n_lists(len(normed)), len(normed))
+        rng = np.random.default_rng(seed)
+        # 重心の学習は標本で行い、全ベクトルの割り当ては最後に1回だけ行う
+        n_training = min(len(normed), n_lists * KMEANS_TRAINING_POINTS_PER_LIST)
+        training = normed[rng.choice(len(normed), n_training, replace=False)]
+        centroids = spherical_kmeans(training, n_lists, seed=seed, memory_budget=memory_budget)
+
+        labels, _ = assign_clusters(normed, centroids, memory_budget)
+        order = np.argsort(labels, kind='stable')
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(normed[order], order.astype(np.int64), centroids, list_offsets, names, n_probe)
+
+    def _candidate_rows(self, query, n_probe):
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        return np.concatenate([
+            np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in probes
+        ])
+
+    def search_vector(self, vector, k=10, n_probe=None, exclude=()):
+        """
+        ベクトルに類似した上位k件を [(名前, 類似度), ...] で返す
+        exclude に含まれる名前は結果から除く
+        """
+        query = normalize_rows(np.asarray(vector).reshape(1, -1))[0]
+        rows = self._candidate_rows(query, n_probe)
+        excluded = {self.name_to_id[name] for name in exclude if name in self.name_to_id}
+        if excluded:
+            rows = rows[~np.isin(self.ids[rows], list(excluded))]
+
+        scores = self.vectors[rows] @ query
+        indices, top_scores = top_k_from_block(scores.reshape(1, -1), k)
+        return [(self.names[self.ids[rows[i]]], float(score))
+                for i, score in zip(indices[0], top_scores[0])]
+
+    def search_name(self, name, k=10, n_probe=None):
+        """
+        登録済みの文書に類似した上位k件を返す（その文書自身は除く）
+        """
+        if self._rows is None:
+            # 元の行番号から並べ替え後の行への対応
+            self._rows = np.empty(len(self.ids), dtype=np.int64)
+            self._rows[self.ids] = np.arange(len(self.ids))
+        row = self._rows[self.name_to_id[name]]
+        return self.search_vector(self.vectors[row], k, n_probe, exclude=(name,))
+
+    def recall(self, k=10, n_probe=None, sample_size=100, seed=ANN_INDEX_SEED):
+        """
+        登録済みの文書を標本として、全件探索の上位k件のうち何割を見つけられるかを返す
+        n_probe を調整する目安に使う
+        """
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(self.vectors), min(sample_size, len(self.vectors)), replace=False)
+        found = 0
+        expected = 0
+        for row in sample:
+            name = self.names[self.ids[row]]
+            scores = self.vectors @ self.vectors[row]
+            scores[row] = -np.inf
+            exact_indices, _ = top_k_from_block(scores.reshape(1, -1), k)
+            exact = {self.names[self.ids[i]] for i in exact_indices[0]}
+            approximate = {neighbor for neighbor, _ in self.search_name(name, k, n_probe)}
+            found += len(exact & approximate)
+            expected += len(exact)
+        return found / expected if expected else 1.0
+
+    def save(self, path):
+        """
+        ディレクトリに配列ごとの .npy と設定の JSON を保存する
+        """
+        os.makedirs(path, exist_ok=True)
+        for key in ANN_INDEX_ARRAYS:
+            np.save(os.path.join(path, f"{key}.npy"), getattr(self, key))
+        meta = {'names': self.names, 'n_probe': self.n_probe}
+        with open(os.path.join(path, ANN_INDEX_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        save() で保存したインデックスを読み込む
+        mmap=True なら配列を読み取り専用でメモリマップし、複数プロセスで共有できる
+        """
+        mmap_mode = 'r' if mmap else None
+        arrays = {key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode=mmap_mode)
+                  for key in ANN_INDEX_ARRAYS}
+        with open(os.path.join(path, ANN_INDEX_META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(names=meta['names'], n_probe=meta['n_probe'], **arrays)
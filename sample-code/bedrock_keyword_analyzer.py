@@ -6,12 +6,36 @@ Claude 4 Sonnet で特徴的な単語を抽出し、出現回数をカウント
 """
 
 import boto3
+import glob
 import json
+import os
 import re
+import time
 from datetime import datetime
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 
+import metrics
+from keyword_matcher import KeywordMatcher
+from response_cache import ResponseCache, get_response_cache
+from stream_json import StreamingJSONExtractor, iter_stream_text
+
+# --- 設定 ---
+# Claude 4 Sonnet用の推論プロファイルIDを使用
+MODEL_ID = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+REGION = "us-east-1"
+INFERENCE_CONFIG = {
+    "maxTokens": 2000,
+    "temperature": 0.1
+}
+PROMPT_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_work", "llm.md")
+PROMPT_PLACEHOLDER = "{{解析対象のテキストをLLMに渡す}}"
+# プロンプトキャッシュ: テンプレートの固定部分（指示と出力フォーマット）の後ろにキャッシュポイントを置く
+USE_PROMPT_CACHE = True
+PROMPT_CACHE_POINT = {"cachePoint": {"type": "default"}}
+PROMPT_CACHE_MIN_TOKENS = 1024  # これより短い固定部分はキャッシュされないため、キャッシュポイントを置かない（Claude Sonnet 4 の場合）
+TOKEN_USAGE_FIELDS = ("inputTokens", "cacheReadInputTokens", "cacheWriteInputTokens", "outputTokens")
+
 def extract_json_from_text(text):
     """
     テキストからJSONを抽出する関数
@@ -64,6 +88,94 @@ def extract_json_from_text(text):
     
     return None
 
+def estimate_tokens(text):
+    """
+    トークン数の概算（ASCII は4文字で1トークン、それ以外は1文字1トークンとみなす）
+    """
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+def build_prompt(prompt_template, text):
+    """
+    プロンプトテンプレートに解析対象のテキストを埋め込む関数
+    """
+    return prompt_template.replace(PROMPT_PLACEHOLDER, text)
+
+def split_prompt_template(prompt_template):
+    """
+    プロンプトテンプレートを解析対象テキストより前の固定部分と、後ろの部分に分ける関数
+    """
+    prefix, placeholder, suffix = prompt_template.partition(PROMPT_PLACEHOLDER)
+    if not placeholder:
+        raise ValueError(f"プロンプトテンプレートに {PROMPT_PLACEHOLDER} がありません")
+    return prefix, suffix
+
+def is_prompt_cacheable(prompt_template):
+    """
+    テンプレートの固定部分（推定トークン数）がプロンプトキャッシュの最小トークン数以上かを返す関数
+    """
+    return estimate_tokens(split_prompt_template(prompt_template)[0]) >= PROMPT_CACHE_MIN_TOKENS
+
+def build_messages(prompt_template, text, use_prompt_cache=USE_PROMPT_CACHE):
+    """
+    Converse API に渡すメッセージを作成する関数
+    テンプレートの固定部分を先頭のブロックにしてキャッシュポイントを置き、文書ごとに変わる部分を後ろに続ける
+    固定部分が PROMPT_CACHE_MIN_TOKENS に満たない場合はキャッシュされないため、キャッシュポイントは置かない
+    （モデルに渡るテキストは build_prompt() と同じ）
+    """
+    prefix, suffix = split_prompt_template(prompt_template)
+    content = [{"text": prefix}]
+    if use_prompt_cache and is_prompt_cacheable(prompt_template):
+        content.append(PROMPT_CACHE_POINT)
+    content.append({"text": text + suffix})
+    return [{"role": "user", "content": content}]
+
+def record_token_usage(usage):
+    """
+    応答の usage（キャッシュの読み込み・書き込みを含むトークン数）を計測値として記録する関数
+    """
+    for field in TOKEN_USAGE_FIELDS:
+        metrics.inc('bedrock_tokens_total', usage.get(field, 0), kind=field)
+
+def format_token_usage(usage):
+    """
+    usage を表示用の文字列にする関数
+    """
+    return (f"入力 {usage.get('inputTokens', 0)}"
+            f"（キャッシュ読み込み {usage.get('cacheReadInputTokens', 0)}・"
+            f"書き込み {usage.get('cacheWriteInputTokens', 0)}）, 出力 {usage.get('outputTokens', 0)}")
+
+def parse_keywords(llm_output):
+    """
+    LLMの出力から "results" の単語リストを取り出す関数（見つからなければ None）
+    """
+    extractor = StreamingJSONExtractor("results")
+    extractor.feed(llm_output)
+    keywords_data = extractor.result or extract_json_from_text(llm_output)
+    if not isinstance(keywords_data, dict) or not isinstance(keywords_data.get("results"), list):
+        return None
+    return keywords_data["results"]
+
+def count_keyword_occurrences(keywords, text):
+    """
+    各キーワードがテキスト中に出現する回数をカウントする関数
+    全キーワードを1つのオートマトンにまとめ、テキストを1回だけ走査する（大文字小文字を区別しない）
+    """
+    return KeywordMatcher(keywords).count(text)
+
+def count_keyword_occurrences_in_directory(keywords, directory, pattern="*.md"):
+    """
+    ディレクトリ内の各ファイルについてキーワードの出現回数をカウントする関数
+    オートマトンは1度だけ作り、ファイルは1つずつ読み込む
+    戻り値は {'documents': {ファイルパス: {キーワード: 回数}}, 'total': {キーワード: 回数}}
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    return KeywordMatcher(keywords).count_documents((path, _read_text(path)) for path in paths)
+
+def _read_text(path):
+    with metrics.timer('file_read'), open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
 def create_wordcloud(word_frequency, top_n=10):
     """
     単語の出現回数からワードクラウドを生成する関数
@@ -118,16 +230,12 @@ def analyze_text_with_bedrock():
     メイン分析関数：テキストファイルを読み込み、Bedrockで分析し、結果を出力
     """
     
-    # 1. 設定
-    # Claude 4 Sonnet用の推論プロファイルIDを使用
-    MODEL_ID = "us.anthropic.claude-sonnet-4-20250514-v1:0"
-    REGION = "us-east-1"
-    
+    # 1. 設定（MODEL_ID・REGION・INFERENCE_CONFIG はファイル先頭で定義）
     print("🚀 Amazon Bedrock テキスト分析を開始します...")
     
     # 2. テキストファイルを読み込み
     try:
-        with open("../sample-text/sample.md", "r", encoding="utf-8") as file:
+        with metrics.timer('file_read'), open("../sample-text/sample.md", "r", encoding="utf-8") as file:
             sample_text = file.read()
         print("✅ サンプルテキストを読み込みました")
     except FileNotFoundError:
@@ -136,7 +244,7 @@ def analyze_text_with_bedrock():
     
     # 3. プロンプトテンプレートを読み込み
     try:
-        with open("../_work/llm.md", "r", encoding="utf-8") as file:
+        with open(PROMPT_TEMPLATE_PATH, "r", encoding="utf-8") as file:
             prompt_template = file.read()
         print("✅ プロンプトテンプレートを読み込みました")
     except FileNotFoundError:
@@ -151,37 +259,53 @@ def analyze_text_with_bedrock():
     print("✅ Bedrockクライアントを初期化しました")
     
     # 5. プロンプトを作成（テンプレートにテキストを埋め込み）
-    prompt = prompt_template.replace("{{解析対象のテキストをLLMに渡す}}", sample_text)
+    prompt = build_prompt(prompt_template, sample_text)
     
-    # 6. Bedrock converse_stream APIを呼び出し
+    # 6. Bedrock converse_stream APIを呼び出し（同じモデル・設定・プロンプトの応答はキャッシュから返す）
+    cache = get_response_cache()
+    cache_key = ResponseCache.make_key('bedrock', 'converse_stream', prompt,
+                                       model_id=MODEL_ID, region=REGION, **INFERENCE_CONFIG)
+    llm_output = cache.get(cache_key) if cache is not None else None
+    cached = llm_output is not None
+    # 応答を受け取りながら JSON を解析する（"results" の単語は確定したものから表示）
+    extractor = StreamingJSONExtractor("results")
     try:
-        print("🤖 Claude 4 Sonnet で分析中...")
-        
-        response = bedrock_runtime.converse_stream(
-            modelId=MODEL_ID,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "text": prompt
-                        }
-                    ]
-                }
-            ],
-            inferenceConfig={
-                "maxTokens": 2000,
-                "temperature": 0.1
-            }
-        )
-        
-        # ストリーミングレスポンスを収集
-        llm_output = ""
-        for event in response["stream"]:
-            if "contentBlockDelta" in event:
-                delta = event["contentBlockDelta"]["delta"]
-                if "text" in delta:
-                    llm_output += delta["text"]
+        if cached:
+            print("♻️ キャッシュ済みの応答を使用します")
+            extractor.feed(llm_output)
+        else:
+            print("🤖 Claude 4 Sonnet で分析中...")
+
+            usage = {}
+            first_token_seconds = None
+            start_time = time.perf_counter()
+            with metrics.api_call('bedrock', 'converse_stream'):
+                # 固定の指示部分はキャッシュポイントまでをプロンプトキャッシュから読み込ませる（最小トークン数以上の場合）
+                response = bedrock_runtime.converse_stream(
+                    modelId=MODEL_ID,
+                    messages=build_messages(prompt_template, sample_text),
+                    inferenceConfig=INFERENCE_CONFIG
+                )
+
+                # ストリーミングレスポンスを逐次解析（最後の metadata イベントからトークン使用量を取得）
+                for text in iter_stream_text(response["stream"],
+                                             on_metadata=lambda metadata: usage.update(metadata.get("usage", {}))):
+                    if first_token_seconds is None:
+                        first_token_seconds = time.perf_counter() - start_time
+                        metrics.observe('time_to_first_token_seconds', first_token_seconds, service='bedrock')
+                    for keyword in extractor.feed(text):
+                        print(f"  ✨ {keyword}")
+                llm_output = extractor.text
+
+            if first_token_seconds is not None:
+                print(f"⏱️ 最初の応答までの時間: {first_token_seconds:.2f}秒")
+            if usage:
+                record_token_usage(usage)
+                print(f"📊 トークン使用量: {format_token_usage(usage)}")
+                if USE_PROMPT_CACHE and not is_prompt_cacheable(prompt_template):
+                    prefix_tokens = estimate_tokens(split_prompt_template(prompt_template)[0])
+                    print(f"💡 プロンプトの固定部分（約{prefix_tokens}トークン）が{PROMPT_CACHE_MIN_TOKENS}トークンに"
+                          "満たないため、キャッシュポイントを置いていません")
         
         print("✅ LLMからの応答を取得しました")
         print(f"📄 LLM出力プレビュー: {llm_output[:200]}...")
@@ -195,7 +319,11 @@ def analyze_text_with_bedrock():
         print("🔍 JSON形式のデータを抽出中...")
         
         # 堅牢なJSON抽出を実行
-        keywords_data = extract_json_from_text(llm_output)
+        with metrics.timer('json_parse'):
+            keywords_data = extractor.result
+            if keywords_data is None:
+                # ストリーム中に見つからなかった場合は出力全体から抽出を試みる
+                keywords_data = extract_json_from_text(llm_output)
         
         if keywords_data is None:
             print("❌ 有効なJSONが見つかりませんでした")
@@ -209,6 +337,9 @@ def analyze_text_with_bedrock():
             return
             
         keywords = keywords_data["results"]
+        # 単語を取り出せた応答だけをキャッシュする（壊れた応答を次回以降も使い回さない）
+        if cache is not None and not cached and isinstance(keywords, list):
+            cache.put(cache_key, llm_output)
         print(f"✅ {len(keywords)}個の特徴的な単語を抽出しました")
         print(f"📝 抽出された単語: {keywords}")
         
@@ -220,13 +351,9 @@ def analyze_text_with_bedrock():
     # 8. 各単語の出現回数をカウント
     print("🔍 単語の出現回数をカウント中...")
     
-    word_count = {}
-    for keyword in keywords:
-        # 正規表現で単語の出現回数をカウント（大文字小文字を区別しない）
-        pattern = re.escape(keyword)
-        matches = re.findall(pattern, sample_text, re.IGNORECASE)
-        count = len(matches)
-        word_count[keyword] = count
+    with metrics.timer('keyword_count'):
+        word_count = count_keyword_occurrences(keywords, sample_text)
+    for keyword, count in word_count.items():
         print(f"  📝 '{keyword}': {count}回")
     
     # 9. 出現回数の多い順に並び替え
@@ -264,7 +391,8 @@ def analyze_text_with_bedrock():
     print(f"\n✅ 結果を {output_file} に保存しました")
     
     # 12. ワードクラウドを生成
-    create_wordcloud(sorted_word_count, top_n=10)
+    with metrics.timer('rendering', target='wordcloud'):
+        create_wordcloud(sorted_word_count, top_n=10)
     
     print("🎉 分析完了！")
 
@@ -0,0 +1,253 @@
+"""
+ディレクトリ内の文書から Amazon Bedrock で特徴的な単語を並行して抽出するランナー
+共有のクライアントで複数のリクエストを同時に送り、スロットリングされたら流量を自動で下げて再試行します
+トークン数の上限を超える長い文書は文境界でチャンクに分割し、チャンクごとに抽出した単語を
+文書ごとのランキングに統合します（map-reduce）
+
+使い方:
+    python bedrock_runner.py ../sample-text --concurrency 4 --rps 1 --output bedrock_result.json
+    # ローカルのスタブ（bedrock_stub.py）に向ける場合
+    python bedrock_runner.py ../sample-text --endpoint-url http://127.0.0.1:8765
+"""
+
+import argparse
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+import metrics
+from bedrock_keyword_analyzer import (INFERENCE_CONFIG, MODEL_ID, PROMPT_TEMPLATE_PATH, REGION, TOKEN_USAGE_FIELDS,
+                                      build_messages, build_prompt, estimate_tokens, format_token_usage,
+                                      parse_keywords, record_token_usage)
+from comprehend_analysis import split_sentences
+from keyword_matcher import KeywordMatcher
+from rate_limit import MAX_ATTEMPTS, AdaptiveTokenBucket, call_with_retry
+from response_cache import ResponseCache, get_response_cache
+
+# --- 設定 ---
+MAX_CONCURRENCY = 4         # 同時に送るリクエスト数
+REQUESTS_PER_SECOND = 1.0   # 流量の上限（スロットリングされたら自動で下げる）
+CHUNK_TOKEN_BUDGET = 6000   # 1リクエストに含める文書テキストのトークン数の上限（推定）
+DOCUMENT_WINDOW = 20        # 一度に読み込んで分析する文書数（メモリ使用量の上限）
+READ_TIMEOUT_SECONDS = 300  # モデルの応答を待つ時間
+
+
+@functools.lru_cache(maxsize=None)
+def get_bedrock_client(region_name=REGION, max_pool_connections=MAX_CONCURRENCY, endpoint_url=None):
+    """
+    bedrock-runtime クライアントを作成し、同じ設定なら以降は使い回す
+    スロットリングや通信エラー（読み込みのタイムアウト・接続の切断）の再試行は call_with_retry で
+    流量制限と合わせて行うため、botocore 側では再試行しない
+    """
+    config = Config(max_pool_connections=max_pool_connections, read_timeout=READ_TIMEOUT_SECONDS,
+                    retries={'mode': 'standard', 'total_max_attempts': 1})
+    return boto3.client("bedrock-runtime", region_name=region_name, endpoint_url=endpoint_url, config=config)
+
+
+def split_text_by_tokens(text, max_tokens=CHUNK_TOKEN_BUDGET):
+    """
+    テキストを推定トークン数が max_tokens 以下のチャンクに分割する
+    できるだけ文の途中では切らず、1文だけで上限を超える場合のみ文字数で切る
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in split_sentences(text):
+        tokens = estimate_tokens(sentence)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(''.join(current))
+            current = []
+            current_tokens = 0
+        if tokens > max_tokens:
+            # 1文字は1トークン以下と見積もっているため、文字数で切れば上限に収まる
+            chunks.extend(sentence[start:start + max_tokens] for start in range(0, len(sentence), max_tokens))
+            continue
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append(''.join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def merge_chunk_keywords(chunk_keywords):
+    """
+    チャンクごとの単語リスト（重要な順）を1つのランキングに統合する
+    各チャンクでの順位の逆数（1位=1, 2位=1/2, ...）の合計が大きい順に並べる
+    """
+    scores = {}
+    for keywords in chunk_keywords:
+        words = (keyword.strip() for keyword in keywords if isinstance(keyword, str))
+        for rank, keyword in enumerate(dict.fromkeys(word for word in words if word)):
+            scores[keyword] = scores.get(keyword, 0.0) + 1.0 / (rank + 1)
+    return sorted(scores, key=lambda keyword: -scores[keyword])
+
+
+class BedrockCorpusRunner:
+    """
+    文書集合から並行して Bedrock で特徴的な単語を抽出する
+
+    各文書をトークン数の上限ごとのチャンクに分割し、全文書のチャンクを1つのスレッドプールで
+    同時に max_concurrency 件まで送信する。流量は AIMD で調整し、スロットリングされたら半分に下げ、
+    成功するたびに requests_per_second まで少しずつ戻す
+    同じプロンプトの応答は応答キャッシュから返す
+    プロンプトの固定部分が最小トークン数以上ならキャッシュポイントを置き、token_usage にキャッシュの読み込み・書き込みを含む
+    トークン使用量の合計を集計する
+    """
+
+    def __init__(self, bedrock=None, region_name=REGION, model_id=MODEL_ID, prompt_template=None,
+                 max_concurrency=MAX_CONCURRENCY, requests_per_second=REQUESTS_PER_SECOND,
+                 max_attempts=MAX_ATTEMPTS, chunk_tokens=CHUNK_TOKEN_BUDGET, document_window=DOCUMENT_WINDOW,
+                 endpoint_url=None, cache=None):
+        self.bedrock = bedrock or get_bedrock_client(region_name, max_concurrency, endpoint_url)
+        self.model_id = model_id
+        if prompt_template is None:
+            with open(PROMPT_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+                prompt_template = f.read()
+        self.prompt_template = prompt_template
+        self.max_concurrency = max_concurrency
+        self.limiter = AdaptiveTokenBucket(requests_per_second)
+        self.max_attempts = max_attempts
+        self.chunk_tokens = chunk_tokens
+        self.document_window = document_window
+        self.cache = cache if cache is not None else get_response_cache()
+        self.token_usage = dict.fromkeys(TOKEN_USAGE_FIELDS, 0)
+        self._usage_lock = threading.Lock()
+
+    def _converse(self, text):
+        with metrics.api_call('bedrock', 'converse'):
+            response = self.bedrock.converse(
+                modelId=self.model_id,
+                messages=build_messages(self.prompt_template, text),
+                inferenceConfig=INFERENCE_CONFIG
+            )
+        usage = response.get('usage', {})
+        record_token_usage(usage)
+        with self._usage_lock:
+            for field in TOKEN_USAGE_FIELDS:
+                self.token_usage[field] += usage.get(field, 0)
+        return response
+
+    def extract_keywords(self, text):
+        """
+        1チャンク分のテキストから単語リスト（重要な順）を抽出する
+        JSON を取り出せなかった場合は ValueError
+        """
+        prompt = build_prompt(self.prompt_template, text)
+        cache_key = ResponseCache.make_key('bedrock', 'converse', prompt, model_id=self.model_id,
+                                           region=self.bedrock.meta.region_name, **INFERENCE_CONFIG)
+        llm_output = self.cache.get(cache_key) if self.cache is not None else None
+        cached = llm_output is not None
+        if not cached:
+            response = call_with_retry(lambda: self._converse(text), self.limiter, self.max_attempts,
+                                       service='bedrock')
+            llm_output = ''.join(block.get('text', '') for block in response['output']['message']['content'])
+
+        keywords = parse_keywords(llm_output)
+        if keywords is None:
+            raise ValueError(f"LLMの出力から 'results' を取り出せませんでした: {llm_output[:100]}")
+        if self.cache is not None and not cached:
+            self.cache.put(cache_key, llm_output)
+        return keywords
+
+    def analyze_documents(self, documents):
+        """
+        {文書名: テキスト} を分析し、{文書名: 分析結果} を返す
+        """
+        return dict(self.iter_analyze(documents.items()))
+
+    def iter_analyze(self, items):
+        """
+        (文書名, テキスト) のイテラブルを document_window 件ずつ分析し、(文書名, 分析結果) を順に返す
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            window = {}
+            for name, text in items:
+                window[name] = text
+                if len(window) >= self.document_window:
+                    yield from self._analyze_window(executor, window)
+                    window = {}
+            if window:
+                yield from self._analyze_window(executor, window)
+
+    def _analyze_window(self, executor, documents):
+        # map: 全文書のチャンクをまとめてスレッドプールに投入する
+        futures = {name: [executor.submit(self.extract_keywords, chunk)
+                          for chunk in split_text_by_tokens(text, self.chunk_tokens)]
+                   for name, text in documents.items()}
+        # reduce: 文書ごとにチャンクの結果を統合し、文書全体での出現回数を数える
+        for name, chunk_futures in futures.items():
+            chunk_keywords = []
+            errors = []
+            for future in chunk_futures:
+                try:
+                    chunk_keywords.append(future.result())
+                except (BotoCoreError, ClientError, ValueError) as e:
+                    errors.append(str(e))
+            keywords = merge_chunk_keywords(chunk_keywords)
+            with metrics.timer('keyword_count'):
+                counts = KeywordMatcher(keywords).count(documents[name])
+            yield name, {
+                'keywords': keywords,
+                'word_frequency': dict(sorted(counts.items(), key=lambda item: item[1], reverse=True)),
+                'chunks': len(chunk_futures),
+                'errors': errors,
+            }
+
+    def analyze_directory(self, directory, pattern='*.md'):
+        """
+        ディレクトリ内のファイルを分析し、{ファイルパス: 分析結果} を返す
+        ファイルは document_window 件ずつ読み込む
+        """
+        paths = sorted(glob.glob(os.path.join(directory, pattern)))
+        return dict(self.iter_analyze((path, _read_text(path)) for path in paths))
+
+
+def _read_text(path):
+    with metrics.timer('file_read'), open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ディレクトリ内の文書から Amazon Bedrock で特徴的な単語を並行して抽出する")
+    parser.add_argument('directory', help="分析対象のディレクトリ")
+    parser.add_argument('--pattern', default='*.md', help="対象ファイルのパターン")
+    parser.add_argument('--region', default=REGION)
+    parser.add_argument('--model-id', default=MODEL_ID)
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help="同時に送るリクエスト数")
+    parser.add_argument('--rps', type=float, default=REQUESTS_PER_SECOND, help="1秒あたりの最大リクエスト数")
+    parser.add_argument('--chunk-tokens', type=int, default=CHUNK_TOKEN_BUDGET, help="1チャンクの推定トークン数の上限")
+    parser.add_argument('--endpoint-url', default=None, help="Bedrock の代わりに使うエンドポイント（スタブなど）")
+    parser.add_argument('--output', default='bedrock_result.json', help="結果を保存する JSON ファイル")
+    args = parser.parse_args()
+
+    runner = BedrockCorpusRunner(region_name=args.region, model_id=args.model_id,
+                                 max_concurrency=args.concurrency, requests_per_second=args.rps,
+                                 chunk_tokens=args.chunk_tokens, endpoint_url=args.endpoint_url)
+    start_time = time.time()
+    analyses = runner.analyze_directory(args.directory, args.pattern)
+
+    for path, analysis in analyses.items():
+        top_words = ', '.join(f"{word}({count})" for word, count in list(analysis['word_frequency'].items())[:5])
+        print(f"{os.path.basename(path)}: チャンク数 {analysis['chunks']}, 単語 {len(analysis['keywords'])}件: {top_words}")
+        for error in analysis['errors']:
+            print(f"  警告: {error}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(analyses, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ {len(analyses)}文書の結果を {args.output} に保存しました（所要時間: {time.time() - start_time:.2f}秒）")
+    print(f"📊 トークン使用量の合計: {format_token_usage(runner.token_usage)}")
+    if runner.cache is not None:
+        stats = runner.cache.stats()
+        print(f"♻️ 応答キャッシュ: ヒット {stats['hits']}件, ミス {stats['misses']}件")
+
+
+if __name__ == '__main__':
+    main()
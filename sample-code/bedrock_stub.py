@@ -0,0 +1,168 @@
+"""
+Amazon Bedrock Runtime の Converse API を模したローカルのスタブサーバ
+bedrock_runner.py を実際のモデルを呼ばずに試すためのもので、
+プロンプト中のテキストから漢字・カタカナの連続を頻度順に数えて "results" として返します
+指定した割合でスロットリング（HTTP 429 ThrottlingException）を返すこともできます
+cachePoint より前の部分はプロンプトキャッシュを模して、初回は書き込み・2回目以降は読み込みとして usage に計上します
+
+使い方:
+    python bedrock_stub.py --port 8765 --throttle-rate 0.2
+    AWS_ACCESS_KEY_ID=dummy AWS_SECRET_ACCESS_KEY=dummy \\
+        python bedrock_runner.py ../sample-text --endpoint-url http://127.0.0.1:8765
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 設定 ---
+STUB_KEYWORDS = 20   # 1回の応答で返す単語数
+CONVERSE_PATH_PATTERN = re.compile(r'^/model/[^/]+/converse$')
+# プロンプトテンプレートの <text> タグ内を解析対象とする（閉じタグはテンプレートの表記揺れも許容）
+TEXT_TAG_PATTERN = re.compile(r'<text>(.*?)</tex', re.DOTALL)
+WORD_PATTERN = re.compile(r'[一-鿿]{2,}|[゠-ヿ]{2,}')
+
+
+def extract_stub_keywords(text, n_keywords=STUB_KEYWORDS):
+    """
+    テキスト中の漢字・カタカナの連続（2文字以上）を出現回数の多い順に返す
+    """
+    # テンプレートの説明文にも空の <text></text> があるため、最も長い囲みを解析対象とする
+    bodies = TEXT_TAG_PATTERN.findall(text)
+    if bodies:
+        text = max(bodies, key=len)
+    return [word for word, _ in Counter(WORD_PATTERN.findall(text)).most_common(n_keywords)]
+
+
+class BedrockStubServer(ThreadingHTTPServer):
+    """
+    Converse API のスタブサーバ
+    requests と throttled に受け付けたリクエスト数とスロットリングした数を数える
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, throttle_rate=0.0, latency=0.0, seed=0):
+        super().__init__(address, BedrockStubHandler)
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.requests = 0
+        self.throttled = 0
+        self.cached_prefixes = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def should_throttle(self):
+        with self._lock:
+            self.requests += 1
+            throttle = self._random.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+            return throttle
+
+    def cache_prefix(self, prefix):
+        """
+        キャッシュ済みの固定部分なら True を返し、初回ならキャッシュに登録して False を返す
+        """
+        with self._lock:
+            if prefix in self.cached_prefixes:
+                return True
+            self.cached_prefixes.add(prefix)
+            return False
+
+
+class BedrockStubHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not CONVERSE_PATH_PATTERN.match(self.path):
+            self._send_json(404, {'message': f"Unknown path: {self.path}"},
+                            {'x-amzn-ErrorType': 'ResourceNotFoundException'})
+            return
+        if self.server.should_throttle():
+            self._send_json(429, {'message': "Too many requests, please wait before trying again."},
+                            {'x-amzn-ErrorType': 'ThrottlingException'})
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        request = json.loads(body)
+        blocks = [block for message in request.get('messages', []) for block in message.get('content', [])]
+        text = ''.join(block.get('text', '') for block in blocks)
+        cache_points = [i for i, block in enumerate(blocks) if 'cachePoint' in block]
+        # 最後のキャッシュポイントより前のテキストをキャッシュ対象とする（トークン数は文字数で代用）
+        prefix = ''.join(block.get('text', '') for block in blocks[:cache_points[-1]]) if cache_points else ''
+        cache_read = cache_write = 0
+        if prefix:
+            if self.server.cache_prefix(prefix):
+                cache_read = len(prefix)
+            else:
+                cache_write = len(prefix)
+
+        output = json.dumps({'results': extract_stub_keywords(text)}, ensure_ascii=False)
+        input_tokens = len(text) - len(prefix)
+        output_tokens = len(output)
+        self._send_json(200, {
+            'output': {'message': {'role': 'assistant', 'content': [{'text': output}]}},
+            'stopReason': 'end_turn',
+            'usage': {'inputTokens': input_tokens, 'outputTokens': output_tokens,
+                      'cacheReadInputTokens': cache_read, 'cacheWriteInputTokens': cache_write,
+                      'totalTokens': input_tokens + cache_read + cache_write + output_tokens},
+            'metrics': {'latencyMs': int(self.server.latency * 1000)},
+        })
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # リクエストごとのアクセスログは出さない
+        pass
+
+
+def start_stub_server(host='127.0.0.1', port=0, throttle_rate=0.0, latency=0.0, seed=0):
+    """
+    スタブサーバをバックグラウンドのスレッドで起動して返す（port=0 なら空いているポートを使う）
+    終了するときは server.shutdown() を呼ぶ
+    """
+    server = BedrockStubServer((host, port), throttle_rate, latency, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bedrock Converse API のローカルスタブ")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="スロットリングを返す割合（0〜1）")
+    parser.add_argument('--latency', type=float, default=0.0, help="1リクエストあたりの応答遅延（秒）")
+    args = parser.parse_args()
+
+    server = BedrockStubServer((args.host, args.port), args.throttle_rate, args.latency)
+    print(f"🧪 Bedrock スタブを {server.url} で起動しました（Ctrl+C で終了）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+主要な処理経路の性能ベンチマーク
+sample-text/ と、それを 10〜1000 倍に水増しした合成コーパスに対して
+スループット（単語/秒）、段階ごとのRSS増加量、レイテンシのパーセンタイルを計測し、
+結果を JSON に保存して前回のベースラインとの比較で性能劣化を検出します
+
+使い方:
+    python benchmark.py --scales 1 10 --output benchmark_result.json
+    python benchmark.py --scales 1 10 --baseline benchmark_result.json
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from doc2vec_analysis import TRAINING_WORKERS, Doc2VecAnalyzer
+from mecab_analysis import get_tokenizer
+
+# --- 設定 ---
+SAMPLE_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sample-text')
+BENCHMARK_RESULT_PATH = "benchmark_result.json"
+DEFAULT_SCALES = (1, 10)
+SYNTHETIC_SEED = 42
+REGRESSION_TOLERANCE = 0.2  # ベースラインより20%以上悪化したら性能劣化とみなす
+REGRESSION_MIN_LATENCY_MS = 1.0  # これより短いレイテンシは計測誤差が大きいため比較しない
+WORD_QUERY_COUNT = 50       # 単語類似度で問い合わせる頻出単語数
+KEYWORD_COUNT = 100         # キーワードカウントで使う頻出単語数
+RSS_SAMPLE_INTERVAL = 0.01  # 段階ごとのピークRSSを調べる間隔（秒）
+
+# --- 合成コーパス ---
+
+def generate_synthetic_corpus(output_dir, scale, source_dir=SAMPLE_DIR_PATH, seed=SYNTHETIC_SEED):
+    """
+    sample-text/ の各文書の段落を並べ替えたコピーを scale 個ずつ作成する
+    同じ seed なら毎回同じコーパスになる
+    """
+    rng = random.Random(seed)
+    paths = []
+    for source_path in sorted(glob.glob(os.path.join(source_dir, '*.md'))):
+        with open(source_path, 'r', encoding='utf-8') as f:
+            paragraphs = [p for p in f.read().split('\n\n') if p.strip()]
+
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        for i in range(scale):
+            if i > 0:
+                rng.shuffle(paragraphs)
+            path = os.path.join(output_dir, f"{stem}_{i:04d}.md")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n\n'.join(paragraphs))
+            paths.append(path)
+    return paths
+
+# --- 計測ユーティリティ ---
+
+def current_rss_mb():
+    """
+    現在のRSS（MB）。/proc のない環境では None
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+class RssTracker:
+    """
+    with ブロックの間のRSSを一定間隔で調べ、開始時点からの最大の増加量（MB）を記録する
+    ru_maxrss はプロセス全体のピークで前の段階の値を引き継ぐため、段階ごとにはこちらで計測する
+    繰り返し with で使った場合は各回の増加量の最大値になる
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_delta_mb = None
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._start = current_rss_mb()
+        if self._start is not None:
+            self._peak = self._start
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, current_rss_mb())
+
+    def __exit__(self, *exc_info):
+        if self._start is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, current_rss_mb())
+        self.peak_delta_mb = max(self.peak_delta_mb or 0.0, self._peak - self._start)
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies, elapsed, tokens=None, rss=None):
+    """
+    1件ごとのレイテンシ（秒）と総処理時間から指標をまとめる
+    rss にはその段階を計測した RssTracker を渡す
+    """
+    latencies = sorted(latencies)
+    result = {
+        'items': len(latencies),
+        'elapsed_sec': elapsed,
+        'items_per_sec': len(latencies) / elapsed if elapsed else None,
+        'latency_ms': {
+            'p50': _to_ms(percentile(latencies, 50)),
+            'p95': _to_ms(percentile(latencies, 95)),
+            'p99': _to_ms(percentile(latencies, 99)),
+            'max': _to_ms(latencies[-1] if latencies else None),
+        },
+        'peak_rss_delta_mb': rss.peak_delta_mb if rss is not None else None,
+    }
+    if tokens is not None:
+        result['tokens'] = tokens
+        result['tokens_per_sec'] = tokens / elapsed if elapsed else None
+    return result
+
+def _to_ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+def time_each(items, func):
+    """
+    items の各要素に func を適用し、(結果リスト, レイテンシリスト, 総処理時間) を返す
+    """
+    results = []
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        results.append(func(item))
+        latencies.append(time.perf_counter() - t0)
+    return results, latencies, time.perf_counter() - start
+
+@contextlib.contextmanager
+def quiet():
+    """
+    分析関数の print 出力を計測中だけ抑止する
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+# --- ベンチマーク本体 ---
+
+def run_benchmarks(paths, repeat=3, work_dir=None):
+    texts = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    results = {}
+
+    # 1. MeCab トークン化とフィルタリング（analyze_word_frequency_with_mecab と同じ処理）
+    tokenizer = get_tokenizer()
+    with RssTracker() as rss:
+        word_lists, latencies, elapsed = time_each(texts, tokenizer.tokenize)
+    word_counts = Counter()
+    for words in word_lists:
+        word_counts.update(words)
+    results['mecab_tokenize'] = summarize(latencies, elapsed, sum(map(len, word_lists)), rss)
+
+    # 2. Doc2VecAnalyzer.preprocess_text（キャッシュなし）
+    analyzer = Doc2VecAnalyzer()
+    # トークンキャッシュを使うと形態素解析の性能が測れないため無効化する
+    analyzer.token_cache = None
+    with quiet(), RssTracker() as rss:
+        documents, latencies, elapsed = time_each(
+            list(zip(texts, paths)), lambda item: analyzer.preprocess_text(*item)
+        )
+    results['doc2vec_preprocess'] = summarize(latencies, elapsed, sum(map(len, documents)), rss)
+
+    with quiet():
+        for words, path in zip(documents, paths):
+            if words:
+                analyzer.add_document(words, path)
+    tagged_documents = analyzer.documents.tagged_documents(analyzer.document_names)
+    total_tokens = sum(map(len, analyzer.documents))
+
+    # 3. Doc2Vec build_vocab / train
+    build_latencies = []
+    train_latencies = []
+    build_rss = RssTracker()
+    train_rss = RssTracker()
+    for _ in range(repeat):
+        model = analyzer.create_model()
+        with build_rss:
+            t0 = time.perf_counter()
+            model.build_vocab(tagged_documents)
+            build_latencies.append(time.perf_counter() - t0)
+
+        with train_rss:
+            t0 = time.perf_counter()
+            model.train(tagged_documents, total_examples=model.corpus_count, epochs=model.epochs)
+            train_latencies.append(time.perf_counter() - t0)
+    analyzer.model = model
+    results['doc2vec_build_vocab'] = summarize(build_latencies, sum(build_latencies), total_tokens * repeat,
+                                               build_rss)
+    results['doc2vec_train'] = summarize(
+        train_latencies, sum(train_latencies), total_tokens * model.epochs * repeat, train_rss
+    )
+    results['doc2vec_train']['workers'] = model.workers
+
+    # 3'. corpus_file モードでの学習（全コア）と、イテラブル方式に対する高速化率
+    corpus_file = analyzer.export_corpus_file(analyzer.documents,
+                                              os.path.join(work_dir or tempfile.gettempdir(), 'corpus.txt'))
+    corpus_file_latencies = []
+    corpus_file_rss = RssTracker()
+    for _ in range(repeat):
+        corpus_model = analyzer.create_model(workers=TRAINING_WORKERS)
+        corpus_model.build_vocab(corpus_file=corpus_file)
+        with corpus_file_rss:
+            t0 = time.perf_counter()
+            corpus_model.train(corpus_file=corpus_file, total_examples=corpus_model.corpus_count,
+                               total_words=corpus_model.corpus_total_words, epochs=corpus_model.epochs)
+            corpus_file_latencies.append(time.perf_counter() - t0)
+    results['doc2vec_train_corpus_file'] = summarize(
+        corpus_file_latencies, sum(corpus_file_latencies), total_tokens * corpus_model.epochs * repeat,
+        corpus_file_rss
+    )
+    results['doc2vec_train_corpus_file']['workers'] = corpus_model.workers
+    results['doc2vec_train_corpus_file']['speedup'] = sum(train_latencies) / sum(corpus_file_latencies)
+
+    # 4. 文書間類似度（全ペア）と単語類似度
+    with quiet(), RssTracker() as rss:
+        _, latencies, elapsed = time_each(range(repeat), lambda _: analyzer.analyze_document_similarity())
+    results['document_similarity'] = summarize(latencies, elapsed, rss=rss)
+
+    # analyze_word_similarity と同じ similar_words を、1語ずつと全語まとめての両方で計測する
+    query_words = [word for word, _ in analyzer.most_common_words(WORD_QUERY_COUNT)
+                   if word in model.wv.key_to_index]
+    with RssTracker() as rss:
+        _, latencies, elapsed = time_each(query_words, lambda word: analyzer.similar_words([word], topn=5))
+    results['word_similarity'] = summarize(latencies, elapsed, rss=rss)
+    with RssTracker() as rss:
+        _, latencies, elapsed = time_each(range(repeat), lambda _: analyzer.similar_words(query_words, topn=5))
+    results['word_similarity_batch'] = summarize(latencies, elapsed, rss=rss)
+    results['word_similarity_batch']['queries'] = len(query_words)
+
+    # 5. bedrock_keyword_analyzer のキーワードカウント
+    keyword_counter = _load_keyword_counter()
+    if keyword_counter is not None:
+        keywords = [word for word, _ in word_counts.most_common(KEYWORD_COUNT)]
+        with RssTracker() as rss:
+            _, latencies, elapsed = time_each(texts, lambda text: keyword_counter(keywords, text))
+        results['keyword_count'] = summarize(latencies, elapsed, sum(map(len, texts)), rss)
+        results['keyword_count']['unit'] = 'tokens = 文字数'
+
+    return results
+
+def _load_keyword_counter():
+    try:
+        from bedrock_keyword_analyzer import count_keyword_occurrences
+    except ImportError as e:
+        print(f"⚠️ キーワードカウントのベンチマークをスキップします: {e}")
+        return None
+    return count_keyword_occurrences
+
+# --- ベースライン比較 ---
+
+def compare_with_baseline(current, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    ベースラインと比べて悪化した指標の一覧を返す
+    """
+    regressions = []
+    for scale, stages in current['results'].items():
+        for stage, metrics in stages.items():
+            base = baseline.get('results', {}).get(scale, {}).get(stage)
+            if not base:
+                continue
+
+            for key in ('tokens_per_sec', 'items_per_sec'):
+                now, before = metrics.get(key), base.get(key)
+                if now and before and now < before * (1 - tolerance):
+                    regressions.append(f"x{scale} {stage}: {key} {before:.1f} -> {now:.1f}")
+
+            now, before = metrics['latency_ms']['p95'], base['latency_ms']['p95']
+            if (now and before and before >= REGRESSION_MIN_LATENCY_MS
+                    and now > before * (1 + tolerance)):
+                regressions.append(f"x{scale} {stage}: p95 {before:.2f}ms -> {now:.2f}ms")
+    return regressions
+
+def print_results(results):
+    for scale, stages in results.items():
+        print(f"\n=== 合成コーパス x{scale} ===")
+        for stage, m in stages.items():
+            throughput = f"{m['tokens_per_sec']:,.0f} 単語/秒" if m.get('tokens_per_sec') else f"{m['items_per_sec']:,.1f} 件/秒"
+            latency = m['latency_ms']
+            print(f"  {stage:26s} {throughput:>20s}  "
+                  f"p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms p99={latency['p99']:.2f}ms  "
+                  f"ΔRSS={m.get('peak_rss_delta_mb') or 0:.1f}MB")
+            if 'speedup' in m:
+                print(f"  {'':26s} イテラブル方式（{stages['doc2vec_train']['workers']}スレッド）に対して "
+                      f"{m['speedup']:.2f}倍（{m['workers']}スレッド）")
+
+def main():
+    parser = argparse.ArgumentParser(description="テキスト分析サンプルの性能ベンチマーク")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                        help="sample-text を何倍に水増しするか（例: 1 10 100 1000）")
+    parser.add_argument('--repeat', type=int, default=3, help="学習・類似度計算の繰り返し回数")
+    parser.add_argument('--output', default=BENCHMARK_RESULT_PATH, help="結果を保存する JSON ファイル")
+    parser.add_argument('--baseline', help="比較対象のベースライン JSON ファイル")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="性能劣化とみなす悪化率（0.2 = 20%%）")
+    args = parser.parse_args()
+
+    # --output と同じファイルでも上書きされる前の内容と比べるよう、先に読み込んでおく
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': {},
+    }
+
+    for scale in args.scales:
+        work_dir = tempfile.mkdtemp(prefix=f"benchmark_x{scale}_")
+        try:
+            paths = generate_synthetic_corpus(work_dir, scale)
+            print(f"🚀 合成コーパス x{scale} ({len(paths)}文書) を計測中...")
+            report['results'][str(scale)] = run_benchmarks(paths, repeat=args.repeat, work_dir=work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(report['results'])
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 結果を {args.output} に保存しました")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ ベースラインからの性能劣化を検出しました:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\n✅ ベースラインからの性能劣化はありません")
+
+if __name__ == '__main__':
+    main()
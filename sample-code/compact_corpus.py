@@ -0,0 +1,108 @@
+"""
+文書の単語列を整数IDの配列として保持するコンパクトなコーパス
+同じ単語の文字列を文書ごとに持たず、共有の語彙表と array('I') で表現します
+"""
+
+from array import array
+
+import numpy as np
+from gensim.models.doc2vec import TaggedDocument
+
+TOKEN_ID_TYPECODE = 'I'  # 符号なし32bit整数
+
+
+class CompactCorpus:
+    """
+    単語ID配列のリストとして文書を保持するコーパス
+    list と同じように添字アクセス・追加・置換・削除ができ、取り出すと単語リストに復元される
+    （語彙表は追加のみで、文書を削除しても単語IDは再利用しない）
+    """
+
+    def __init__(self, documents=()):
+        self.word_to_id = {}  # 単語 -> ID
+        self.id_to_word = []  # ID -> 単語
+        self._docs = []       # 文書ごとの単語ID配列
+        for words in documents:
+            self.append(words)
+
+    def encode(self, words):
+        """
+        単語リストを単語ID配列に変換する（未知の単語は語彙に追加）
+        """
+        word_to_id = self.word_to_id
+        id_to_word = self.id_to_word
+        ids = array(TOKEN_ID_TYPECODE)
+        for word in words:
+            token_id = word_to_id.get(word)
+            if token_id is None:
+                token_id = len(id_to_word)
+                word_to_id[word] = token_id
+                id_to_word.append(word)
+            ids.append(token_id)
+        return ids
+
+    def decode(self, ids):
+        """
+        単語ID配列を単語リストに戻す
+        """
+        id_to_word = self.id_to_word
+        return [id_to_word[token_id] for token_id in ids]
+
+    def append(self, words):
+        self._docs.append(self.encode(words))
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __iter__(self):
+        for ids in self._docs:
+            yield self.decode(ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.decode(ids) for ids in self._docs[i]]
+        return self.decode(self._docs[i])
+
+    def __setitem__(self, i, words):
+        self._docs[i] = self.encode(words)
+
+    def __delitem__(self, i):
+        del self._docs[i]
+
+    def token_ids(self, i):
+        """
+        i番目の文書の単語ID配列（NumPy配列としてコピーなしで参照）
+        """
+        return np.frombuffer(self._docs[i], dtype=np.uintc)
+
+    def document_term_counts(self, i):
+        """
+        i番目の文書の {単語: 出現回数}
+        """
+        ids, counts = np.unique(self.token_ids(i), return_counts=True)
+        id_to_word = self.id_to_word
+        return {id_to_word[token_id]: int(count) for token_id, count in zip(ids.tolist(), counts.tolist())}
+
+    def tagged_documents(self, document_names):
+        """
+        gensim に渡すための TaggedDocument の再走査可能なイテラブル
+        """
+        return TaggedDocumentStream(self, document_names)
+
+
+class TaggedDocumentStream:
+    """
+    文書を1件ずつ TaggedDocument に変換して返すイテラブル
+    build_vocab と train で何度でも先頭から走査できる
+    """
+
+    def __init__(self, documents, document_names):
+        self.documents = documents
+        self.document_names = document_names
+
+    def __len__(self):
+        return len(self.document_names)
+
+    def __iter__(self):
+        for words, name in zip(self.documents, self.document_names):
+            yield TaggedDocument(words, [name])
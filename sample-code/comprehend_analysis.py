@@ -1,5 +1,13 @@
 import boto3
+import functools
 import os
+import re
+from collections import defaultdict
+
+from botocore.config import Config
+
+import metrics
+from response_cache import ResponseCache, get_response_cache
 
 # --- 設定 ---
 # SageMaker Notebookインスタンスから実行する場合、ロールにComprehendへのアクセス権があれば
@@ -12,27 +20,259 @@ REGION_NAME = "ap-northeast-1" # 例: 東京リージョン
 # SageMakerのノートブックから実行する際は、適宜パスを調整してください。
 FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'sample-text', 'sample.md')
 
+LANGUAGE_CODE = 'ja'
+# Comprehend の1文書あたりの上限は5000バイト。念のため少し余裕を持たせる
+MAX_CHUNK_BYTES = 4800
+# Batch API で1回のリクエストに含められる文書数の上限
+BATCH_SIZE = 25
+# 日本語の文境界（句点・感嘆符・疑問符の直後と改行）
+SENTENCE_PATTERN = re.compile(r'[^。！？!?\n]*(?:[。！？!?]+|\n+|$)')
+
 # --- 関数定義 ---
 
-def analyze_text_with_comprehend(text, region_name):
+@functools.lru_cache(maxsize=None)
+def get_comprehend_client(region_name=REGION_NAME, max_pool_connections=10, botocore_retries=True):
+    """
+    Comprehend クライアントを作成し、同じ設定なら以降は使い回す
+    （boto3 のクライアントはスレッド間で共有でき、接続もプールされる）
+    スロットリング時の再試行を呼び出し側で制御する場合は botocore_retries=False にして、
+    botocore 側では再試行しない（通信エラーも含め、rate_limit.call_with_retry で再試行する）
+    """
+    if botocore_retries:
+        config = Config(max_pool_connections=max_pool_connections)
+    else:
+        config = Config(max_pool_connections=max_pool_connections, retries={'mode': 'standard', 'total_max_attempts': 1})
+    return boto3.client("comprehend", region_name=region_name, config=config)
+
+def split_sentences(text):
+    """
+    テキストを文境界で分割する（区切り文字は直前の文に含める）
+    """
+    return [sentence for sentence in SENTENCE_PATTERN.findall(text) if sentence]
+
+def split_text_into_chunks(text, max_bytes=MAX_CHUNK_BYTES):
+    """
+    テキストを UTF-8 で max_bytes 以下のチャンクに分割する
+    できるだけ文の途中では切らず、1文だけで上限を超える場合のみ文字単位で切る
+    空白だけのチャンクは含めない
+    """
+    chunks = []
+    current = []
+    current_bytes = 0
+
+    def flush():
+        nonlocal current, current_bytes
+        chunk = ''.join(current)
+        if chunk.strip():
+            chunks.append(chunk)
+        current = []
+        current_bytes = 0
+
+    for sentence in split_sentences(text):
+        size = len(sentence.encode('utf-8'))
+        if current_bytes + size > max_bytes:
+            flush()
+        if size > max_bytes:
+            # 1文が長すぎる場合は、マルチバイト文字の途中で切らないようにバイト数で分割する
+            for piece in _split_by_bytes(sentence, max_bytes):
+                current = [piece]
+                current_bytes = len(piece.encode('utf-8'))
+                flush()
+            continue
+        current.append(sentence)
+        current_bytes += size
+    flush()
+    return chunks
+
+def _split_by_bytes(text, max_bytes):
+    encoded = text.encode('utf-8')
+    pieces = []
+    while encoded:
+        piece = encoded[:max_bytes].decode('utf-8', 'ignore')
+        pieces.append(piece)
+        encoded = encoded[len(piece.encode('utf-8')):]
+    return pieces
+
+def _response_cache_key(comprehend, operation, text, language_code):
+    return ResponseCache.make_key('comprehend', operation, text,
+                                  region=comprehend.meta.region_name, language_code=language_code)
+
+def detect_batch(comprehend, operation, texts, language_code=LANGUAGE_CODE, cache=None, invoke=None,
+                 use_cache=True):
+    """
+    Batch API（batch_detect_key_phrases など）を1回呼び出す（texts は25件以下）
+    texts と同じ順序で結果（失敗したものはエラー情報）のリストを返す
+
+    応答キャッシュ（cache 省略時は共有のキャッシュ）にあるテキストは送信せず、
+    すべてキャッシュにあれば API を呼び出さない。失敗した結果はキャッシュしない
+    use_cache=False なら応答キャッシュを読み書きせず、すべてのテキストを送信する
+    invoke が指定されていれば、API 呼び出しを invoke(呼び出し関数) で実行する（再試行の制御用）
+    """
+    if not use_cache:
+        cache = None
+    elif cache is None:
+        cache = get_response_cache()
+    results = [None] * len(texts)
+    keys = [_response_cache_key(comprehend, operation, text, language_code) for text in texts]
+    if cache is not None:
+        results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    def call():
+        with metrics.api_call('comprehend', operation):
+            return getattr(comprehend, operation)(TextList=[texts[i] for i in missing], LanguageCode=language_code)
+
+    response = invoke(call) if invoke is not None else call()
+    for item in response['ResultList']:
+        i = missing[item['Index']]
+        results[i] = {key: value for key, value in item.items() if key != 'Index'}
+        if cache is not None:
+            cache.put(keys[i], results[i])
+    for error in response['ErrorList']:
+        results[missing[error['Index']]] = {'Error': f"{error['ErrorCode']}: {error['ErrorMessage']}"}
+    return results
+
+def batch_detect(comprehend, operation, texts, language_code=LANGUAGE_CODE, cache=None, use_cache=True):
+    """
+    texts を25件ずつ Batch API で分析し、texts と同じ順序で結果のリストを返す
+    """
+    results = []
+    for start in range(0, len(texts), BATCH_SIZE):
+        results.extend(detect_batch(comprehend, operation, texts[start:start + BATCH_SIZE], language_code, cache,
+                                    use_cache=use_cache))
+    return results
+
+def merge_key_phrases(results):
+    """
+    チャンクごとのキーフレーズを統合する
+    同じフレーズは1つにまとめ、最大スコアと出現回数を持たせる（スコアの高い順）
+    """
+    merged = {}
+    for result in results:
+        for phrase in result.get('KeyPhrases', []):
+            text = phrase['Text'].strip()
+            entry = merged.setdefault(text, {'Text': text, 'Score': 0.0, 'Count': 0})
+            entry['Score'] = max(entry['Score'], phrase['Score'])
+            entry['Count'] += 1
+    return sorted(merged.values(), key=lambda entry: (-entry['Score'], entry['Text']))
+
+def merge_entities(results):
+    """
+    チャンクごとのエンティティを統合する
+    同じテキスト・タイプのエンティティは1つにまとめ、最大スコアと出現回数を持たせる
+    """
+    merged = {}
+    for result in results:
+        for entity in result.get('Entities', []):
+            text = entity['Text'].strip()
+            entry = merged.setdefault((text, entity['Type']),
+                                      {'Text': text, 'Type': entity['Type'], 'Score': 0.0, 'Count': 0})
+            entry['Score'] = max(entry['Score'], entity['Score'])
+            entry['Count'] += 1
+    return sorted(merged.values(), key=lambda entry: (-entry['Score'], entry['Text']))
+
+def merge_sentiments(results, chunks):
+    """
+    チャンクごとの感情スコアをチャンクの文字数で重み付けして平均する
+    全体の感情は平均スコアが最も高いもの
+    """
+    totals = defaultdict(float)
+    total_weight = 0
+    for result, chunk in zip(results, chunks):
+        if 'SentimentScore' not in result:
+            continue
+        weight = len(chunk)
+        for sentiment, score in result['SentimentScore'].items():
+            totals[sentiment] += score * weight
+        total_weight += weight
+
+    if not total_weight:
+        return None
+    scores = {sentiment: total / total_weight for sentiment, total in totals.items()}
+    return {'Sentiment': max(scores, key=scores.get).upper(), 'SentimentScore': scores}
+
+DETECT_OPERATIONS = {
+    'key_phrases': 'batch_detect_key_phrases',
+    'entities': 'batch_detect_entities',
+    'sentiment': 'batch_detect_sentiment',
+}
+
+def chunk_documents(documents):
+    """
+    {文書名: テキスト} の各文書をチャンクに分割し、(チャンクの所属文書名のリスト, チャンクのリスト) を返す
+    """
+    chunk_owners = []
+    chunks = []
+    for name, text in documents.items():
+        for chunk in split_text_into_chunks(text):
+            chunk_owners.append(name)
+            chunks.append(chunk)
+    return chunk_owners, chunks
+
+def merge_document_results(document_names, chunk_owners, chunks, results):
+    """
+    チャンク単位の結果（{'key_phrases': [...], 'entities': [...], 'sentiment': [...]}）を文書ごとに統合する
+    戻り値は {文書名: {'key_phrases', 'entities', 'sentiment', 'chunks', 'errors'}}
+    """
+    per_document = {name: {'chunks': [], 'key_phrases': [], 'entities': [], 'sentiment': []}
+                    for name in document_names}
+    for i, name in enumerate(chunk_owners):
+        entry = per_document[name]
+        entry['chunks'].append(chunks[i])
+        for key in DETECT_OPERATIONS:
+            entry[key].append(results[key][i])
+
+    analyses = {}
+    for name, entry in per_document.items():
+        all_results = entry['key_phrases'] + entry['entities'] + entry['sentiment']
+        analyses[name] = {
+            'key_phrases': merge_key_phrases(entry['key_phrases']),
+            'entities': merge_entities(entry['entities']),
+            'sentiment': merge_sentiments(entry['sentiment'], entry['chunks']),
+            'chunks': len(entry['chunks']),
+            'errors': [result['Error'] for result in all_results if 'Error' in result],
+        }
+    return analyses
+
+def analyze_documents_with_comprehend(documents, comprehend, use_cache=True):
+    """
+    複数の文書（{文書名: テキスト}）を Comprehend で分析する
+    各文書を文境界でチャンクに分割し、全文書のチャンクを Batch API で25件ずつまとめて送信する
+    戻り値は {文書名: {'key_phrases', 'entities', 'sentiment', 'chunks', 'errors'}}
+    """
+    chunk_owners, chunks = chunk_documents(documents)
+    results = {key: batch_detect(comprehend, operation, chunks, use_cache=use_cache)
+               for key, operation in DETECT_OPERATIONS.items()}
+    return merge_document_results(documents, chunk_owners, chunks, results)
+
+def analyze_text_with_comprehend(text, region_name, comprehend=None, use_cache=True):
     """
     Amazon Comprehend を使ってテキスト分析を実行する関数。
     - キーフレーズの検出
     - エンティティの検出
     - 感情の分析
+    長いテキストは文境界で分割して全文を分析し、結果を統合して表示する
+    use_cache=False なら応答キャッシュを使わずに毎回 API を呼び出す
     """
     try:
-        # Comprehend クライアントの作成
-        comprehend = boto3.client("comprehend", region_name=region_name)
-        language_code = 'ja'
+        # Comprehend クライアント（同じリージョンなら使い回す）
+        if comprehend is None:
+            comprehend = get_comprehend_client(region_name)
+
+        analysis = analyze_documents_with_comprehend({'text': text}, comprehend, use_cache)['text']
+        print(f"分析したチャンク数: {analysis['chunks']}")
+        for error in analysis['errors']:
+            print(f"警告: 一部のチャンクの分析に失敗しました: {error}")
+        print()
 
         # --- 1. キーフレーズ分析 ---
         print("--- 1. Amazon Comprehendによるキーフレーズ分析 ---")
-        key_phrases_response = comprehend.detect_key_phrases(Text=text, LanguageCode=language_code)
         print("検出されたキーフレーズ:")
-        if key_phrases_response['KeyPhrases']:
-            for phrase in key_phrases_response['KeyPhrases']:
-                print(f"- {phrase['Text']} (スコア: {phrase['Score']:.4f})")
+        if analysis['key_phrases']:
+            for phrase in analysis['key_phrases']:
+                print(f"- {phrase['Text']} (スコア: {phrase['Score']:.4f}, 出現回数: {phrase['Count']})")
         else:
             print("キーフレーズは見つかりませんでした。")
         
@@ -40,11 +280,11 @@ def analyze_text_with_comprehend(text, region_name):
 
         # --- 2. エンティティ検出 ---
         print("--- 2. Amazon Comprehendによるエンティティ検出 ---")
-        entities_response = comprehend.detect_entities(Text=text, LanguageCode=language_code)
         print("検出されたエンティティ:")
-        if entities_response['Entities']:
-            for entity in entities_response['Entities']:
-                print(f"- {entity['Text']} (タイプ: {entity['Type']}, スコア: {entity['Score']:.4f})")
+        if analysis['entities']:
+            for entity in analysis['entities']:
+                print(f"- {entity['Text']} (タイプ: {entity['Type']}, スコア: {entity['Score']:.4f}, "
+                      f"出現回数: {entity['Count']})")
         else:
             print("エンティティは見つかりませんでした。")
 
@@ -52,11 +292,16 @@ def analyze_text_with_comprehend(text, region_name):
 
         # --- 3. 感情分析 ---
         print("--- 3. Amazon Comprehendによる感情分析 ---")
-        sentiment_response = comprehend.detect_sentiment(Text=text, LanguageCode=language_code)
-        print(f"全体の感情: {sentiment_response['Sentiment']}")
-        print("感情スコア:")
-        for sentiment, score in sentiment_response['SentimentScore'].items():
-            print(f"- {sentiment}: {score:.4f}")
+        sentiment = analysis['sentiment']
+        if sentiment is None:
+            print("感情を分析できませんでした。")
+        else:
+            print(f"全体の感情: {sentiment['Sentiment']}")
+            print("感情スコア（チャンクの文字数で重み付けした平均）:")
+            for label, score in sentiment['SentimentScore'].items():
+                print(f"- {label}: {score:.4f}")
+
+        return analysis
 
     except Exception as e:
         print(f"エラーが発生しました: {e}")
@@ -69,20 +314,10 @@ if __name__ == '__main__':
         # ノートブック環境で実行しやすいように、絶対パスで指定しています。
         # 必要に応じてパスを調整してください。
         absolute_file_path = "/workspaces/esio/amazon-comprehend/sample-text/sample.md"
-        with open(absolute_file_path, 'r', encoding='utf-8') as f:
+        with metrics.timer('file_read'), open(absolute_file_path, 'r', encoding='utf-8') as f:
             sample_text = f.read()
-        
-        # テキストが5000バイトを超えている場合は分割する必要があるが、今回はサンプルなので全体を一度に処理
-        if len(sample_text.encode('utf-8')) > 4800: # 念のため少し余裕を持たせる
-            print("警告: テキストサイズが大きいため、一部を切り詰めて分析します。")
-            # UTF-8でエンコードしてからバイト数を基準に切り詰める
-            encoded_text = sample_text.encode('utf-8')
-            truncated_encoded_text = encoded_text[:4800]
-            # 不完全なマルチバイト文字で終わらないようにデコード・再エンコード
-            sample_text = truncated_encoded_text.decode('utf-8', 'ignore')
-
 
-        # Comprehendで分析を実行
+        # Comprehendで分析を実行（5000バイトを超える場合は文境界で分割して全文を分析）
         analyze_text_with_comprehend(sample_text, REGION_NAME)
 
     except FileNotFoundError:
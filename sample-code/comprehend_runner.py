@@ -0,0 +1,140 @@
+"""
+大量の文書を Amazon Comprehend で並行して分析するランナー
+共有のクライアントで複数のリクエストを同時に送り、トークンバケットで
+アカウントの TPS 上限に合わせて流量を抑え、スロットリング時はジッター付きで再試行します
+
+使い方:
+    python comprehend_runner.py ../sample-text --concurrency 10 --tps 10 --output comprehend_result.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from comprehend_analysis import (BATCH_SIZE, DETECT_OPERATIONS, REGION_NAME, chunk_documents, detect_batch,
+                                 get_comprehend_client, merge_document_results)
+from rate_limit import MAX_ATTEMPTS, TokenBucket, call_with_retry
+from response_cache import get_response_cache
+
+# --- 設定 ---
+MAX_CONCURRENCY = 10      # 同時に送るリクエスト数
+REQUESTS_PER_SECOND = 10  # アカウントの TPS 上限に合わせる
+DOCUMENT_WINDOW = 100     # 一度に読み込んで分析する文書数（メモリ使用量の上限）
+
+
+class ComprehendCorpusRunner:
+    """
+    文書集合を並行して Comprehend で分析する
+
+    各文書をチャンクに分割し、複数文書のチャンクを25件ずつの Batch API リクエストにまとめる
+    キーフレーズ・エンティティ・感情の3種類のリクエストも含め、すべてを1つのスレッドプールで
+    同時に max_concurrency 件まで、トークンバケットで毎秒 requests_per_second 件まで送信する
+    use_cache=False なら応答キャッシュを使わない
+    """
+
+    def __init__(self, comprehend=None, region_name=REGION_NAME, max_concurrency=MAX_CONCURRENCY,
+                 requests_per_second=REQUESTS_PER_SECOND, max_attempts=MAX_ATTEMPTS,
+                 document_window=DOCUMENT_WINDOW, use_cache=True):
+        # 再試行は call_with_retry で流量制限と合わせて行うため、botocore 側の再試行は止める
+        self.comprehend = comprehend or get_comprehend_client(region_name, max_pool_connections=max_concurrency,
+                                                              botocore_retries=False)
+        self.max_concurrency = max_concurrency
+        self.limiter = TokenBucket(requests_per_second)
+        self.max_attempts = max_attempts
+        self.document_window = document_window
+        self.use_cache = use_cache
+
+    def _invoke(self, call):
+        return call_with_retry(call, self.limiter, self.max_attempts, service='comprehend')
+
+    def _detect(self, operation, texts):
+        # キャッシュにあるテキストは送信しないため、流量制限と再試行は API 呼び出しだけにかける
+        return detect_batch(self.comprehend, operation, texts, invoke=self._invoke, use_cache=self.use_cache)
+
+    def analyze_documents(self, documents):
+        """
+        {文書名: テキスト} を分析し、{文書名: 分析結果} を返す
+        """
+        return dict(self.iter_analyze(documents.items()))
+
+    def iter_analyze(self, items):
+        """
+        (文書名, テキスト) のイテラブルを document_window 件ずつ分析し、(文書名, 分析結果) を順に返す
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            window = {}
+            for name, text in items:
+                window[name] = text
+                if len(window) >= self.document_window:
+                    yield from self._analyze_window(executor, window)
+                    window = {}
+            if window:
+                yield from self._analyze_window(executor, window)
+
+    def _analyze_window(self, executor, documents):
+        chunk_owners, chunks = chunk_documents(documents)
+        futures = {
+            key: [executor.submit(self._detect, operation, chunks[start:start + BATCH_SIZE])
+                  for start in range(0, len(chunks), BATCH_SIZE)]
+            for key, operation in DETECT_OPERATIONS.items()
+        }
+        results = {}
+        for key, batch_futures in futures.items():
+            results[key] = []
+            for future in batch_futures:
+                results[key].extend(future.result())
+        yield from merge_document_results(documents, chunk_owners, chunks, results).items()
+
+    def analyze_directory(self, directory, pattern='*.md'):
+        """
+        ディレクトリ内のファイルを分析し、{ファイルパス: 分析結果} を返す
+        ファイルは document_window 件ずつ読み込む
+        """
+        paths = sorted(glob.glob(os.path.join(directory, pattern)))
+        return dict(self.iter_analyze((path, _read_text(path)) for path in paths))
+
+
+def _read_text(path):
+    with metrics.timer('file_read'), open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ディレクトリ内の文書を Amazon Comprehend で並行して分析する")
+    parser.add_argument('directory', help="分析対象のディレクトリ")
+    parser.add_argument('--pattern', default='*.md', help="対象ファイルのパターン")
+    parser.add_argument('--region', default=REGION_NAME)
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help="同時に送るリクエスト数")
+    parser.add_argument('--tps', type=float, default=REQUESTS_PER_SECOND, help="1秒あたりの最大リクエスト数")
+    parser.add_argument('--output', default='comprehend_result.json', help="結果を保存する JSON ファイル")
+    parser.add_argument('--no-cache', action='store_true', help="応答キャッシュを使わずに毎回 API を呼び出す")
+    args = parser.parse_args()
+
+    runner = ComprehendCorpusRunner(region_name=args.region, max_concurrency=args.concurrency,
+                                    requests_per_second=args.tps, use_cache=not args.no_cache)
+    start_time = time.time()
+    analyses = runner.analyze_directory(args.directory, args.pattern)
+
+    for path, analysis in analyses.items():
+        sentiment = analysis['sentiment']['Sentiment'] if analysis['sentiment'] else '-'
+        print(f"{os.path.basename(path)}: チャンク数 {analysis['chunks']}, "
+              f"キーフレーズ {len(analysis['key_phrases'])}件, エンティティ {len(analysis['entities'])}件, "
+              f"感情 {sentiment}")
+        for error in analysis['errors']:
+            print(f"  警告: {error}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(analyses, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ {len(analyses)}文書の結果を {args.output} に保存しました（所要時間: {time.time() - start_time:.2f}秒）")
+    cache = get_response_cache() if runner.use_cache else None
+    if cache is not None:
+        stats = cache.stats()
+        print(f"♻️ 応答キャッシュ: ヒット {stats['hits']}件, ミス {stats['misses']}件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+形態素解析済みの文書をディスク上のテキストファイルに保持するコーパス
+1行1文書・単語は半角スペース区切り（gensim の LineSentence と同じ形式）で保存し、
+学習のエポックごとにファイルを先頭から読み直すため、メモリに載らない規模の文書も扱えます
+置換・削除した文書の古い行はファイルに残し、走査の前にまとめて書き直します
+"""
+
+import os
+import re
+from array import array
+
+from compact_corpus import TaggedDocumentStream
+
+LINE_OFFSET_TYPECODE = 'Q'  # 各行の開始位置（バイト）
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class TokenFileCorpus:
+    """
+    1行1文書のテキストファイルとして文書を保持するコーパス
+    list と同じように添字アクセス・追加・置換・削除ができる
+    置換した文書は末尾に新しい行として書き足し、_offsets で文書番号から有効な行を引く
+    古い行は不要行として残り、走査や corpus_file として使う前に compact() で取り除く
+    """
+
+    def __init__(self, path, offsets=None):
+        self.path = path
+        self._offsets = offsets if offsets is not None else array(LINE_OFFSET_TYPECODE)
+        self._size = 0 if offsets is None else os.path.getsize(path)
+        self._writer = None
+        self._stale_lines = 0  # 置換・削除で不要になった行の数
+        if offsets is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # 新しいコーパスとして空のファイルを作る
+            open(path, 'wb').close()
+
+    @classmethod
+    def open(cls, path):
+        """
+        既存のファイルを開き、各行の開始位置を索引する
+        （不要行を含まない、compact() 済みまたは追加のみで書いたファイルを想定する）
+        """
+        offsets = array(LINE_OFFSET_TYPECODE)
+        position = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                offsets.append(position)
+                position += len(line)
+        return cls(path, offsets)
+
+    @staticmethod
+    def _format_line(words):
+        for word in words:
+            # 空の単語や空白を含む単語は区切りと区別できず、読み直すと別の単語列になる
+            if not word or WHITESPACE_PATTERN.search(word):
+                raise ValueError(f"空白を含む単語や空の単語は保存できません: {word!r}")
+        return ' '.join(words) + '\n'
+
+    def _write_line(self, words):
+        """
+        ファイルの末尾に1行書き足し、その行の開始位置を返す
+        """
+        data = self._format_line(words).encode('utf-8')
+        if self._writer is None:
+            self._writer = open(self.path, 'ab')
+        position = self._size
+        self._writer.write(data)
+        self._size += len(data)
+        return position
+
+    def append(self, words):
+        self._offsets.append(self._write_line(words))
+
+    def __setitem__(self, i, words):
+        self._offsets[i]  # 範囲外なら行を書き足す前に IndexError にする
+        position = self._write_line(words)
+        self._offsets[i] = position
+        self._stale_lines += 1
+
+    def __delitem__(self, i):
+        del self._offsets[i]
+        self._stale_lines += 1
+
+    def compact(self):
+        """
+        不要行を取り除き、文書の順にファイルを書き直す（不要行がなければ何もしない）
+        書き直した後は行番号と文書番号が一致する
+        """
+        self.flush()
+        if not self._stale_lines:
+            return
+        self.close()
+        offsets = array(LINE_OFFSET_TYPECODE)
+        position = 0
+        tmp_path = f"{self.path}.tmp"
+        with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for offset in self._offsets:
+                src.seek(offset)
+                line = src.readline()
+                offsets.append(position)
+                dst.write(line)
+                position += len(line)
+        os.replace(tmp_path, self.path)
+        self._offsets = offsets
+        self._size = position
+        self._stale_lines = 0
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_writer'] = None
+        return state
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        self.compact()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line.split()
+
+    def __getitem__(self, i):
+        self.flush()
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[i])
+            return f.readline().decode('utf-8').split()
+
+    def tagged_documents(self, document_names):
+        """
+        gensim に渡すための TaggedDocument の再走査可能なイテラブル
+        走査のたびにファイルを先頭から読み直す
+        """
+        return TaggedDocumentStream(self, document_names)
@@ -1,165 +1,630 @@
 import os
 import glob
-import MeCab
-from gensim.models.doc2vec import Doc2Vec, TaggedDocument
+from gensim.models.doc2vec import Doc2Vec
 import numpy as np
-import re
 import time
 from collections import Counter
+import hashlib
 import json
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from ann_index import DEFAULT_N_PROBE, IVFIndex
+from compact_corpus import CompactCorpus, TaggedDocumentStream
+from disk_corpus import TokenFileCorpus
+from mecab_tokenizer import create_doc2vec_tokenizer, iter_text_chunks
+from similarity_search import SIMILARITY_MEMORY_BUDGET, all_pairs_similarity, normalize_rows, search_top_k
+from term_index import TermFrequencyIndex
+from vector_clustering import cluster_vectors
+from token_cache import TokenCache, hash_file, hash_text
 
 # --- 設定 ---
 MECAB_ARGS = ""
 SAMPLE_DIR_PATH = "sample-text/"
 
 # ハンズオン向け設定
-MAX_FILES = 5  # 適度なファイル数
-MAX_TEXT_LENGTH = 3000  # 十分な分析データ
+MAX_FILES = None  # 対象ファイル数の上限（None で全ファイル）
+MAX_TEXT_LENGTH = None  # 1文書あたりの文字数の上限（None で打ち切りなし）
 EPOCHS = 15  # バランスの取れたエポック数
 MIN_COUNT = 2
 VECTOR_SIZE = 100
+PREPROCESS_WORKERS = os.cpu_count() or 1  # 前処理（形態素解析）の並列プロセス数
+USE_TOKEN_CACHE = True  # 形態素解析結果をディスクにキャッシュして再実行時に再利用する
+# 形態素解析済みの文書をメモリではなくファイルに保持し、学習のエポックごとに読み直す
+USE_DISK_CORPUS = True
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'doc2vec_corpus.txt')
+# gensim の corpus_file モード（1行1文書のファイルを各スレッドが分担して読む）で学習する
+# イテラブルを渡す方式と違い、Python の読み込みスレッドが律速にならず全コアを使える
+USE_CORPUS_FILE = True
+TRAINING_WORKERS = os.cpu_count() or 1  # corpus_file モードでの学習スレッド数
+ITERABLE_TRAINING_WORKERS = min(4, TRAINING_WORKERS)  # イテラブル方式では4程度で頭打ちになる
+
+# エポックごとのチェックポイントと早期終了
+TRAINING_CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'doc2vec_checkpoint')
+USE_TRAINING_CHECKPOINT = True  # 学習が中断しても、同じ条件で再実行すれば続きのエポックから再開する
+EARLY_STOPPING = False  # 評価値が改善しなくなったら EPOCHS に達する前に学習を打ち切る
+EARLY_STOPPING_PATIENCE = 3  # 評価値が何エポック改善しなければ打ち切るか
+EARLY_STOPPING_MIN_DELTA = 0.01  # これ未満の向上は改善とみなさない
+SELF_SIMILARITY_SAMPLE_SIZE = 50  # 評価に使う学習文書の数
+CHECKPOINT_STATE_FILE = 'state.json'
+CHECKPOINT_BEST_WEIGHTS_FILE = 'best_weights.npz'
+SIMILAR_DOCUMENTS_TOP_K = 5  # 文書ごとに求める類似文書の件数
+SIMILAR_PAIRS_TOP_N = 10  # 表示する類似度の高い文書ペアの件数
+WORD_CLUSTER_MIN_SIMILARITY = 0.3  # 所属クラスタの重心との類似度がこれ未満の単語はどのクラスタにも入れない
+
+# 学習済みモデルの保存先
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'doc2vec')
+USE_SAVED_MODEL = True  # 前処理設定・学習設定・対象文書が同じなら保存済みモデルを使い学習を省略する
+MODEL_FILE = 'doc2vec.model'
+MODEL_METADATA_FILE = 'metadata.json'
+MODEL_TERM_INDEX_FILE = 'term_index.json'
+MODEL_ANN_INDEX_DIR = 'ann_index'
+
+# 新しい文書の推論（infer_vector）の設定
+INFER_WORKERS = os.cpu_count() or 1
+INFER_BATCH_SIZE = 64  # ワーカーに1回で渡す文書数
+INFER_SEED = 42  # 同じ文書・同じモデルなら常に同じベクトルになるよう、文書ごとにこの値から乱数を初期化する
+INFER_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'infer_vectors.sqlite3')
 
 class Doc2VecAnalyzer:
-    def __init__(self):
+    def __init__(self, corpus_path=None):
         self.model = None
-        self.documents = []
+        # corpus_path を指定した場合は文書を1行1文書のファイルに保持する
+        # それ以外は共有語彙の単語ID配列としてメモリに保持し、取り出すと単語リストに戻る
+        self.documents = TokenFileCorpus(corpus_path) if corpus_path else CompactCorpus()
         self.document_names = []
         self.word_stats = {}
+        # Tagger は文書ごとではなくアナライザごとに1度だけ生成する
+        self.tokenizer = create_doc2vec_tokenizer(MECAB_ARGS)
+        self.token_cache = TokenCache() if USE_TOKEN_CACHE else None
+        # コーパス全体の単語頻度は差分更新のインデックスで管理する
+        self.term_index = TermFrequencyIndex()
+        # 類似文書検索用の近似最近傍インデックス（build_ann_index で作成）
+        self.ann_index = None
+        # 学習ごとに振る識別子（推論結果のキャッシュキーに使う）と保存先
+        self.model_id = None
+        self.model_path = None
+        # エポックごとの学習時間・評価値
+        self.training_history = []
+        # 早期終了の評価値が最も高かったエポックの重み（{'epoch', 'score', 'arrays'}）
+        self.best_weights = None
+        self.infer_cache = TokenCache(INFER_CACHE_PATH) if USE_TOKEN_CACHE else None
+        # similar_words 用の正規化した単語ベクトル行列と、それを作ったモデル
+        self._normed_word_vectors_cache = None
+        self._normed_word_vectors_model = None
         
     def preprocess_text(self, text, doc_name):
         """
         高品質な前処理：統計情報も収集
         """
-        if len(text) > MAX_TEXT_LENGTH:
+        return self._record_word_stats(doc_name, self.tokenize_text(text, doc_name))
+
+    def tokenize_text(self, text, doc_name=None):
+        """
+        preprocess_text と同じ打ち切り・フィルタリングで単語リストと品詞統計を返す
+        （文書統計には記録しない）
+        """
+        if MAX_TEXT_LENGTH and len(text) > MAX_TEXT_LENGTH:
+            if doc_name is not None:
+                print(f"  注意: {os.path.basename(doc_name)} を先頭{MAX_TEXT_LENGTH}文字で打ち切ります")
             text = text[:MAX_TEXT_LENGTH]
         
-        tagger = MeCab.Tagger(MECAB_ARGS)
-        tagger.parse('')
-        node = tagger.parseToNode(text)
-        
+        with metrics.timer('preprocess'):
+            return self._tokenize_with_cache(hash_text(text), lambda: self._tokenize_chunks([text]))
+
+    def preprocess_file(self, path):
+        """
+        ファイルを全文読み込まず、文境界のチャンク単位で前処理する
+        MAX_TEXT_LENGTH が設定されている場合はその文字数で打ち切る
+        """
+        with metrics.timer('preprocess'):
+            result = self._tokenize_with_cache(
+                hash_file(path),
+                lambda: self._tokenize_chunks(self._iter_limited_chunks(path))
+            )
+        return self._record_word_stats(path, result)
+
+    def _iter_limited_chunks(self, path):
+        remaining = MAX_TEXT_LENGTH
+        for chunk in iter_text_chunks(path=path):
+            if remaining is not None:
+                if remaining <= 0:
+                    print(f"  注意: {os.path.basename(path)} を先頭{MAX_TEXT_LENGTH}文字で打ち切ります")
+                    return
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+            yield chunk
+
+    def _tokenize_chunks(self, chunks):
         words = []
         pos_stats = Counter()
-        
-        # 拡張されたstop wordsリスト
-        stop_words = {
-            # 基本的な機能語
-            'こと', 'もの', 'ため', 'これ', 'それ', 'あれ', 'どれ', 'よう', 'さん', 'ところ',
-            'とき', 'とこ', 'など', 'なに', 'なん', 'どこ', 'いつ', 'だれ', 'どう', 'なぜ',
-            
-            # 代名詞・指示語
-            '私', '僕', '俺', '君', '彼', '彼女', 'あなた', 'みなさん', 'みんな',
-            'ここ', 'そこ', 'あそこ', 'どこか', 'いま', 'いつか', 'どこでも',
-            
-            # 助詞的な名詞
-            '上', '下', '中', '前', '後', '左', '右', '横', '隣', '間', '内', '外',
-            '先', '奥', '手前', '向こう', '以上', '以下', '未満', '程度', '以外',
-            
-            # 時間・頻度表現
-            '今日', '昨日', '明日', '今年', '去年', '来年', '今月', '先月', '来月',
-            '毎日', '毎回', '毎年', '毎月', '毎週', '常に', 'いつも', 'たまに',
-            
-            # 数量・程度表現
-            '全て', '全部', 'すべて', '一部', '半分', '大部分', '少し', 'ちょっと',
-            'かなり', 'とても', 'すごく', 'めちゃくちゃ', '非常', '極めて',
-            
-            # 接続・転換表現
-            'しかし', 'でも', 'だが', 'ただし', 'ところが', 'けれど', 'けれども',
-            'そして', 'また', 'さらに', 'それから', 'それで', 'そこで', 'つまり',
-            
-            # 感嘆・応答表現
-            'はい', 'いいえ', 'ええ', 'うん', 'そう', 'そうです', 'なるほど',
-            'おお', 'ああ', 'うーん', 'えー', 'まあ', 'やはり', 'やっぱり',
-            
-            # 一般的すぎる動詞・形容詞の語幹
-            'する', 'なる', 'ある', 'いる', 'できる', 'みる', 'いく', 'くる',
-            'いい', 'よい', '悪い', '大きい', '小さい', '新しい', '古い',
-            
-            # ビジネス・技術文書でよく出る一般語
-            '場合', '状況', '状態', '方法', '手段', '方式', '形式', '種類', '方向',
-            '結果', '効果', '影響', '関係', '関連', '対象', '目的', '理由', '原因',
-            '問題', '課題', '解決', '改善', '向上', '発展', '進歩', '変化', '変更',
-            
-            # 単位・助数詞的表現
-            '個', '本', '枚', '台', '人', '回', '度', '倍', '割', 'パーセント',
-            '時間', '分', '秒', '日', '週間', 'ヶ月', '年間', 'メートル', 'キロ'
-        }
+        for chunk in chunks:
+            words.extend(self.tokenizer.tokenize(chunk, pos_stats=pos_stats))
+        return {'words': words, 'pos_stats': dict(pos_stats)}
 
-        while node:
-            if not node.surface:
-                node = node.next
-                continue
-
-            features = node.feature.split(',')
-            if len(features) < 7:
-                node = node.next
-                continue
-
-            pos = features[0]
-            pos_detail1 = features[1]
-            original_form = features[6]
-            surface_form = node.surface
-
-            # 統計収集
-            pos_stats[pos] += 1
-
-            # 高品質な品詞選択
-            target_pos = ['名詞', '動詞', '形容詞']
-            if pos in target_pos:
-                word_to_check = original_form if pos in ['動詞', '形容詞'] else surface_form
-                
-                # 高品質フィルタリング
-                if (word_to_check != '*' and 
-                    word_to_check not in stop_words and 
-                    len(word_to_check) > 1 and
-                    not re.match(r'^[0-9]+$', word_to_check) and  # 数字のみ除外
-                    pos != '名詞' or pos_detail1 not in ['数', '非自立', '代名詞']):
-                    words.append(word_to_check)
-
-            node = node.next
-        
+    def _tokenize_with_cache(self, content_hash, tokenize):
+        """
+        内容ハッシュ・辞書・フィルタ設定が同じ文書はキャッシュ済みの結果を使う
+        """
+        if self.token_cache is None:
+            return tokenize()
+        key = self.token_cache.make_key(content_hash, self.tokenizer,
+                                        extra=f"max_text_length={MAX_TEXT_LENGTH}")
+        return self.token_cache.get_or_compute(key, tokenize)
+
+    def _record_word_stats(self, doc_name, result):
+        words = result['words']
         # 文書統計を保存
         self.word_stats[doc_name] = {
             'total_words': len(words),
             'unique_words': len(set(words)),
-            'pos_distribution': dict(pos_stats.most_common(5))
+            'pos_distribution': dict(Counter(result['pos_stats']).most_common(5))
         }
-        
         return words
 
-    def train_model(self, documents, document_names):
+    def preprocess_files(self, file_paths, workers=PREPROCESS_WORKERS):
         """
-        Doc2Vecモデルの学習
+        複数ファイルをプロセスプールで並列に前処理する
+        結果は file_paths の順序のままこのアナライザの文書として追加し、
+        word_stats も統合する。追加された文書名のリストを返す
         """
-        print("=== Doc2Vec モデル学習フェーズ ===")
-        
-        tagged_documents = [
-            TaggedDocument(doc, [name]) 
-            for doc, name in zip(documents, document_names)
-        ]
-        
-        self.model = Doc2Vec(
+        if workers <= 1 or len(file_paths) <= 1:
+            results = (_preprocess_file_with(self, path) for path in file_paths)
+            return self._collect_preprocess_results(results, len(file_paths))
+
+        workers = min(workers, len(file_paths))
+        chunksize = max(1, len(file_paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_preprocess_worker,
+                                 initargs=(self.tokenizer, self.token_cache)) as executor:
+            results = executor.map(_preprocess_file, file_paths, chunksize=chunksize)
+            return self._collect_preprocess_results(results, len(file_paths))
+
+    def _collect_preprocess_results(self, results, total):
+        document_names = []
+
+        for i, (path, words, stats, worker_metrics) in enumerate(results):
+            if worker_metrics:
+                # ワーカープロセスで記録した計測値を親プロセスに集約する
+                metrics.REGISTRY.merge(worker_metrics)
+            print(f"処理中: {os.path.basename(path)} ({i+1}/{total})")
+            self.word_stats[path] = stats
+            if words:
+                self.add_document(words, path)
+                document_names.append(path)
+                print(f"  抽出単語数: {len(words)}")
+
+        return document_names
+
+    def add_document(self, words, doc_name):
+        """
+        文書を追加する（同名の文書があれば置き換える）
+        単語頻度インデックスもこの文書の分だけ更新する
+        """
+        if doc_name in self.document_names:
+            i = self.document_names.index(doc_name)
+            self.documents[i] = words
+        else:
+            i = len(self.documents)
+            self.documents.append(words)
+            self.document_names.append(doc_name)
+        self.term_index.add_document(doc_name, self._document_term_counts(i, words))
+
+    def _document_term_counts(self, i, words=None):
+        if isinstance(self.documents, CompactCorpus):
+            return self.documents.document_term_counts(i)
+        return Counter(self.documents[i] if words is None else words)
+
+    def remove_document(self, doc_name):
+        """
+        文書を削除する
+        """
+        i = self.document_names.index(doc_name)
+        del self.documents[i]
+        del self.document_names[i]
+        self.word_stats.pop(doc_name, None)
+        self.term_index.remove_document(doc_name)
+
+    def sync_term_index(self):
+        """
+        documents / document_names を直接書き換えた場合に、
+        インデックスに未登録・登録済みで消えた文書の分だけを反映する
+        """
+        current = set(self.document_names)
+        for doc_name in [name for name in self.term_index.doc_terms if name not in current]:
+            self.term_index.remove_document(doc_name)
+        for i, doc_name in enumerate(self.document_names):
+            if doc_name not in self.term_index:
+                self.term_index.add_document(doc_name, self._document_term_counts(i))
+        return self.term_index
+
+    def most_common_words(self, n):
+        """
+        コーパス全体の頻出単語の上位n件
+        """
+        return self.sync_term_index().most_common(n)
+
+    def create_model(self, workers=ITERABLE_TRAINING_WORKERS):
+        """
+        学習前の Doc2Vec モデルを設定値から生成する
+        """
+        return Doc2Vec(
             vector_size=VECTOR_SIZE,
             min_count=MIN_COUNT,
             epochs=EPOCHS,
-            workers=min(4, os.cpu_count()),
+            workers=workers,
             dm=1,  # PV-DM (分散メモリ)
             window=5,
             alpha=0.025,
             min_alpha=0.00025
         )
+
+    def train_model(self, documents, document_names, use_corpus_file=USE_CORPUS_FILE, workers=None,
+                    checkpoint_dir=None, early_stopping=EARLY_STOPPING):
+        """
+        Doc2Vecモデルの学習
+        use_corpus_file=True なら文書を1行1文書のファイルにして corpus_file モードで学習する
+
+        1エポックずつ学習し、所要時間（と早期終了の評価値）を self.training_history に記録する
+        checkpoint_dir を指定するとエポックごとに途中経過を保存し、同じ文書・設定で
+        再実行すると続きのエポックから再開する（学習が完了したら削除する）
+        early_stopping=True なら、学習文書を再推論したときに自分自身が最も類似する文書になる
+        割合を評価値とし、EARLY_STOPPING_PATIENCE エポック改善しなければ打ち切る
+        学習の最後には評価値が最も高かったエポックの重みに戻す
+        """
+        print("=== Doc2Vec モデル学習フェーズ ===")
         
-        start_time = time.time()
-        self.model.build_vocab(tagged_documents)
+        if workers is None:
+            workers = TRAINING_WORKERS if use_corpus_file else ITERABLE_TRAINING_WORKERS
+        if use_corpus_file:
+            corpus_file = self.export_corpus_file(documents)
+        else:
+            # 文書を1件ずつ TaggedDocument に変換して渡し、全件分のリストは作らない
+            tagged_documents = TaggedDocumentStream(documents, document_names)
         
-        print(f"学習開始: {len(documents)}文書, 語彙数: {len(self.model.wv.key_to_index)}")
-        self.model.train(tagged_documents, total_examples=self.model.corpus_count, epochs=self.model.epochs)
+        start_time = time.time()
+        checkpoint_key = None
+        if checkpoint_dir:
+            corpus_hash = hash_file(corpus_file) if use_corpus_file else corpus_content_hash(documents)
+            checkpoint_key = self._checkpoint_key(document_names, use_corpus_file, corpus_hash)
+        if checkpoint_dir and self._load_checkpoint(checkpoint_dir, checkpoint_key):
+            self.model.workers = workers
+            print(f"チェックポイントから再開します: {len(self.training_history)}エポック学習済み")
+        else:
+            self.model = self.create_model(workers=workers)
+            self.model_id = uuid.uuid4().hex
+            self.training_history = []
+            self.best_weights = None
+            with metrics.timer('vocab_build'):
+                if use_corpus_file:
+                    self.model.build_vocab(corpus_file=corpus_file)
+                else:
+                    self.model.build_vocab(tagged_documents)
+        self.model_path = None
+        
+        if use_corpus_file:
+            corpus_args = {'corpus_file': corpus_file, 'total_words': self.model.corpus_total_words}
+        else:
+            corpus_args = {'corpus_iterable': tagged_documents}
+        evaluation_sample = self._self_similarity_sample(documents) if early_stopping else None
+        
+        print(f"学習開始: {len(documents)}文書, 語彙数: {len(self.model.wv.key_to_index)}, スレッド数: {workers}")
+        with metrics.timer('training'):
+            for epoch in range(len(self.training_history), self.model.epochs):
+                if early_stopping and self._should_stop_early():
+                    print(f"評価値が{EARLY_STOPPING_PATIENCE}エポック改善しないため学習を打ち切ります")
+                    break
+                self._train_epoch(epoch, corpus_args, evaluation_sample)
+                if early_stopping:
+                    self._update_best_weights()
+                if checkpoint_dir:
+                    self._save_checkpoint(checkpoint_dir, checkpoint_key)
+        
+        if early_stopping:
+            self._restore_best_weights()
+        if use_corpus_file:
+            self._map_line_tags(document_names)
+        if checkpoint_dir:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        # 同じモデルを学習し直した場合も単語ベクトルは書き換わっている
+        self._clear_normed_word_vectors()
         
         training_time = time.time() - start_time
         print(f"学習完了 (所要時間: {training_time:.2f}秒)")
         
         return self.model
 
-    def analyze_document_similarity(self):
+    def _train_epoch(self, epoch, corpus_args, evaluation_sample):
+        """
+        1エポック分だけ学習する（学習率は全エポックを通して alpha から min_alpha へ線形に下げる）
+        """
+        model = self.model
+        start_alpha = model.alpha - (model.alpha - model.min_alpha) * epoch / model.epochs
+        end_alpha = model.alpha - (model.alpha - model.min_alpha) * (epoch + 1) / model.epochs
+        
+        settings = (model.epochs, model.alpha, model.min_alpha)
+        epoch_start = time.perf_counter()
+        with metrics.timer('training_epoch'):
+            model.train(total_examples=model.corpus_count, epochs=1,
+                        start_alpha=start_alpha, end_alpha=end_alpha, **corpus_args)
+        # train() は epochs と学習率を渡した値で上書きするため、全体の設定に戻す
+        # （infer_vector もこの設定を使う）
+        model.epochs, model.alpha, model.min_alpha = settings
+        record = {'epoch': epoch + 1, 'seconds': time.perf_counter() - epoch_start, 'alpha': start_alpha}
+        
+        message = f"  エポック {epoch + 1}/{model.epochs}: {record['seconds']:.2f}秒"
+        if evaluation_sample is not None:
+            record['self_similarity'] = self.self_similarity_rate(evaluation_sample)
+            metrics.observe('self_similarity_rate', record['self_similarity'])
+            message += f", 自己類似度一致率: {record['self_similarity']:.3f}"
+        print(message)
+        self.training_history.append(record)
+
+    def _self_similarity_sample(self, documents, sample_size=SELF_SIMILARITY_SAMPLE_SIZE):
+        """
+        早期終了の評価に使う (文書番号, 単語リスト) の標本（毎回同じ文書を選ぶ）
+        """
+        rng = np.random.default_rng(INFER_SEED)
+        indices = sorted(rng.choice(len(documents), min(sample_size, len(documents)), replace=False).tolist())
+        return [(i, documents[i]) for i in indices]
+
+    def self_similarity_rate(self, sample):
+        """
+        標本の文書を再推論したとき、学習済みの文書ベクトルのうち自分自身が最も類似する割合
+        """
+        vectors = np.array([self.infer_vector(words, hash_text(' '.join(words))) for _, words in sample])
+        indices, _ = search_top_k(normalize_rows(vectors), normalize_rows(self.model.dv.vectors), 1)
+        expected = np.array([i for i, _ in sample])
+        return float(np.mean(indices[:, 0] == expected))
+
+    def _should_stop_early(self):
+        scores = [record['self_similarity'] for record in self.training_history if 'self_similarity' in record]
+        if len(scores) <= EARLY_STOPPING_PATIENCE:
+            return False
+        best_before = max(scores[:-EARLY_STOPPING_PATIENCE])
+        return max(scores[-EARLY_STOPPING_PATIENCE:]) < best_before + EARLY_STOPPING_MIN_DELTA
+
+    def _weight_arrays(self):
+        """
+        学習で更新される重み行列 {名前: 配列}
+        """
+        model = self.model
+        arrays = {'wv': model.wv.vectors, 'dv': model.dv.vectors}
+        for name in ('syn1neg', 'syn1'):
+            if hasattr(model, name):
+                arrays[name] = getattr(model, name)
+        return arrays
+
+    def _update_best_weights(self):
+        """
+        直前のエポックの評価値がこれまでの最高なら、その時点の重みを控えておく
+        """
+        record = self.training_history[-1]
+        if self.best_weights is None or record['self_similarity'] > self.best_weights['score']:
+            self.best_weights = {
+                'epoch': record['epoch'],
+                'score': record['self_similarity'],
+                'arrays': {name: array.copy() for name, array in self._weight_arrays().items()},
+            }
+
+    def _restore_best_weights(self):
+        """
+        最後のエポックより評価値が高いエポックがあれば、その重みに戻す
+        """
+        best = self.best_weights
+        if best is None or best['epoch'] == self.training_history[-1]['epoch']:
+            return
+        for name, array in self._weight_arrays().items():
+            np.copyto(array, best['arrays'][name])
+        # 正規化済みベクトルのキャッシュは戻す前の重みから計算されているため捨てる
+        self.model.wv.norms = None
+        self.model.dv.norms = None
+        self._clear_normed_word_vectors()
+        print(f"評価値が最も高かったエポック {best['epoch']} の重みに戻します（自己類似度一致率: {best['score']:.3f}）")
+
+    def _checkpoint_key(self, document_names, use_corpus_file, corpus_hash):
+        """
+        同じ文書・同じ設定の学習かを判定するためのキー
+        文書名が同じでも内容（単語列）が変わっていれば別のキーになる
+        """
+        payload = json.dumps({'config': self.model_config(), 'use_corpus_file': use_corpus_file,
+                              'document_names': list(document_names), 'corpus_hash': corpus_hash},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _save_checkpoint(self, checkpoint_dir, checkpoint_key):
+        tmp_dir = checkpoint_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        self.model.save(os.path.join(tmp_dir, MODEL_FILE))
+        state = {'key': checkpoint_key, 'model_id': self.model_id, 'history': self.training_history}
+        with open(os.path.join(tmp_dir, CHECKPOINT_STATE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        if self.best_weights is not None:
+            best = self.best_weights
+            np.savez(os.path.join(tmp_dir, CHECKPOINT_BEST_WEIGHTS_FILE),
+                     epoch=best['epoch'], score=best['score'], **best['arrays'])
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        os.replace(tmp_dir, checkpoint_dir)
+
+    def _load_checkpoint(self, checkpoint_dir, checkpoint_key):
+        """
+        同じキーのチェックポイントがあればモデルと学習履歴を復元して True を返す
+        """
+        state_path = os.path.join(checkpoint_dir, CHECKPOINT_STATE_FILE)
+        if not os.path.exists(state_path):
+            return False
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['key'] != checkpoint_key:
+            return False
+        self.model = Doc2Vec.load(os.path.join(checkpoint_dir, MODEL_FILE))
+        self.model_id = state['model_id']
+        self.training_history = state['history']
+        self.best_weights = None
+        best_path = os.path.join(checkpoint_dir, CHECKPOINT_BEST_WEIGHTS_FILE)
+        if os.path.exists(best_path):
+            with np.load(best_path) as saved:
+                self.best_weights = {
+                    'epoch': int(saved['epoch']),
+                    'score': float(saved['score']),
+                    'arrays': {name: saved[name] for name in saved.files if name not in ('epoch', 'score')},
+                }
+        return True
+
+    def export_corpus_file(self, documents, path=CORPUS_PATH):
+        """
+        文書を gensim の corpus_file 形式（1行1文書・半角スペース区切り）で書き出してパスを返す
+        すでにファイル上のコーパスなら不要行を取り除いてそのファイルをそのまま使う
+        """
+        if isinstance(documents, TokenFileCorpus):
+            documents.compact()
+            return documents.path
+        corpus = TokenFileCorpus(path)
+        for words in documents:
+            corpus.append(words)
+        corpus.close()
+        return corpus.path
+
+    def _map_line_tags(self, document_names):
+        """
+        corpus_file モードでは文書のタグが行番号になるため、文書名に付け替える
+        """
+        dv = self.model.dv
+        if len(dv.index_to_key) != len(document_names):
+            raise ValueError("学習した文書数と文書名の数が一致しません")
+        dv.index_to_key = list(document_names)
+        dv.key_to_index = {name: i for i, name in enumerate(document_names)}
+
+    def compute_document_similarity(self, k=SIMILAR_DOCUMENTS_TOP_K, n_pairs=SIMILAR_PAIRS_TOP_N,
+                                    output_path=None, memory_budget=SIMILARITY_MEMORY_BUDGET):
+        """
+        全文書について類似文書の上位k件と、類似度の高い文書ペアの上位n_pairs件を求める
+        文書ベクトル行列をブロック単位の行列積で比較するため、文書数が多くても
+        メモリ使用量は memory_budget 程度に収まる
+
+        output_path を指定すると、各文書の類似文書を
+        「文書名 / 順位 / 類似文書名 / 類似度」のTSVとして計算しながら書き出す
+        """
+        names = list(self.model.dv.index_to_key)
+        neighbors = {}
+
+        def collect(start, indices, scores):
+            for offset, (row_indices, row_scores) in enumerate(zip(indices.tolist(), scores.tolist())):
+                neighbors[names[start + offset]] = [
+                    (names[j], score) for j, score in zip(row_indices, row_scores)
+                ]
+            if output_file is not None:
+                for offset in range(len(indices)):
+                    name = names[start + offset]
+                    for rank, (neighbor, score) in enumerate(neighbors[name], 1):
+                        output_file.write(f"{name}\t{rank}\t{neighbor}\t{score:.6f}\n")
+
+        output_file = open(output_path, 'w', encoding='utf-8') if output_path else None
+        try:
+            result = all_pairs_similarity(self.model.dv.vectors, k=k, n_pairs=n_pairs,
+                                          memory_budget=memory_budget, on_block=collect)
+        finally:
+            if output_file is not None:
+                output_file.close()
+
+        return {
+            'neighbors': neighbors,
+            'pairs': [(names[i], names[j], score) for i, j, score in result['pairs']],
+        }
+
+    def model_config(self):
+        """
+        モデルの内容を左右する前処理・学習の設定
+        保存済みモデルを再利用できるかの判定に使う
+        """
+        return {
+            'tokenizer': self.tokenizer.config_fingerprint(),
+            'mecab_args': self.tokenizer.mecab_args,
+            'max_text_length': MAX_TEXT_LENGTH,
+            'vector_size': VECTOR_SIZE,
+            'min_count': MIN_COUNT,
+            'epochs': EPOCHS,
+            'use_corpus_file': USE_CORPUS_FILE,
+        }
+
+    def save(self, path=MODEL_DIR, source_versions=None):
+        """
+        学習済みモデルとメタデータ（文書名・文書統計・前処理設定・単語頻度）を保存する
+        大きな配列は別ファイルの .npy に分けて保存し、読み込み時にメモリマップできるようにする
+        source_versions には {ファイルパス: 内容ハッシュ} を渡す
+        """
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        # sep_limit=0 ですべての配列を別ファイルにする
+        self.model.save(os.path.join(tmp_path, MODEL_FILE), sep_limit=0)
+        metadata = {
+            'model_id': self.model_id,
+            'document_names': self.document_names,
+            'word_stats': self.word_stats,
+            'config': self.model_config(),
+            'source_versions': source_versions or {},
+            'training_history': self.training_history,
+        }
+        with open(os.path.join(tmp_path, MODEL_METADATA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        self.sync_term_index().save(os.path.join(tmp_path, MODEL_TERM_INDEX_FILE))
+        if self.ann_index is not None:
+            self.ann_index.save(os.path.join(tmp_path, MODEL_ANN_INDEX_DIR))
+
+        # 書き込みが完了してから差し替え、途中で失敗しても前回の保存内容を壊さない
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        self.model_path = path
+
+    @classmethod
+    def load(cls, path=MODEL_DIR, mmap='r'):
+        """
+        save() で保存したモデルを読み込む
+        mmap='r' なら大きな配列を読み取り専用でメモリマップし、複数のワーカープロセスで共有できる
+        （文書の単語列は保存しないため、読み込んだアナライザでは再学習できない）
+        """
+        analyzer = cls()
+        analyzer.model = Doc2Vec.load(os.path.join(path, MODEL_FILE), mmap=mmap)
+        with open(os.path.join(path, MODEL_METADATA_FILE), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        analyzer.model_id = metadata.get('model_id')
+        analyzer.model_path = path
+        analyzer.document_names = metadata['document_names']
+        analyzer.word_stats = metadata['word_stats']
+        analyzer.training_history = metadata.get('training_history', [])
+        analyzer.term_index = TermFrequencyIndex.load(os.path.join(path, MODEL_TERM_INDEX_FILE))
+        ann_index_path = os.path.join(path, MODEL_ANN_INDEX_DIR)
+        if os.path.isdir(ann_index_path):
+            analyzer.load_ann_index(ann_index_path, mmap=mmap is not None)
+
+        if metadata['config'] != analyzer.model_config():
+            print("警告: 保存済みモデルの前処理・学習設定が現在の設定と異なります")
+        return analyzer
+
+    @classmethod
+    def load_if_current(cls, file_paths, path=MODEL_DIR, mmap='r'):
+        """
+        保存済みモデルが同じ設定・同じ内容の file_paths から学習したものなら読み込んで返す
+        そうでなければ None を返す
+        """
+        metadata_path = os.path.join(path, MODEL_METADATA_FILE)
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+        if metadata['config'] != cls().model_config():
+            return None
+        if metadata['source_versions'] != source_versions(file_paths):
+            return None
+        return cls.load(path, mmap=mmap)
+
+    def analyze_document_similarity(self, output_path=None):
         """
         文書間類似度分析
         """
@@ -169,22 +634,172 @@ class Doc2VecAnalyzer:
             print("類似度分析には2つ以上の文書が必要です。")
             return
         
-        similarities = []
-        for i, doc1 in enumerate(self.document_names):
-            for j, doc2 in enumerate(self.document_names[i+1:], i+1):
-                try:
-                    similarity = self.model.dv.similarity(doc1, doc2)
-                    similarities.append((doc1, doc2, similarity))
-                    print(f"{os.path.basename(doc1)} ⟷ {os.path.basename(doc2)}: {similarity:.4f}")
-                except KeyError as e:
-                    print(f"文書ベクトルが見つかりません: {e}")
+        result = self.compute_document_similarity(output_path=output_path)
+        similarities = result['pairs']
+        
+        print(f"類似度の高い文書ペア（上位{len(similarities)}件）:")
+        for doc1, doc2, similarity in similarities:
+            print(f"{os.path.basename(doc1)} ⟷ {os.path.basename(doc2)}: {similarity:.4f}")
+        if output_path:
+            print(f"各文書の類似文書を {output_path} に保存しました")
         
         # 最も類似した文書ペア
         if similarities:
-            most_similar = max(similarities, key=lambda x: x[2])
+            most_similar = similarities[0]
             print(f"\n最も類似した文書ペア:")
             print(f"  {os.path.basename(most_similar[0])} ⟷ {os.path.basename(most_similar[1])}")
             print(f"  類似度: {most_similar[2]:.4f}")
+        
+        return result
+
+    def build_ann_index(self, n_lists=None, n_probe=DEFAULT_N_PROBE):
+        """
+        学習済みの文書ベクトルから類似文書検索用のインデックスを作成する
+        """
+        self.ann_index = IVFIndex.build(self.model.dv.vectors, list(self.model.dv.index_to_key),
+                                        n_lists=n_lists, n_probe=n_probe)
+        return self.ann_index
+
+    def save_ann_index(self, path):
+        self.ann_index.save(path)
+
+    def load_ann_index(self, path, mmap=True):
+        self.ann_index = IVFIndex.load(path, mmap=mmap)
+        return self.ann_index
+
+    def find_similar_documents(self, doc_name=None, text=None, k=10, n_probe=None):
+        """
+        登録済みの文書名、または新しいテキストに類似した文書の上位k件を
+        [(文書名, 類似度), ...] で返す（インデックス未作成ならここで作成する）
+        n_probe を大きくすると全件探索に近い結果になる
+        """
+        if (doc_name is None) == (text is None):
+            raise ValueError("doc_name と text のどちらか一方を指定してください")
+        if self.ann_index is None:
+            self.build_ann_index()
+
+        if doc_name is not None:
+            return self.ann_index.search_name(doc_name, k, n_probe)
+
+        return self.ann_index.search_vector(self.infer_vectors([text], workers=1)[0], k, n_probe)
+
+    def infer_vectors(self, texts, workers=INFER_WORKERS, batch_size=INFER_BATCH_SIZE):
+        """
+        新しいテキストを preprocess_text と同じ前処理にかけ、学習済みモデルで文書ベクトルを推論する
+        (len(texts), ベクトル次元数) の配列を返す
+
+        - 乱数は文書の内容ハッシュから初期化するため、同じ文書は常に同じベクトルになる
+        - 結果は内容ハッシュ・前処理設定・モデルをキーにキャッシュする
+        - キャッシュにない文書が多い場合はプロセスプールでバッチごとに並列に推論する
+        """
+        vectors = np.empty((len(texts), self.model.vector_size), dtype=np.float32)
+        # 識別子のないモデル（train_model / load を経ていないもの）の結果はキャッシュしない
+        use_cache = self.infer_cache is not None and self.model_id is not None
+        keys = [self._infer_cache_key(text) for text in texts] if use_cache else None
+
+        pending = []
+        for i in range(len(texts)):
+            cached = self.infer_cache.get(keys[i]) if use_cache else None
+            if cached is None:
+                pending.append(i)
+            else:
+                vectors[i] = cached
+        metrics.inc('infer_cache_requests_total', len(texts) - len(pending), result='hit')
+        metrics.inc('infer_cache_requests_total', len(pending), result='miss')
+
+        batches = [[(i, texts[i]) for i in pending[start:start + batch_size]]
+                   for start in range(0, len(pending), batch_size)]
+        with metrics.timer('inference'):
+            if workers <= 1 or len(batches) <= 1:
+                results = (_infer_batch_with(self, batch) for batch in batches)
+                self._collect_infer_results(results, vectors, keys)
+            else:
+                # 保存済みモデルがあればワーカー側でメモリマップして読み込み、モデルのコピーを渡さない
+                model_source = self.model_path or self.model
+                with ProcessPoolExecutor(max_workers=min(workers, len(batches)),
+                                         initializer=_init_infer_worker,
+                                         initargs=(model_source, self.tokenizer, self.token_cache)) as executor:
+                    self._collect_infer_results(executor.map(_infer_batch, batches), vectors, keys)
+        return vectors
+
+    def _infer_cache_key(self, text):
+        return TokenCache.make_key(
+            hash_text(text), self.tokenizer,
+            extra=f"model={self.model_id}|max_text_length={MAX_TEXT_LENGTH}|seed={INFER_SEED}"
+        )
+
+    def _collect_infer_results(self, results, vectors, keys):
+        for batch_results, worker_metrics in results:
+            if worker_metrics:
+                metrics.REGISTRY.merge(worker_metrics)
+            for i, vector in batch_results:
+                vectors[i] = vector
+                if keys is not None:
+                    self.infer_cache.put(keys[i], vector)
+
+    def infer_vector(self, words, content_hash):
+        """
+        単語リストの文書ベクトルを推論する（内容ハッシュから乱数を初期化して決定的にする）
+        """
+        seed = (INFER_SEED + int(content_hash[:8], 16)) % (2 ** 32)
+        saved_random = self.model.random
+        self.model.random = np.random.RandomState(seed)
+        try:
+            return self.model.infer_vector(words)
+        finally:
+            self.model.random = saved_random
+
+    def infer_documents(self, texts, k=SIMILAR_DOCUMENTS_TOP_K, workers=INFER_WORKERS,
+                        memory_budget=SIMILARITY_MEMORY_BUDGET):
+        """
+        新しいテキストごとに、学習済みの文書のうち類似した上位k件を返す
+        近似最近傍インデックスがあればそれを使い、なければ全文書と比較する
+        戻り値は [{'vector': 文書ベクトル, 'neighbors': [(文書名, 類似度), ...]}, ...]
+        """
+        vectors = self.infer_vectors(texts, workers=workers)
+        if self.ann_index is not None:
+            neighbors = [self.ann_index.search_vector(vector, k) for vector in vectors]
+        else:
+            names = list(self.model.dv.index_to_key)
+            indices, scores = search_top_k(normalize_rows(vectors), normalize_rows(self.model.dv.vectors), k,
+                                           memory_budget=memory_budget)
+            neighbors = [[(names[j], score) for j, score in zip(row_indices, row_scores)]
+                         for row_indices, row_scores in zip(indices.tolist(), scores.tolist())]
+        return [{'vector': vector, 'neighbors': row} for vector, row in zip(vectors, neighbors)]
+
+    def similar_words(self, words, topn=5, memory_budget=SIMILARITY_MEMORY_BUDGET):
+        """
+        複数の単語の類似単語を、正規化した単語ベクトル行列との1回の行列積でまとめて求める
+        戻り値は {'neighbors': {単語: [(類似単語, 類似度), ...]}, 'missing': [語彙にない単語]}
+        """
+        wv = self.model.wv
+        found = [word for word in words if word in wv.key_to_index]
+        missing = [word for word in words if word not in wv.key_to_index]
+        if not found:
+            return {'neighbors': {}, 'missing': missing}
+
+        normed = self._normed_word_vectors()
+        query_ids = np.array([wv.key_to_index[word] for word in found], dtype=np.int64)
+        # 問い合わせた単語自身は類似単語から除く
+        indices, scores = search_top_k(normed[query_ids], normed, topn, exclude=query_ids,
+                                       memory_budget=memory_budget)
+        neighbors = {
+            word: [(wv.index_to_key[j], score) for j, score in zip(row_indices, row_scores)]
+            for word, row_indices, row_scores in zip(found, indices.tolist(), scores.tolist())
+        }
+        return {'neighbors': neighbors, 'missing': missing}
+
+    def _normed_word_vectors(self):
+        # 正規化した単語ベクトル行列はモデルごとに1度だけ作る
+        if self._normed_word_vectors_model is not self.model:
+            self._normed_word_vectors_cache = normalize_rows(self.model.wv.vectors)
+            self._normed_word_vectors_model = self.model
+        return self._normed_word_vectors_cache
+
+    def _clear_normed_word_vectors(self):
+        # 同じモデルの重みを書き換えたとき（最良エポックへの復元・再学習）は作り直させる
+        self._normed_word_vectors_cache = None
+        self._normed_word_vectors_model = None
 
     def analyze_word_similarity(self):
         """
@@ -193,11 +808,7 @@ class Doc2VecAnalyzer:
         print("\n=== 単語類似度分析 ===")
         
         # 語彙から頻出単語を選択
-        word_freq = Counter()
-        for doc in self.documents:
-            word_freq.update(doc)
-        
-        common_words = [word for word, freq in word_freq.most_common(20) 
+        common_words = [word for word, freq in self.most_common_words(20) 
                        if word in self.model.wv.key_to_index]
         
         if not common_words:
@@ -206,14 +817,35 @@ class Doc2VecAnalyzer:
         
         print(f"頻出単語から分析対象を選択: {common_words[:5]}")
         
-        for word in common_words[:3]:
+        result = self.similar_words(common_words[:3], topn=5)
+        for word, similar_words in result['neighbors'].items():
             print(f"\n'{word}' の類似単語:")
-            try:
-                similar_words = self.model.wv.most_similar(word, topn=5)
-                for i, (sim_word, similarity) in enumerate(similar_words, 1):
-                    print(f"  {i}. {sim_word} (類似度: {similarity:.4f})")
-            except KeyError:
-                print(f"  '{word}' の類似単語を見つけられませんでした。")
+            for i, (sim_word, similarity) in enumerate(similar_words, 1):
+                print(f"  {i}. {sim_word} (類似度: {similarity:.4f})")
+        
+        return result
+
+    def cluster_words(self, words=None, n_words=None, n_clusters=None,
+                      min_similarity=WORD_CLUSTER_MIN_SIMILARITY, n_representatives=5):
+        """
+        単語ベクトルを k-means でクラスタリングする
+        words を省略した場合は語彙の頻度上位 n_words 件（None なら語彙全体）を対象にする
+        戻り値は cluster_vectors の結果に対象単語のリスト 'words' を加えた辞書
+        """
+        wv = self.model.wv
+        if words is None:
+            words = wv.index_to_key[:n_words]
+            vectors = wv.vectors[:len(words)]
+        else:
+            words = [word for word in words if word in wv.key_to_index]
+            vectors = wv.vectors[[wv.key_to_index[word] for word in words]]
+        if not words:
+            raise ValueError("クラスタリングできる単語がありません")
+
+        result = cluster_vectors(vectors, words, n_clusters=n_clusters, min_similarity=min_similarity,
+                                 n_representatives=n_representatives)
+        result['words'] = list(words)
+        return result
 
     def analyze_word_clusters(self):
         """
@@ -222,11 +854,7 @@ class Doc2VecAnalyzer:
         print("\n=== 単語クラスタリング分析 ===")
         
         # 頻出単語のベクトルを取得
-        word_freq = Counter()
-        for doc in self.documents:
-            word_freq.update(doc)
-        
-        target_words = [word for word, freq in word_freq.most_common(15) 
+        target_words = [word for word, freq in self.most_common_words(15) 
                        if word in self.model.wv.key_to_index]
         
         if len(target_words) < 3:
@@ -235,32 +863,15 @@ class Doc2VecAnalyzer:
         
         print(f"分析対象単語: {target_words}")
         
-        # 簡易クラスタリング（類似度ベース）
-        clusters = {}
-        processed = set()
-        
-        for word in target_words:
-            if word in processed:
-                continue
-                
-            cluster = [word]
-            processed.add(word)
-            
-            try:
-                similar_words = self.model.wv.most_similar(word, topn=10)
-                for sim_word, similarity in similar_words:
-                    if sim_word in target_words and similarity > 0.3 and sim_word not in processed:
-                        cluster.append(sim_word)
-                        processed.add(sim_word)
-                
-                if len(cluster) > 1:
-                    clusters[f"クラスタ_{len(clusters)+1}"] = cluster
-            except KeyError:
-                continue
+        result = self.cluster_words(words=target_words, n_representatives=len(target_words))
         
         print("\n単語クラスタ:")
-        for cluster_name, words in clusters.items():
-            print(f"  {cluster_name}: {', '.join(words)}")
+        for i, cluster in enumerate(result['clusters'], 1):
+            if cluster['size'] > 1:
+                words = [word for word, _ in cluster['representatives']]
+                print(f"  クラスタ_{i}: {', '.join(words)}")
+        
+        return result
 
     def generate_analysis_report(self):
         """
@@ -273,7 +884,7 @@ class Doc2VecAnalyzer:
         print(f"\n【モデル情報】")
         print(f"  ベクトル次元数: {self.model.vector_size}")
         print(f"  語彙数: {len(self.model.wv.key_to_index)}")
-        print(f"  学習エポック数: {self.model.epochs}")
+        print(f"  学習エポック数: {len(self.training_history) or self.model.epochs}")
         
         print(f"\n【文書統計】")
         for doc_name, stats in self.word_stats.items():
@@ -283,19 +894,76 @@ class Doc2VecAnalyzer:
             print(f"    語彙多様性: {stats['unique_words']/stats['total_words']:.3f}")
         
         print(f"\n【頻出単語トップ10】")
-        word_freq = Counter()
-        for doc in self.documents:
-            word_freq.update(doc)
-        
-        for i, (word, freq) in enumerate(word_freq.most_common(10), 1):
+        for i, (word, freq) in enumerate(self.most_common_words(10), 1):
             print(f"  {i:2d}. {word} ({freq}回)")
 
+def corpus_content_hash(documents):
+    """
+    文書の単語列全体の内容ハッシュ（corpus_file と同じ1行1文書の形式で計算する）
+    """
+    digest = hashlib.sha256()
+    for words in documents:
+        digest.update((' '.join(words) + '\n').encode('utf-8'))
+    return digest.hexdigest()
+
+def source_versions(file_paths):
+    """
+    {ファイルパス: 内容ハッシュ}（保存済みモデルの学習元と同じかの判定用）
+    """
+    return {path: hash_file(path) for path in file_paths}
+
+# --- 並列前処理用のワーカー関数 ---
+# ワーカープロセスごとに1つのアナライザ（= 1つの MeCab Tagger）を保持して使い回す
+_worker_analyzer = None
+
+def _init_preprocess_worker(tokenizer, token_cache):
+    global _worker_analyzer
+    _worker_analyzer = Doc2VecAnalyzer()
+    _worker_analyzer.tokenizer = tokenizer
+    _worker_analyzer.token_cache = token_cache
+
+def _preprocess_file(path):
+    path, words, stats, _ = _preprocess_file_with(_worker_analyzer, path)
+    return path, words, stats, metrics.REGISTRY.drain()
+
+def _preprocess_file_with(analyzer, path):
+    """
+    ファイルを前処理し、(パス, 単語リスト, 文書統計, ワーカーの計測値) を返す
+    """
+    words = analyzer.preprocess_file(path)
+    return path, words, analyzer.word_stats.pop(path), None
+
+# --- 並列推論用のワーカー関数 ---
+_worker_infer_analyzer = None
+
+def _init_infer_worker(model_source, tokenizer, token_cache):
+    global _worker_infer_analyzer
+    _worker_infer_analyzer = Doc2VecAnalyzer()
+    _worker_infer_analyzer.tokenizer = tokenizer
+    _worker_infer_analyzer.token_cache = token_cache
+    if isinstance(model_source, str):
+        _worker_infer_analyzer.model = Doc2Vec.load(os.path.join(model_source, MODEL_FILE), mmap='r')
+    else:
+        _worker_infer_analyzer.model = model_source
+
+def _infer_batch(batch):
+    batch_results, _ = _infer_batch_with(_worker_infer_analyzer, batch)
+    return batch_results, metrics.REGISTRY.drain()
+
+def _infer_batch_with(analyzer, batch):
+    """
+    [(番号, テキスト), ...] を推論し、([(番号, ベクトルのリスト), ...], ワーカーの計測値) を返す
+    """
+    results = []
+    for i, text in batch:
+        words = analyzer.tokenize_text(text)['words']
+        results.append((i, analyzer.infer_vector(words, hash_text(text)).tolist()))
+    return results, None
+
 def main():
     """
     メイン処理
     """
-    analyzer = Doc2VecAnalyzer()
-    
     try:
         start_time = time.time()
         
@@ -312,37 +980,33 @@ def main():
         print(f"=== ファイル読み込み ===")
         print(f"対象ファイル数: {len(limited_files)}")
         
-        documents = []
-        document_names = []
-        
-        for i, path in enumerate(limited_files):
-            filename = os.path.basename(path)
-            print(f"処理中: {filename} ({i+1}/{len(limited_files)})")
+        analyzer = Doc2VecAnalyzer.load_if_current(limited_files) if USE_SAVED_MODEL else None
+        if analyzer is not None:
+            print(f"保存済みモデルを読み込みました: {MODEL_DIR}")
+        else:
+            analyzer = Doc2VecAnalyzer(CORPUS_PATH if USE_DISK_CORPUS else None)
+            analyzer.preprocess_files(limited_files)
             
-            with open(path, 'r', encoding='utf-8') as f:
-                text = f.read()
+            if not analyzer.documents:
+                print("エラー: 分析可能な文書がありません。")
+                return
             
-            words = analyzer.preprocess_text(text, path)
-            if words:
-                documents.append(words)
-                document_names.append(path)
-                print(f"  抽出単語数: {len(words)}")
-        
-        if not documents:
-            print("エラー: 分析可能な文書がありません。")
-            return
-        
-        analyzer.documents = documents
-        analyzer.document_names = document_names
-        
-        # モデル学習
-        analyzer.train_model(documents, document_names)
+            # モデル学習
+            analyzer.train_model(analyzer.documents, analyzer.document_names,
+                                 checkpoint_dir=TRAINING_CHECKPOINT_DIR if USE_TRAINING_CHECKPOINT else None)
+            if USE_SAVED_MODEL:
+                analyzer.save(MODEL_DIR, source_versions(limited_files))
+                print(f"モデルを保存しました: {MODEL_DIR}")
         
         # 各種分析実行
-        analyzer.analyze_document_similarity()
-        analyzer.analyze_word_similarity()
-        analyzer.analyze_word_clusters()
-        analyzer.generate_analysis_report()
+        with metrics.timer('similarity', target='document'):
+            analyzer.analyze_document_similarity()
+        with metrics.timer('similarity', target='word'):
+            analyzer.analyze_word_similarity()
+        with metrics.timer('similarity', target='word_cluster'):
+            analyzer.analyze_word_clusters()
+        with metrics.timer('rendering', target='report'):
+            analyzer.generate_analysis_report()
         
         total_time = time.time() - start_time
         print(f"\n総処理時間: {total_time:.2f}秒")
@@ -0,0 +1,101 @@
+"""
+終わりのない単語ストリーム向けの近似頻出単語カウンタ（Space-Saving アルゴリズム）
+監視する単語数を capacity 個に固定するため、語彙が増え続けてもメモリ使用量は一定です
+"""
+
+import heapq
+
+
+class SpaceSavingCounter:
+    """
+    Space-Saving による近似カウンタ
+
+    - 推定回数は真の回数以上で、誤差は単語ごとに error 以下
+    - どの単語の誤差も 総単語数 / capacity 以下
+    - 真の回数が 総単語数 / capacity を超える単語は必ず監視対象に残る
+    """
+
+    def __init__(self, capacity=1000):
+        if capacity <= 0:
+            raise ValueError("capacity は1以上を指定してください")
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}  # 単語 -> 推定回数
+        self.errors = {}  # 単語 -> 推定回数に含まれうる過大評価分
+        self.evictions = 0  # 監視対象から追い出した回数
+        # (回数, 単語) の最小ヒープ。回数は増える一方なので、ヒープ上の値が
+        # 古い場合は取り出した時点で最新の値に差し替える
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, word, count=1):
+        self.total += count
+
+        if word in self.counts:
+            self.counts[word] += count
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[word] = count
+            self.errors[word] = 0
+            heapq.heappush(self._heap, (count, word))
+            return
+
+        # 推定回数が最小の単語を追い出し、その回数を引き継ぐ
+        min_count, min_word = self._pop_min()
+        self.evictions += 1
+        del self.counts[min_word]
+        del self.errors[min_word]
+        self.counts[word] = min_count + count
+        self.errors[word] = min_count
+        heapq.heappush(self._heap, (min_count + count, word))
+
+    def update(self, words):
+        for word in words:
+            self.add(word)
+
+    def _peek_min(self):
+        heap = self._heap
+        while True:
+            count, word = heap[0]
+            current = self.counts[word]
+            if current == count:
+                return heap[0]
+            heapq.heapreplace(heap, (current, word))
+
+    def _pop_min(self):
+        self._peek_min()
+        return heapq.heappop(self._heap)
+
+    def estimate(self, word):
+        """
+        (推定回数, 誤差) を返す。監視対象外の単語は最大誤差を上限として返す
+        """
+        if word in self.counts:
+            return self.counts[word], self.errors[word]
+        return 0, self.max_error
+
+    @property
+    def max_error(self):
+        """
+        監視対象のどの単語についても成り立つ誤差の上限
+        """
+        return self.total // self.capacity
+
+    def most_common(self, k):
+        """
+        推定回数の多い上位k件を (単語, 推定回数, 誤差, 確定) で返す
+        確定が True の単語は、真の上位k件に含まれることが保証される
+        （真の回数の下限 推定回数 - 誤差 が、k+1位の推定回数と監視対象外の単語の回数の上限以上）
+        """
+        ranked = heapq.nsmallest(k + 1, self.counts.items(), key=lambda item: (-item[1], item[0]))
+        threshold = ranked[k][1] if len(ranked) > k else 0
+        if self.evictions:
+            # 追い出された単語の真の回数は、監視対象の最小の推定回数以下
+            threshold = max(threshold, self._peek_min()[0])
+        return [
+            (word, count, self.errors[word], count - self.errors[word] >= threshold)
+            for word, count in ranked[:k]
+        ]
@@ -0,0 +1,111 @@
+"""
+複数キーワードの出現回数を1回の走査で数えるマッチャ（Aho-Corasick 法）
+キーワード集合からオートマトンを1度だけ作り、テキストを先頭から1文字ずつ読むだけで
+すべてのキーワードの出現を見つけるため、キーワード数が増えても走査は1回で済みます
+"""
+
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick オートマトンによる複数キーワードのカウンタ
+
+    キーワードごとの回数は、そのキーワードを単独で先頭から検索したときの
+    重ならない出現回数（re.findall と同じ数え方）になる
+    別のキーワードとの重なりは問わないため、「東京」と「東京駅」はどちらも数える
+    """
+
+    def __init__(self, keywords, ignore_case=True):
+        self.ignore_case = ignore_case
+        # 重複を除いた順序付きのキーワード（空文字列は数えない）
+        self.keywords = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+        self._lengths = [len(self._fold(keyword)) for keyword in self.keywords]
+        self._goto = [{}]     # 状態 -> {文字: 次の状態}
+        self._outputs = [()]  # 状態 -> その状態で出現が終わるキーワード番号
+        self._build()
+
+    def _fold(self, text):
+        return text.lower() if self.ignore_case else text
+
+    def _build(self):
+        goto = self._goto
+        outputs = self._outputs
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in self._fold(keyword):
+                if char not in goto[state]:
+                    goto.append({})
+                    outputs.append(())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            outputs[state] += (index,)
+
+        # 幅優先で失敗遷移を求め、失敗先の出力を引き継ぐ（深さ1の状態の失敗先は根）
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                target = fail[state]
+                while target and char not in goto[target]:
+                    target = fail[target]
+                fail[child] = goto[target].get(char, 0)
+                outputs[child] += outputs[fail[child]]
+        self._fail = fail
+
+    def iter_matches(self, text):
+        """
+        テキスト中のすべての出現を (キーワード番号, 終了位置) で順に返す（重なりも含む）
+        位置は大文字小文字を揃えた後のテキスト上の位置
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        state = 0
+        for position, char in enumerate(self._fold(text), 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in outputs[state]:
+                yield index, position
+
+    def count(self, text):
+        """
+        {キーワード: 出現回数} を返す
+        """
+        return dict(zip(self.keywords, self._count(text)))
+
+    def _count(self, text):
+        counts = [0] * len(self.keywords)
+        # キーワードごとに最後に数えた出現の終了位置（重なる出現は数えない）
+        last_end = [0] * len(self.keywords)
+        lengths = self._lengths
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        state = 0
+        # iter_matches() と同じ走査を、呼び出しのオーバーヘッドを避けるため展開している
+        for position, char in enumerate(self._fold(text), 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in outputs[state]:
+                if position - lengths[index] >= last_end[index]:
+                    counts[index] += 1
+                    last_end[index] = position
+        return counts
+
+    def count_documents(self, documents):
+        """
+        (文書名, テキスト) のイテラブルについて文書ごとと全体の出現回数を数える
+        戻り値は {'documents': {文書名: {キーワード: 回数}}, 'total': {キーワード: 回数}}
+        """
+        per_document = {}
+        total = [0] * len(self.keywords)
+        for name, text in documents:
+            counts = self._count(text)
+            per_document[name] = dict(zip(self.keywords, counts))
+            total = [a + b for a, b in zip(total, counts)]
+        return {'documents': per_document, 'total': dict(zip(self.keywords, total))}
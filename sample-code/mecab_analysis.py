@@ -1,12 +1,15 @@
-
 # SageMaker Notebookインスタンスのターミナルで、まずMeCabと辞書をインストールする必要があります。
 # 以下のコマンドをノートブックのセルで実行してください。
 # !pip install mecab-python3 ipadic
 
-import MeCab
 import os
 from collections import Counter
-import re
+
+from mecab_tokenizer import create_frequency_tokenizer
+import metrics
+from heavy_hitters import SpaceSavingCounter
+from term_index import TermFrequencyIndex
+from token_cache import TokenCache, hash_file, hash_text
 
 # --- 設定 ---
 # MeCabの辞書パス。`!pip install ipadic` でインストールした場合、通常は自動で解決されますが、
@@ -18,99 +21,222 @@ MECAB_ARGS = ""
 # 分析対象のサンプルファイル
 ABSOLUTE_FILE_PATH = "/workspaces/esio/amazon-comprehend/sample-text/sample.md"
 
+# このサイズ(バイト)を超えるファイルは全文を読み込まずストリーミングで分析する
+STREAMING_THRESHOLD_BYTES = 10 * 1024 * 1024
+
+# 形態素解析結果をディスクにキャッシュし、内容・辞書・フィルタ設定が同じなら再利用する
+USE_TOKEN_CACHE = True
+
+# 複数ファイルの頻出単語分析で使う単語頻度インデックスの保存先（変更のあったファイルだけ再集計する）
+TERM_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'term_index.json')
+
+# 表示する頻出単語の件数
+TOP_N = 15
+
+# 近似カウント（Space-Saving）で監視する単語数の上限。メモリ使用量はこの値で一定になる
+HEAVY_HITTERS_CAPACITY = 1000
+
 # --- 関数定義 ---
 
+_tokenizer = None
+
+def get_tokenizer():
+    """
+    頻出単語分析用のトークナイザを取得する（初回呼び出し時のみ生成）
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = create_frequency_tokenizer(MECAB_ARGS)
+    return _tokenizer
+
+_token_cache = None
+
+def get_token_cache():
+    """
+    形態素解析結果のキャッシュを取得する（初回呼び出し時のみ生成）
+    """
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache()
+    return _token_cache
+
+def tokenize_with_cache(text, tokenizer=None):
+    """
+    キャッシュがあればそれを使い、なければ形態素解析してキャッシュに保存する
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    if not USE_TOKEN_CACHE:
+        return tokenizer.tokenize(text)
+
+    cache = get_token_cache()
+    key = cache.make_key(hash_text(text), tokenizer)
+    return cache.get_or_compute(key, lambda: {'words': tokenizer.tokenize(text)})['words']
+
 def analyze_word_frequency_with_mecab(text):
     """
     MeCabを使ってテキストの単語出現頻度を分析する関数。
     品詞フィルタリング、原型化、ストップワード除去などのベストプラクティスを適用します。
     """
     try:
-        # MeCabの初期化
-        tagger = MeCab.Tagger(MECAB_ARGS)
-        tagger.parse('') # UnicodeDecodeErrorを避けるためのおまじない
+        # Tagger とフィルタ設定は共有のトークナイザで1度だけ生成する
+        tokenizer = get_tokenizer()
 
         print("--- MeCabによる頻出単語分析（ベストプラクティス適用） ---")
         print("品詞フィルタリング、原型化、ストップワード除去などを行い、意味のある単語を抽出します。")
 
-        node = tagger.parseToNode(text)
-        words = []
-        # ストップワードの定義（カタカナの原型も追加）
-        stop_words = ['こと', 'もの', 'ため', 'これ', 'それ', 'あれ', '私', 'よう', 'さん', 
-                      'する', 'いる', 'なる', 'ある', 'いう', 'スル', 'イル']
+        words = tokenize_with_cache(text, tokenizer)
 
-        while node:
-            # BOS/EOS (文頭・文末) や空のノードはスキップ
-            if node.surface == "":
-                node = node.next
-                continue
+        print_top_words(Counter(words).most_common(TOP_N))
+
+    except RuntimeError as e:
+        print_mecab_runtime_error(e)
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+
+def count_words_streaming(source=None, tokenizer=None, path=None):
+    """
+    テキスト、テキストのイテラブル、または path のファイルを文境界ごとのチャンクに分けて
+    MeCabに渡し、単語の出現回数を逐次 Counter に加算する
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    word_counts = Counter()
+    for words in tokenizer.tokenize_stream(source, path=path):
+        word_counts.update(words)
+    return word_counts
+
+def analyze_word_frequency_streaming(source=None, path=None):
+    """
+    巨大なファイル向けのストリーミング版頻出単語分析。
+    全文をメモリに読み込まず、チャンク単位で形態素解析します。
+    """
+    try:
+        print("--- MeCabによる頻出単語分析（ストリーミング） ---")
+        print("テキストを文単位のチャンクに分割しながら、意味のある単語を抽出します。")
 
-            # 品詞情報などをカンマ区切りで取得
-            features = node.feature.split(',')
-            
-            # エラー回避: featuresの要素数が足りない場合はスキップ
-            if len(features) < 7:
-                node = node.next
+        print_top_words(count_words_streaming(source, path=path).most_common(TOP_N))
+
+    except RuntimeError as e:
+        print_mecab_runtime_error(e)
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+
+def count_words_approximate(source=None, capacity=HEAVY_HITTERS_CAPACITY, tokenizer=None, on_chunk=None, path=None):
+    """
+    ストリーミング処理と同じフィルタリングを適用しつつ、
+    Space-Saving で固定メモリの近似カウントを行う
+    on_chunk を渡すとチャンクごとに (チャンク番号, カウンタ) で呼び出す
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    counter = SpaceSavingCounter(capacity)
+    for i, words in enumerate(tokenizer.tokenize_stream(source, path=path), 1):
+        counter.update(words)
+        if on_chunk:
+            on_chunk(i, counter)
+    return counter
+
+def analyze_word_frequency_approximate(source=None, capacity=HEAVY_HITTERS_CAPACITY, report_every=None, path=None):
+    """
+    終わりのないテキストストリーム（SNSフィードなど）向けの近似頻出単語分析。
+    report_every チャンクごとに途中経過のランキングを表示します。
+    """
+    def report(i, counter):
+        if report_every and i % report_every == 0:
+            print_approximate_top_words(counter)
+
+    try:
+        print("--- MeCabによる頻出単語分析（近似カウント） ---")
+        print(f"最大{capacity}語を監視し、固定メモリで頻出単語を推定します。")
+
+        print_approximate_top_words(count_words_approximate(source, capacity, on_chunk=report, path=path))
+
+    except RuntimeError as e:
+        print_mecab_runtime_error(e)
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+
+def print_approximate_top_words(counter):
+    """
+    近似カウントの上位単語を誤差の範囲つきで表示する
+    """
+    print(f"\n頻繁に出現する意味のある単語の推定 (トップ{TOP_N}, 総単語数: {counter.total}):")
+    top_words = counter.most_common(TOP_N)
+    if top_words:
+        for word, count, error, guaranteed in top_words:
+            mark = "" if guaranteed else " ※順位未確定"
+            print(f"- {word}: {count - error}〜{count}回{mark}")
+        print(f"(誤差の上限: {counter.max_error}回)")
+    else:
+        print("分析対象の単語が見つかりませんでした。")
+
+def analyze_corpus_word_frequency(file_paths, index_path=TERM_INDEX_PATH):
+    """
+    複数ファイル全体の頻出単語を分析する関数。
+    前回の単語頻度インデックスを読み込み、内容やフィルタ設定が変わったファイルだけを
+    追加・置換・削除するため、処理量はコーパス全体ではなく変更分に比例します。
+    """
+    try:
+        tokenizer = get_tokenizer()
+        index = TermFrequencyIndex.load_or_create(index_path)
+
+        print("--- MeCabによる頻出単語分析（複数ファイル） ---")
+
+        doc_ids = set()
+        updated = 0
+        for path in file_paths:
+            doc_id = os.path.abspath(path)
+            doc_ids.add(doc_id)
+            version = f"{hash_file(path)}:{tokenizer.config_fingerprint()}"
+            if index.is_current(doc_id, version):
                 continue
 
-            pos = features[0]         # 品詞
-            pos_detail1 = features[1] # 品詞細分類1
-            original_form = features[6] # 原型
-            surface_form = node.surface # 表層形
-
-            # 抽出対象の品詞を定義 (名詞、動詞、形容詞、副詞)
-            target_pos = ['名詞', '動詞', '形容詞', '副詞']
-
-            if pos in target_pos:
-                # 品詞によって原型を使うか表層形を使うか選択
-                if pos in ['動詞', '形容詞']:
-                    word_to_check = original_form
-                else: # 名詞、副詞など
-                    word_to_check = surface_form
-
-                # フィルタリング処理
-                is_valid = True
-                # 1. 除外する品詞細分類（名詞の場合）
-                if pos == '名詞' and pos_detail1 in ['非自立', '代名詞', '数', '接尾', '接続詞的']:
-                    is_valid = False
-                # 2. 単語が'*'や空の場合は除外
-                if word_to_check == '*' or not word_to_check:
-                    is_valid = False
-                # 3. ストップワードに含まれていれば除外
-                if word_to_check in stop_words:
-                    is_valid = False
-                # 4. 1文字のひらがな・カタカナは除外 (漢字やアルファベットは残す)
-                if len(word_to_check) == 1 and re.fullmatch(r'[ぁ-んァ-ヶ]', word_to_check):
-                    is_valid = False
-
-                if is_valid:
-                    words.append(word_to_check)
-            
-            node = node.next
-        
-        word_counts = Counter(words)
-        print("\n最も頻繁に出現する意味のある単語 (トップ15):")
-        if word_counts:
-            for word, count in word_counts.most_common(15):
-                print(f"- {word}: {count}回")
-        else:
-            print("分析対象の単語が見つかりませんでした。")
+            with metrics.timer('file_read'), open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            index.add_document(doc_id, tokenize_with_cache(text, tokenizer), version)
+            updated += 1
+
+        removed = [doc_id for doc_id in index.doc_terms if doc_id not in doc_ids]
+        for doc_id in removed:
+            index.remove_document(doc_id)
+
+        print(f"対象ファイル数: {len(index)} (更新: {updated}, 削除: {len(removed)})")
+        print_top_words(index.most_common(TOP_N))
+
+        if index_path:
+            index.save(index_path)
+        return index
 
     except RuntimeError as e:
-        print(f"MeCabの実行エラー: {e}")
-        print("MeCabまたは辞書が正しくインストールされていない可能性があります。")
-        print("ノートブックのセルで `!pip install mecab-python3 ipadic` を実行してください。")
+        print_mecab_runtime_error(e)
     except Exception as e:
         print(f"エラーが発生しました: {e}")
 
+def print_top_words(top_words):
+    """
+    出現回数の多い単語 [(単語, 回数), ...] を表示する
+    """
+    print(f"\n最も頻繁に出現する意味のある単語 (トップ{TOP_N}):")
+    if top_words:
+        for word, count in top_words:
+            print(f"- {word}: {count}回")
+    else:
+        print("分析対象の単語が見つかりませんでした。")
+
+def print_mecab_runtime_error(e):
+    print(f"MeCabの実行エラー: {e}")
+    print("MeCabまたは辞書が正しくインストールされていない可能性があります。")
+    print("ノートブックのセルで `!pip install mecab-python3 ipadic` を実行してください。")
+
 # --- メイン処理 ---
 
 if __name__ == '__main__':
     try:
-        with open(ABSOLUTE_FILE_PATH, 'r', encoding='utf-8') as f:
-            sample_text = f.read()
-        
-        analyze_word_frequency_with_mecab(sample_text)
+        if os.path.getsize(ABSOLUTE_FILE_PATH) > STREAMING_THRESHOLD_BYTES:
+            analyze_word_frequency_streaming(path=ABSOLUTE_FILE_PATH)
+        else:
+            with metrics.timer('file_read'), open(ABSOLUTE_FILE_PATH, 'r', encoding='utf-8') as f:
+                sample_text = f.read()
+
+            analyze_word_frequency_with_mecab(sample_text)
 
     except FileNotFoundError:
         print(f"エラー: ファイルが見つかりません。パスを確認してください: {ABSOLUTE_FILE_PATH}")
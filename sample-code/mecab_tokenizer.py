@@ -0,0 +1,297 @@
+"""
+MeCab による形態素解析と単語フィルタリングを共通化したトークナイザ
+mecab_analysis.py と doc2vec_analysis.py の両方から利用します
+"""
+
+import functools
+import hashlib
+import json
+import re
+
+import MeCab
+
+import metrics
+
+# --- 設定 ---
+MECAB_ARGS = ""
+
+# mecab_analysis.py 向けのストップワード（カタカナの原型も含む）
+BASIC_STOP_WORDS = frozenset([
+    'こと', 'もの', 'ため', 'これ', 'それ', 'あれ', '私', 'よう', 'さん',
+    'する', 'いる', 'なる', 'ある', 'いう', 'スル', 'イル'
+])
+
+# doc2vec_analysis.py 向けの拡張されたストップワード
+EXTENDED_STOP_WORDS = frozenset([
+    # 基本的な機能語
+    'こと', 'もの', 'ため', 'これ', 'それ', 'あれ', 'どれ', 'よう', 'さん', 'ところ',
+    'とき', 'とこ', 'など', 'なに', 'なん', 'どこ', 'いつ', 'だれ', 'どう', 'なぜ',
+
+    # 代名詞・指示語
+    '私', '僕', '俺', '君', '彼', '彼女', 'あなた', 'みなさん', 'みんな',
+    'ここ', 'そこ', 'あそこ', 'どこか', 'いま', 'いつか', 'どこでも',
+
+    # 助詞的な名詞
+    '上', '下', '中', '前', '後', '左', '右', '横', '隣', '間', '内', '外',
+    '先', '奥', '手前', '向こう', '以上', '以下', '未満', '程度', '以外',
+
+    # 時間・頻度表現
+    '今日', '昨日', '明日', '今年', '去年', '来年', '今月', '先月', '来月',
+    '毎日', '毎回', '毎年', '毎月', '毎週', '常に', 'いつも', 'たまに',
+
+    # 数量・程度表現
+    '全て', '全部', 'すべて', '一部', '半分', '大部分', '少し', 'ちょっと',
+    'かなり', 'とても', 'すごく', 'めちゃくちゃ', '非常', '極めて',
+
+    # 接続・転換表現
+    'しかし', 'でも', 'だが', 'ただし', 'ところが', 'けれど', 'けれども',
+    'そして', 'また', 'さらに', 'それから', 'それで', 'そこで', 'つまり',
+
+    # 感嘆・応答表現
+    'はい', 'いいえ', 'ええ', 'うん', 'そう', 'そうです', 'なるほど',
+    'おお', 'ああ', 'うーん', 'えー', 'まあ', 'やはり', 'やっぱり',
+
+    # 一般的すぎる動詞・形容詞の語幹
+    'する', 'なる', 'ある', 'いる', 'できる', 'みる', 'いく', 'くる',
+    'いい', 'よい', '悪い', '大きい', '小さい', '新しい', '古い',
+
+    # ビジネス・技術文書でよく出る一般語
+    '場合', '状況', '状態', '方法', '手段', '方式', '形式', '種類', '方向',
+    '結果', '効果', '影響', '関係', '関連', '対象', '目的', '理由', '原因',
+    '問題', '課題', '解決', '改善', '向上', '発展', '進歩', '変化', '変更',
+
+    # 単位・助数詞的表現
+    '個', '本', '枚', '台', '人', '回', '度', '倍', '割', 'パーセント',
+    '時間', '分', '秒', '日', '週間', 'ヶ月', '年間', 'メートル', 'キロ'
+])
+
+# ストリーミング処理で1度に MeCab へ渡す文字数の目安
+STREAM_CHUNK_SIZE = 8192
+# チャンクの区切りに使う文末・段落の境界文字
+SENTENCE_BOUNDARIES = ('。', '！', '？', '!', '?', '\n')
+
+SINGLE_KANA_PATTERN = re.compile(r'[ぁ-んァ-ヶ]')
+NUMERIC_PATTERN = re.compile(r'[0-9]+')
+
+
+class MecabTokenizer:
+    """
+    MeCab の Tagger を1度だけ生成し、品詞・ストップワードのルールを
+    frozenset として保持して繰り返し利用するトークナイザ
+    """
+
+    def __init__(self, mecab_args=MECAB_ARGS,
+                 target_pos=('名詞', '動詞', '形容詞', '副詞'),
+                 base_form_pos=('動詞', '形容詞'),
+                 excluded_noun_details=('非自立', '代名詞', '数', '接尾', '接続詞的'),
+                 stop_words=BASIC_STOP_WORDS,
+                 min_length=1,
+                 exclude_single_kana=True,
+                 exclude_numeric=False):
+        self.mecab_args = mecab_args
+        self.target_pos = frozenset(target_pos)
+        self.base_form_pos = frozenset(base_form_pos)
+        self.excluded_noun_details = frozenset(excluded_noun_details)
+        self.stop_words = frozenset(stop_words)
+        self.min_length = min_length
+        self.exclude_single_kana = exclude_single_kana
+        self.exclude_numeric = exclude_numeric
+        self._tagger = None
+        self._fingerprint = None
+
+    @property
+    def tagger(self):
+        """
+        Tagger は初回利用時に1度だけ生成する
+        """
+        if self._tagger is None:
+            tagger = MeCab.Tagger(self.mecab_args)
+            tagger.parse('')  # UnicodeDecodeErrorを避けるためのおまじない
+            self._tagger = tagger
+        return self._tagger
+
+    def __getstate__(self):
+        # Tagger は pickle できないため、プロセス間で受け渡す際は設定のみ渡す
+        state = self.__dict__.copy()
+        state['_tagger'] = None
+        return state
+
+    def dictionary_id(self):
+        """
+        使用中の MeCab 辞書（ipadic / unidic-lite など）を識別する文字列を返す
+        """
+        info = self.tagger.dictionary_info()
+        dictionaries = []
+        while info:
+            dictionaries.append(f"{info.filename}:{info.version}")
+            info = info.next
+        return ';'.join(dictionaries)
+
+    def config_fingerprint(self):
+        """
+        辞書とフィルタ設定のフィンガープリント（いずれかが変われば値も変わる）
+        """
+        if self._fingerprint is not None:
+            return self._fingerprint
+
+        config = {
+            'mecab_args': self.mecab_args,
+            'dictionary': self.dictionary_id(),
+            'target_pos': sorted(self.target_pos),
+            'base_form_pos': sorted(self.base_form_pos),
+            'excluded_noun_details': sorted(self.excluded_noun_details),
+            'stop_words': sorted(self.stop_words),
+            'min_length': self.min_length,
+            'exclude_single_kana': self.exclude_single_kana,
+            'exclude_numeric': self.exclude_numeric,
+        }
+        payload = json.dumps(config, ensure_ascii=False, sort_keys=True)
+        self._fingerprint = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    def is_valid_word(self, word, pos, pos_detail1):
+        """
+        品詞とフィルタ設定に基づいて単語を採用するか判定する
+        """
+        if word == '*' or not word:
+            return False
+        if pos == '名詞' and pos_detail1 in self.excluded_noun_details:
+            return False
+        if word in self.stop_words:
+            return False
+        if len(word) < self.min_length:
+            return False
+        if self.exclude_single_kana and len(word) == 1 and SINGLE_KANA_PATTERN.fullmatch(word):
+            return False
+        if self.exclude_numeric and NUMERIC_PATTERN.fullmatch(word):
+            return False
+        return True
+
+    def tokenize(self, text, pos_stats=None):
+        """
+        テキストを形態素解析し、フィルタリング済みの単語リストを返す
+        pos_stats に Counter を渡すと品詞ごとの出現数を集計する
+        """
+        with metrics.timer('tokenize'):
+            words, node_count = self._tokenize(text, pos_stats)
+        metrics.inc('mecab_nodes_total', node_count)
+        metrics.inc('words_kept_total', len(words))
+        return words
+
+    def _tokenize(self, text, pos_stats):
+        target_pos = self.target_pos
+        base_form_pos = self.base_form_pos
+        is_valid_word = self.is_valid_word
+        words = []
+        node_count = 0
+
+        node = self.tagger.parseToNode(text)
+        while node:
+            surface_form = node.surface
+            # BOS/EOS (文頭・文末) や空のノードはスキップ
+            if not surface_form:
+                node = node.next
+                continue
+
+            # 必要なのは原型(7番目)までなので、それ以降は分割しない
+            features = node.feature.split(',', 7)
+            node = node.next
+            # エラー回避: featuresの要素数が足りない場合はスキップ
+            if len(features) < 7:
+                continue
+
+            node_count += 1
+            pos = features[0]
+            if pos_stats is not None:
+                pos_stats[pos] += 1
+
+            if pos not in target_pos:
+                continue
+
+            # 品詞によって原型を使うか表層形を使うか選択
+            word = features[6] if pos in base_form_pos else surface_form
+            if is_valid_word(word, pos, features[1]):
+                words.append(word)
+
+        return words, node_count
+
+    def tokenize_many(self, texts):
+        """
+        複数のテキストを同じ Tagger でまとめて処理する
+        """
+        return [self.tokenize(text) for text in texts]
+
+    def tokenize_stream(self, source=None, chunk_size=STREAM_CHUNK_SIZE, pos_stats=None, path=None):
+        """
+        テキスト、テキスト断片のイテラブル、または path のファイルを文境界で分割しながら処理し、
+        チャンクごとの単語リストを順に返す（path なら全文をメモリに載せない）
+        """
+        for chunk in iter_text_chunks(source, chunk_size, path=path):
+            yield self.tokenize(chunk, pos_stats=pos_stats)
+
+
+def create_frequency_tokenizer(mecab_args=MECAB_ARGS):
+    """
+    mecab_analysis.py の頻出単語分析向けトークナイザを生成する
+    """
+    return MecabTokenizer(mecab_args=mecab_args)
+
+
+def create_doc2vec_tokenizer(mecab_args=MECAB_ARGS):
+    """
+    doc2vec_analysis.py の前処理向けトークナイザを生成する
+    """
+    return MecabTokenizer(
+        mecab_args=mecab_args,
+        target_pos=('名詞', '動詞', '形容詞'),
+        excluded_noun_details=('数', '非自立', '代名詞'),
+        stop_words=EXTENDED_STOP_WORDS,
+        min_length=2,
+        exclude_single_kana=False,
+        exclude_numeric=True,
+    )
+
+
+def iter_text_chunks(source=None, chunk_size=STREAM_CHUNK_SIZE, path=None):
+    """
+    テキストを文末・段落の境界で chunk_size 文字程度のチャンクに分割して返す
+    source はテキストそのもの（文字列）またはテキスト断片のイテラブル（ファイルオブジェクトなど）
+    path を指定した場合はファイルを chunk_size 文字ずつ読み込む
+    """
+    if path is not None:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from iter_text_chunks(iter(functools.partial(f.read, chunk_size), ''), chunk_size)
+        return
+    if isinstance(source, str):
+        source = (source,)
+
+    # 断片はリストに溜めて chunk_size に達したときだけ連結し、
+    # 切り出しは開始位置をずらして行う（残りの文字列を毎回作り直さない）
+    pending = []
+    pending_length = 0
+    for piece in source:
+        pending.append(piece)
+        pending_length += len(piece)
+        if pending_length < chunk_size:
+            continue
+
+        buffer = ''.join(pending)
+        start = 0
+        while len(buffer) - start >= chunk_size:
+            cut = _find_chunk_boundary(buffer, start, chunk_size)
+            yield buffer[start:cut]
+            start = cut
+        rest = buffer[start:]
+        pending = [rest] if rest else []
+        pending_length = len(rest)
+
+    rest = ''.join(pending)
+    if rest:
+        yield rest
+
+
+def _find_chunk_boundary(buffer, start, chunk_size):
+    # start から chunk_size 以内で最後の文境界の直後で切る。境界がなければ chunk_size で切る
+    end = start + chunk_size
+    cut = max(buffer.rfind(boundary, start, end) for boundary in SENTENCE_BOUNDARIES)
+    return cut + 1 if cut >= 0 else end
@@ -0,0 +1,260 @@
+"""
+各分析モジュール共通の軽量な計測レイヤ
+処理段階ごとのタイマー・カウンター・ヒストグラムを記録し、
+JSON または Prometheus のテキスト形式で出力します
+
+コードを変更せずに有効化できるよう、環境変数で出力先を指定します
+    TEXT_MINING_METRICS=metrics.json      終了時に JSON で出力
+    TEXT_MINING_METRICS=metrics.prom      終了時に Prometheus 形式で出力
+    TEXT_MINING_TRACEMALLOC=1             tracemalloc のメモリスナップショットも出力
+"""
+
+import atexit
+import bisect
+import contextlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import tracemalloc
+
+# --- 設定 ---
+METRICS_PATH_ENV = "TEXT_MINING_METRICS"
+TRACEMALLOC_ENV = "TEXT_MINING_TRACEMALLOC"
+METRIC_PREFIX = "text_mining_"
+# 処理時間ヒストグラムのバケット境界（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+TRACEMALLOC_TOP_N = 10
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, state):
+        for i, count in enumerate(state['counts']):
+            self.counts[i] += count
+        self.sum += state['sum']
+        self.count += state['count']
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts),
+                'sum': self.sum, 'count': self.count}
+
+
+class MetricsRegistry:
+    """
+    カウンターとヒストグラムをメトリクス名とラベルの組で保持する
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # 名前 -> {ラベルのタプル: 値}
+        self.histograms = {}  # 名前 -> {ラベルのタプル: Histogram}
+
+    @staticmethod
+    def _label_key(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, stage, **labels):
+        """
+        with ブロックの処理時間を stage ごとのヒストグラムに記録する
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    @contextlib.contextmanager
+    def api_call(self, service, operation):
+        """
+        リモートAPI呼び出しの処理時間・呼び出し回数・エラー回数を記録する
+        """
+        self.inc('api_calls_total', service=service, operation=operation)
+        try:
+            with self.timer('remote_api', service=service, operation=operation):
+                yield
+        except Exception as e:
+            self.inc('api_errors_total', service=service, operation=operation, error=type(e).__name__)
+            raise
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'counters': {
+                    name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+                'histograms': {
+                    name: [{'labels': dict(key), **hist.to_dict()} for key, hist in series.items()]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def drain(self):
+        """
+        現在の値を返してリセットする（ワーカープロセスから親へ渡す用）
+        """
+        state = self.to_dict()
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+        return state
+
+    def merge(self, state):
+        """
+        to_dict() / drain() の結果を取り込む
+        """
+        with self._lock:
+            for name, entries in state['counters'].items():
+                series = self.counters.setdefault(name, {})
+                for entry in entries:
+                    key = self._label_key(entry['labels'])
+                    series[key] = series.get(key, 0) + entry['value']
+            for name, entries in state['histograms'].items():
+                series = self.histograms.setdefault(name, {})
+                for entry in entries:
+                    key = self._label_key(entry['labels'])
+                    if key not in series:
+                        series[key] = Histogram(entry['buckets'])
+                    series[key].merge(entry)
+
+    def to_json(self, memory_snapshot=None):
+        data = self.to_dict()
+        if memory_snapshot is not None:
+            data['memory'] = memory_snapshot
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, memory_snapshot=None):
+        """
+        Prometheus のテキスト形式（exposition format）で出力する
+        """
+        lines = []
+        if memory_snapshot is not None:
+            for key in ('current_bytes', 'peak_bytes'):
+                metric = f"{METRIC_PREFIX}tracemalloc_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {memory_snapshot[key]}")
+
+        state = self.to_dict()
+        for name, entries in sorted(state['counters'].items()):
+            metric = METRIC_PREFIX + name
+            lines.append(f"# TYPE {metric} counter")
+            for entry in entries:
+                lines.append(f"{metric}{_format_labels(entry['labels'])} {entry['value']}")
+
+        for name, entries in sorted(state['histograms'].items()):
+            metric = METRIC_PREFIX + name
+            lines.append(f"# TYPE {metric} histogram")
+            for entry in entries:
+                cumulative = 0
+                for bound, count in zip(list(entry['buckets']) + ['+Inf'], entry['counts']):
+                    cumulative += count
+                    labels = dict(entry['labels'], le=str(bound))
+                    lines.append(f"{metric}_bucket{_format_labels(labels)} {cumulative}")
+                lines.append(f"{metric}_sum{_format_labels(entry['labels'])} {entry['sum']}")
+                lines.append(f"{metric}_count{_format_labels(entry['labels'])} {entry['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, memory_snapshot=None):
+        """
+        拡張子が .prom / .txt なら Prometheus 形式、それ以外は JSON で保存する
+        """
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus(memory_snapshot)
+        else:
+            content = self.to_json(memory_snapshot)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in sorted(labels.items())) + '}'
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# --- メモリスナップショット ---
+
+def start_memory_tracking():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def memory_snapshot(top_n=TRACEMALLOC_TOP_N):
+    """
+    tracemalloc の現在値・ピーク値と、確保量の多いコード行の上位を返す
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    current, peak = tracemalloc.get_traced_memory()
+    stats = tracemalloc.take_snapshot().statistics('lineno')[:top_n]
+    return {
+        'current_bytes': current,
+        'peak_bytes': peak,
+        'top_allocations': [
+            {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+            for stat in stats
+        ],
+    }
+
+
+# --- 共有レジストリ ---
+REGISTRY = MetricsRegistry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+api_call = REGISTRY.api_call
+
+
+def export(path=None):
+    """
+    計測結果をファイルに保存する（path 省略時は環境変数の出力先）
+    """
+    path = path or os.environ.get(METRICS_PATH_ENV)
+    if path:
+        REGISTRY.write(path, memory_snapshot())
+
+
+def _export_at_exit():
+    # ワーカープロセスの計測値は親プロセスに集約するため、親プロセスだけが出力する
+    if multiprocessing.parent_process() is None:
+        export()
+
+
+def _configure_from_env():
+    if os.environ.get(TRACEMALLOC_ENV):
+        start_memory_tracking()
+    if os.environ.get(METRICS_PATH_ENV):
+        atexit.register(_export_at_exit)
+
+
+_configure_from_env()
@@ -0,0 +1,136 @@
+"""
+AWS API 呼び出しの流量制限と再試行
+トークンバケットで1秒あたりのリクエスト数を抑え、スロットリングなど再試行可能なエラーや
+接続の切断・タイムアウトはジッター付きの指数バックオフで再試行します（comprehend_runner.py と bedrock_runner.py で共通）
+"""
+
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+import metrics
+
+# --- 設定 ---
+MAX_ATTEMPTS = 6          # スロットリング時を含めた最大試行回数
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+RETRYABLE_ERROR_CODES = frozenset([
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+])
+# 通信エラー（接続できない・接続が切れた・応答のタイムアウトなど）も一時的なものとして再試行する
+# （botocore 側の再試行を止めたクライアントでも、通信エラー1回でバッチ全体を失敗させない）
+RETRYABLE_EXCEPTIONS = (BotoConnectionError, HTTPClientError)
+ADAPTIVE_DECREASE_FACTOR = 0.5  # スロットリングされたら流量をこの倍率に下げる
+ADAPTIVE_INCREASE_RATIO = 0.05  # 成功するたびに上限の流量のこの割合ずつ戻す
+
+
+class TokenBucket:
+    """
+    1秒あたり rate 回まで（瞬間的には capacity 回まで）の実行を許可するレートリミッタ
+    スレッド間で共有して使う
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate は正の値を指定してください")
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        トークンを1つ取得する（足りなければ補充されるまで待つ）
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        """
+        呼び出しが成功したときに呼ばれる（固定レートでは何もしない）
+        """
+
+    def on_throttle(self):
+        """
+        スロットリングされたときに呼ばれる（固定レートでは何もしない）
+        """
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    スロットリングに応じて流量を自動調整するトークンバケット（AIMD）
+    スロットリングされたら rate を半分に下げ、成功するたびに max_rate まで少しずつ戻す
+    """
+
+    def __init__(self, max_rate, min_rate=None, capacity=None,
+                 decrease_factor=ADAPTIVE_DECREASE_FACTOR, increase_ratio=ADAPTIVE_INCREASE_RATIO):
+        super().__init__(max_rate, capacity)
+        self.max_rate = max_rate
+        self.min_rate = min_rate or max_rate / 20
+        self.decrease_factor = decrease_factor
+        self.increase_step = max_rate * increase_ratio
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # 貯まっていたトークンも捨て、以降は下げた流量で送る
+            self._tokens = min(self._tokens, 0.0)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, maximum=BACKOFF_MAX_SECONDS):
+    """
+    attempt 回目の再試行までの待ち時間（指数バックオフ + フルジッター）
+    """
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def call_with_retry(func, limiter=None, max_attempts=MAX_ATTEMPTS, sleep=time.sleep, service='aws'):
+    """
+    func() を呼び出し、スロットリングなど再試行可能なエラーや通信エラーならバックオフして再試行する
+    limiter が指定されていれば、毎回の呼び出し前にトークンを取得し、結果を limiter に伝える
+    （通信エラーはスロットリングではないため、limiter の流量は下げない）
+    """
+    for attempt in range(max_attempts):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = func()
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code not in RETRYABLE_ERROR_CODES:
+                raise
+            if limiter is not None:
+                limiter.on_throttle()
+            if attempt == max_attempts - 1:
+                raise
+            metrics.inc('api_retries_total', service=service, error=code)
+            sleep(backoff_delay(attempt))
+        except RETRYABLE_EXCEPTIONS as e:
+            if attempt == max_attempts - 1:
+                raise
+            metrics.inc('api_retries_total', service=service, error=type(e).__name__)
+            sleep(backoff_delay(attempt))
+        else:
+            if limiter is not None:
+                limiter.on_success()
+            return result
@@ -0,0 +1,184 @@
+"""
+Comprehend・Bedrock の API 応答のディスクキャッシュ
+操作名・リージョンやモデル・推論設定・入力テキストのハッシュをキーにして SQLite に保存し、
+同じテキストを再分析するときは API を呼ばずに保存済みの応答を返します
+"""
+
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from token_cache import hash_text
+
+# --- 設定 ---
+RESPONSE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'responses.sqlite3')
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024     # キャッシュ全体の上限サイズ（超えたら古いものから削除）
+RESPONSE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 応答の有効期限（モデルの更新に追従するため）
+RESPONSE_CACHE_EVICT_INTERVAL = 100             # 上限を超えていなくても、この回数の put ごとに有効期限切れを削除する
+# この環境変数が 0 ならキャッシュを使わずに毎回 API を呼び出す（呼び出しのたびに確認する）
+RESPONSE_CACHE_ENV = 'TEXT_MINING_RESPONSE_CACHE'
+
+
+class ResponseCache:
+    """
+    API 応答（JSON にできる値）を SQLite に保存する、有効期限付きの LRU キャッシュ
+    スレッド間で共有して使える
+
+    合計サイズは接続を開いたときに1度だけ数え、以降は追加・削除のたびに差分で更新する
+    削除は合計サイズが上限を超えたときと、evict_interval 回の put ごとにだけ行う
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, evict_interval=RESPONSE_CACHE_EVICT_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._total_bytes = 0       # キャッシュ全体の合計サイズ
+        self._puts_since_evict = 0
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            # 接続は1つだけ作り、スレッド間ではロックで排他する
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+            conn.execute('CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)')
+            conn.commit()
+            self._total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(service, operation, text, **params):
+        """
+        サービス・操作名・入力テキストの内容ハッシュ・その他の条件（リージョン、モデル、推論設定など）からキーを作る
+        """
+        raw = json.dumps({'service': service, 'operation': operation, 'text': hash_text(text), 'params': params},
+                         sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        保存済みの応答を返す（なければ、または有効期限切れなら None）
+        ヒット・ミスの件数を数える
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('SELECT value, created_at, size FROM responses WHERE key = ?',
+                                    (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                with self.conn:
+                    self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._total_bytes -= row[2]
+                row = None
+
+            if row is None:
+                self.misses += 1
+                metrics.inc('response_cache_requests_total', result='miss')
+                return None
+
+            self.hits += 1
+            metrics.inc('response_cache_requests_total', result='hit')
+            with self.conn:
+                self.conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            with self.conn:
+                old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    (key, payload, size, now, now)
+                )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._puts_since_evict += 1
+            if self._total_bytes > self.max_bytes or self._puts_since_evict >= self.evict_interval:
+                self.evict()
+
+    def evict(self):
+        """
+        有効期限切れの応答を削除し、合計サイズが上限を超えていれば最後に参照されたのが古い順に削除する
+        """
+        with self._lock:
+            self._puts_since_evict = 0
+            if self.ttl_seconds is not None:
+                cutoff = time.time() - self.ttl_seconds
+                with self.conn:
+                    expired = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?',
+                                                (cutoff,)).fetchone()[0]
+                    self.conn.execute('DELETE FROM responses WHERE created_at < ?', (cutoff,))
+                self._total_bytes -= expired
+
+            total = self._total_bytes
+            if total <= self.max_bytes:
+                return
+
+            victims = []
+            for key, size in self.conn.execute('SELECT key, size FROM responses ORDER BY last_access ASC'):
+                if total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+
+            with self.conn:
+                self.conn.executemany('DELETE FROM responses WHERE key = ?', victims)
+            self._total_bytes = total
+
+    def stats(self):
+        """
+        このプロセスでのヒット・ミス件数と、キャッシュ全体の件数・サイズを返す
+        """
+        with self._lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._total_bytes = 0
+
+
+def response_cache_enabled():
+    """
+    環境変数 TEXT_MINING_RESPONSE_CACHE が 0 でなければ True
+    """
+    return os.environ.get(RESPONSE_CACHE_ENV, '1') != '0'
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_response_cache():
+    return ResponseCache()
+
+
+def get_response_cache():
+    """
+    プロセス内で共有するキャッシュを返す（TEXT_MINING_RESPONSE_CACHE=0 なら None）
+    """
+    return _shared_response_cache() if response_cache_enabled() else None
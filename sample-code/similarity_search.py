@@ -0,0 +1,145 @@
+"""
+ベクトル集合の類似度計算（ブロック単位の行列積）
+正規化したベクトル行列どうしの積をメモリ上限に収まる行数ずつ計算し、
+全ペアを Python のループで比較せずに上位k件の近傍や類似ペアを求めます
+"""
+
+import numpy as np
+
+# --- 設定 ---
+SIMILARITY_MEMORY_BUDGET = 256 * 1024 * 1024  # 1ブロックの計算に使うメモリの目安（バイト）
+# 1要素あたり float32 の何倍のメモリを見込むか
+# 類似度行列（4バイト）+ 部分ソート用の符号反転したコピー（4バイト）+ argpartition の int64 の添字（8バイト）
+# 全ペアの上位ペアの抽出は類似度行列を書き換えて使うため、これ以上は増えない
+BLOCK_MEMORY_FACTOR = 4
+
+
+def normalize_rows(vectors):
+    """
+    各行を長さ1に正規化した float32 の行列を返す（長さ0の行は0のまま）
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def rows_per_block(n_targets, memory_budget=SIMILARITY_MEMORY_BUDGET):
+    """
+    n_targets 列の類似度ブロックをメモリ上限内で何行ずつ計算できるか
+    """
+    bytes_per_row = max(1, n_targets) * np.dtype(np.float32).itemsize * BLOCK_MEMORY_FACTOR
+    return max(1, memory_budget // bytes_per_row)
+
+
+def iter_similarity_blocks(queries, targets, memory_budget=SIMILARITY_MEMORY_BUDGET):
+    """
+    正規化済みの queries と targets のコサイン類似度を行ブロックごとに返す
+    (開始行, ブロック行列) を順に yield する
+    """
+    block_rows = rows_per_block(len(targets), memory_budget)
+    for start in range(0, len(queries), block_rows):
+        yield start, queries[start:start + block_rows] @ targets.T
+
+
+def top_k_from_block(block, k):
+    """
+    ブロックの各行について類似度の高い順に上位k件の (列番号, 類似度) を返す
+    """
+    k = min(k, block.shape[1])
+    if k <= 0:
+        empty = np.empty((block.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    # 上位k件だけを部分ソートで取り出し、その中だけを並べ替える
+    candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(block, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def search_top_k(queries, targets, k, exclude=None, memory_budget=SIMILARITY_MEMORY_BUDGET):
+    """
+    正規化済みの queries の各行について、targets のうち類似度の高い上位k件を求める
+    exclude には行ごとに除外する targets の行番号（除外しない行は -1）を渡す
+    (indices, scores) を返す（いずれも shape=(len(queries), k)）
+    """
+    k = max(0, min(k, len(targets) - (0 if exclude is None else 1)))
+    all_indices = np.empty((len(queries), k), dtype=np.int64)
+    all_scores = np.empty((len(queries), k), dtype=np.float32)
+    for start, block in iter_similarity_blocks(queries, targets, memory_budget):
+        end = start + len(block)
+        if exclude is not None:
+            rows = np.flatnonzero(exclude[start:end] >= 0)
+            block[rows, exclude[start:end][rows]] = -np.inf
+        all_indices[start:end], all_scores[start:end] = top_k_from_block(block, k)
+    return all_indices, all_scores
+
+
+def _top_upper_pairs(block, start, n_pairs):
+    """
+    ブロックの上三角（i < j）から類似度の高い n_pairs 件の (類似度, 行番号, 列番号) を返す
+    block はコピーせず作業領域として書き換える
+    """
+    rows = np.arange(start, start + len(block))
+    columns = np.arange(block.shape[1])
+    np.copyto(block, -np.inf, where=columns[None, :] <= rows[:, None])
+    # 符号を反転して小さい順に部分ソートする
+    negated = np.negative(block, out=block).ravel()
+    m = min(n_pairs, len(negated))
+    keep = np.argpartition(negated, m - 1)[:m]
+    scores = -negated[keep]
+    finite = np.isfinite(scores)
+    block_rows, block_cols = np.divmod(keep[finite], block.shape[1])
+    return scores[finite], block_rows + start, block_cols
+
+
+def _merge_top_pairs(best, scores, rows, cols, n_pairs):
+    scores = np.concatenate([best[0], scores])
+    rows = np.concatenate([best[1], rows])
+    cols = np.concatenate([best[2], cols])
+    if len(scores) > n_pairs:
+        keep = np.argpartition(-scores, n_pairs - 1)[:n_pairs]
+        scores, rows, cols = scores[keep], rows[keep], cols[keep]
+    return scores, rows, cols
+
+
+def all_pairs_similarity(vectors, k=5, n_pairs=10, memory_budget=SIMILARITY_MEMORY_BUDGET,
+                         on_block=None):
+    """
+    ベクトル集合の全ペアの類似度を1回の走査で集計する
+
+    戻り値は次のキーを持つ辞書:
+        'indices'  各行の近傍の行番号（類似度の高い順、自分自身は除く） shape=(n, k)
+        'scores'   上記の類似度 shape=(n, k)
+        'pairs'    類似度の高いペア (i, j, 類似度) のリスト（i < j、高い順に n_pairs 件）
+
+    on_block が指定されていれば、ブロックごとに on_block(開始行, indices, scores) を呼ぶ
+    （結果をファイルに逐次書き出す用途）
+    """
+    normed = normalize_rows(vectors)
+    n = len(normed)
+    k = max(0, min(k, n - 1))
+    n_pairs = max(0, n_pairs)
+
+    all_indices = np.empty((n, k), dtype=np.int64)
+    all_scores = np.empty((n, k), dtype=np.float32)
+    best = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    for start, block in iter_similarity_blocks(normed, normed, memory_budget):
+        rows = np.arange(start, start + len(block))
+
+        # 自分自身は近傍から除く
+        block[rows - start, rows] = -np.inf
+        indices, scores = top_k_from_block(block, k)
+        all_indices[rows] = indices
+        all_scores[rows] = scores
+        if on_block is not None:
+            on_block(start, indices, scores)
+
+        if n_pairs:
+            # 近傍を求めた後のブロックをそのまま作業領域にして、これまでの上位ペアと統合する
+            best = _merge_top_pairs(best, *_top_upper_pairs(block, start, n_pairs), n_pairs)
+
+    order = np.lexsort((best[2], best[1], -best[0]))
+    pairs = [(int(best[1][i]), int(best[2][i]), float(best[0][i])) for i in order]
+    return {'indices': all_indices, 'scores': all_scores, 'pairs': pairs}
@@ -0,0 +1,217 @@
+"""
+LLM のストリーミング出力から JSON オブジェクトを逐次取り出すパーサ
+converse_stream の差分テキストを受け取るたびに解析を進め、前後の説明文やコードブロックの
+囲み（```json など）は読み飛ばし、オブジェクトが閉じた時点で結果を確定します
+説明文中の閉じていない '{' などで JSON として不正になった候補は捨て、その '{' の直後から探し直します
+指定したキーの配列（例: "results"）の要素は、オブジェクトが閉じる前から1つずつ取り出せます
+"""
+
+import json
+
+# JSON の数値・true/false/null に使われる文字
+LITERAL_START_CHARS = frozenset("-0123456789tfn")
+LITERAL_CHARS = frozenset("+-.0123456789eEtrufalsn")
+WHITESPACE_CHARS = frozenset(" \t\r\n")
+
+# 次に来てよいトークン
+EXPECT_KEY_OR_END = "key_or_end"      # '{' の直後: キーか '}'
+EXPECT_KEY = "key"                    # オブジェクト内の ',' の後: キー
+EXPECT_COLON = "colon"                # キーの後: ':'
+EXPECT_VALUE = "value"                # ':' や配列内の ',' の後: 値
+EXPECT_VALUE_OR_END = "value_or_end"  # '[' の直後: 値か ']'
+EXPECT_COMMA_OR_END = "comma_or_end"  # 値の後: ',' か閉じ括弧
+_INVALID = object()
+
+
+def iter_stream_text(events, on_metadata=None):
+    """
+    converse_stream のイベント列から差分テキストを順に返す
+    on_metadata が指定されていれば、metadata イベント（トークン使用量など）を渡して呼ぶ
+    """
+    for event in events:
+        if "metadata" in event and on_metadata is not None:
+            on_metadata(event["metadata"])
+        if "contentBlockDelta" in event:
+            delta = event["contentBlockDelta"]["delta"]
+            if "text" in delta:
+                yield delta["text"]
+
+
+class StreamingJSONExtractor:
+    """
+    差分テキストを feed() で受け取り、key を含む最初の JSON オブジェクトを取り出す
+
+    - feed() は key の配列の要素のうち、その呼び出しで確定したものをリストで返す
+      （オブジェクト全体が閉じる前に返すため、最終的な結果は result で確認する）
+    - key を含むオブジェクトが閉じると result に解析結果が入り、以降の入力は解析しない
+    - 文字ごとに JSON の文法（次に来てよいトークン）を確かめ、不正になった候補は捨てて
+      候補の '{' の次の文字から探し直す。key を含まないオブジェクトは捨てて探索を続ける
+    """
+
+    def __init__(self, key="results"):
+        self.key = key
+        self.result = None
+        self._parts = []
+        self._reset()
+
+    def _reset(self):
+        self._buffer = []          # 解析中のオブジェクトの文字列（'{' から）
+        self._stack = []           # 開いている括弧（'{' または '['）。空ならオブジェクトの外
+        self._expect = None        # 次に来てよいトークン（EXPECT_* のいずれか）
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._string_is_key = False
+        self._literal_start = None  # 解析中の数値・true/false/null の開始位置
+        self._current_key = None   # 最上位の階層で直前に読んだキー
+        self._array_depth = None   # key の配列の中にいるときのその深さ
+        self._item_start = None    # 配列の現在の要素の開始位置
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    @property
+    def text(self):
+        """
+        これまでに受け取ったテキスト全体
+        """
+        return "".join(self._parts)
+
+    def feed(self, text):
+        """
+        差分テキストを解析し、新たに確定した key の配列の要素をリストで返す
+        """
+        self._parts.append(text)
+        items = []
+        while text and not self.done:
+            text = self._scan(text, items)
+        return items
+
+    def _scan(self, text, items):
+        """
+        text を先頭から解析する。候補が JSON として不正になった場合は候補を捨て、
+        候補の '{' の次の文字から読み直すテキストを返す（最後まで読めたら空文字列）
+        """
+        for index, char in enumerate(text):
+            if not self._stack:
+                # オブジェクトの外（説明文やコードブロックの囲み）は '{' まで読み飛ばす
+                if char == "{":
+                    self._buffer.append(char)
+                    self._stack.append(char)
+                    self._expect = EXPECT_KEY_OR_END
+                continue
+            if not self._step(char, items):
+                rest = "".join(self._buffer[1:]) + text[index + 1:]
+                self._reset()
+                return rest
+            if self.done:
+                break
+        return ""
+
+    def _step(self, char, items):
+        """
+        オブジェクトの中の1文字を解析する（JSON として不正なら False）
+        """
+        buffer = self._buffer
+        buffer.append(char)
+        position = len(buffer) - 1
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._string_is_key:
+                    if len(self._stack) == 1:
+                        self._current_key = self._loads(buffer[self._string_start:])
+                    self._expect = EXPECT_COLON
+                else:
+                    self._expect = EXPECT_COMMA_OR_END
+            elif char < " ":
+                # 文字列の中の改行などの制御文字は JSON では使えない
+                return False
+            return True
+
+        if self._literal_start is not None:
+            if char in LITERAL_CHARS:
+                return True
+            if self._loads(buffer[self._literal_start:position], _INVALID) is _INVALID:
+                return False
+            self._literal_start = None
+            self._expect = EXPECT_COMMA_OR_END
+
+        if char in WHITESPACE_CHARS:
+            return True
+        expect = self._expect
+        stack = self._stack
+
+        if char == '"':
+            if expect in (EXPECT_KEY, EXPECT_KEY_OR_END):
+                self._string_is_key = True
+            elif expect in (EXPECT_VALUE, EXPECT_VALUE_OR_END):
+                self._string_is_key = False
+            else:
+                return False
+            self._in_string = True
+            self._string_start = position
+        elif char in "{[":
+            if expect not in (EXPECT_VALUE, EXPECT_VALUE_OR_END):
+                return False
+            if char == "[" and len(stack) == 1 and self._current_key == self.key:
+                self._array_depth = 2
+                self._item_start = position + 1
+            stack.append(char)
+            self._expect = EXPECT_KEY_OR_END if char == "{" else EXPECT_VALUE_OR_END
+        elif char in "}]":
+            opener = "{" if char == "}" else "["
+            allowed = (EXPECT_KEY_OR_END if opener == "{" else EXPECT_VALUE_OR_END, EXPECT_COMMA_OR_END)
+            if stack[-1] != opener or expect not in allowed:
+                return False
+            if len(stack) == self._array_depth:
+                items.extend(self._take_item(position))
+                self._array_depth = None
+            stack.pop()
+            self._expect = EXPECT_COMMA_OR_END
+            if not stack:
+                self._finish_object()
+        elif char == ":":
+            if expect != EXPECT_COLON:
+                return False
+            self._expect = EXPECT_VALUE
+        elif char == ",":
+            if expect != EXPECT_COMMA_OR_END:
+                return False
+            if len(stack) == self._array_depth:
+                items.extend(self._take_item(position))
+            self._expect = EXPECT_KEY if stack[-1] == "{" else EXPECT_VALUE
+        elif char in LITERAL_START_CHARS and expect in (EXPECT_VALUE, EXPECT_VALUE_OR_END):
+            self._literal_start = position
+        else:
+            return False
+        return True
+
+    @staticmethod
+    def _loads(chars, default=None):
+        try:
+            return json.loads("".join(chars))
+        except json.JSONDecodeError:
+            return default
+
+    def _take_item(self, position):
+        raw = "".join(self._buffer[self._item_start:position]).strip()
+        self._item_start = position + 1
+        if not raw:
+            return []
+        try:
+            return [json.loads(raw)]
+        except json.JSONDecodeError:
+            return []
+
+    def _finish_object(self):
+        parsed = self._loads(self._buffer)
+        if isinstance(parsed, dict) and self.key in parsed:
+            self.result = parsed
+        self._reset()
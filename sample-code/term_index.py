@@ -0,0 +1,138 @@
+"""
+コーパス全体の単語出現頻度を差分更新で管理するインデックス
+文書ごとのポスティング（単語→文書→出現回数）を保持し、
+文書の追加・削除・置換と上位k件の取得を全文書の再集計なしで行います
+"""
+
+import heapq
+import json
+import os
+from collections import Counter
+
+
+class TermFrequencyIndex:
+    """
+    文書単位で差分更新できる単語頻度インデックス
+    """
+
+    def __init__(self):
+        self.term_counts = Counter()  # 単語 -> コーパス全体の出現回数
+        self.postings = {}            # 単語 -> {文書ID: 出現回数}
+        self.doc_terms = {}           # 文書ID -> Counter(単語 -> 出現回数)
+        self.doc_versions = {}        # 文書ID -> 内容ハッシュなどのバージョン
+        self._top_cache = None        # (k, 上位k件) 変更があるまで再利用する
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_terms
+
+    def is_current(self, doc_id, version):
+        """
+        文書が同じバージョンで登録済みかどうか
+        """
+        return doc_id in self.doc_terms and self.doc_versions.get(doc_id) == version
+
+    def add_document(self, doc_id, words, version=None):
+        """
+        文書を追加する。同じIDの文書があれば置き換える
+        words は単語リストまたは {単語: 出現回数} の辞書
+        """
+        if doc_id in self.doc_terms:
+            self.remove_document(doc_id)
+
+        counts = Counter(words)
+        self.doc_terms[doc_id] = counts
+        self.doc_versions[doc_id] = version
+        for term, count in counts.items():
+            self.term_counts[term] += count
+            self.postings.setdefault(term, {})[doc_id] = count
+        self._top_cache = None
+
+    replace_document = add_document
+
+    def remove_document(self, doc_id):
+        """
+        文書を削除し、その文書の出現回数をコーパス全体から差し引く
+        """
+        counts = self.doc_terms.pop(doc_id, None)
+        self.doc_versions.pop(doc_id, None)
+        if counts is None:
+            return
+
+        for term, count in counts.items():
+            remaining = self.term_counts[term] - count
+            if remaining > 0:
+                self.term_counts[term] = remaining
+            else:
+                del self.term_counts[term]
+
+            posting = self.postings[term]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+        self._top_cache = None
+
+    def most_common(self, k):
+        """
+        コーパス全体で出現回数の多い単語の上位k件（同数の場合は単語順）
+        """
+        if self._top_cache is not None and self._top_cache[0] >= k:
+            return self._top_cache[1][:k]
+
+        top = heapq.nsmallest(k, self.term_counts.items(), key=lambda item: (-item[1], item[0]))
+        self._top_cache = (k, top)
+        return top
+
+    def document_frequency(self, term):
+        """
+        単語を含む文書数
+        """
+        return len(self.postings.get(term, ()))
+
+    def documents_containing(self, term):
+        """
+        単語を含む文書IDと出現回数
+        """
+        return dict(self.postings.get(term, {}))
+
+    def merge(self, other):
+        """
+        別の実行で作成したインデックス（シャード）を取り込む
+        同じ文書IDがある場合は other 側の内容で置き換える
+        """
+        for doc_id, counts in other.doc_terms.items():
+            self.add_document(doc_id, counts, other.doc_versions.get(doc_id))
+        return self
+
+    def save(self, path):
+        """
+        文書ごとの出現回数を JSON で保存する（集計値は読み込み時に再構築）
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        data = {
+            'documents': {
+                doc_id: {'version': self.doc_versions.get(doc_id), 'terms': dict(counts)}
+                for doc_id, counts in self.doc_terms.items()
+            }
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for doc_id, entry in data['documents'].items():
+            index.add_document(doc_id, entry['terms'], entry['version'])
+        return index
+
+    @classmethod
+    def load_or_create(cls, path):
+        if path and os.path.exists(path):
+            return cls.load(path)
+        return cls()
@@ -0,0 +1,9 @@
+"""
+sample-code/ のスクリプトは同じディレクトリのモジュールを直接 import するため、
+テストからも sample-code/ を import パスに加える
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,48 @@
+"""
+bedrock_keyword_analyzer のプロンプト組み立てのテスト
+"""
+
+from bedrock_keyword_analyzer import (PROMPT_CACHE_MIN_TOKENS, PROMPT_CACHE_POINT, PROMPT_PLACEHOLDER,
+                                      PROMPT_TEMPLATE_PATH, build_messages, build_prompt, estimate_tokens,
+                                      split_prompt_template)
+from bedrock_stub import extract_stub_keywords
+
+TEXT = "東京の観光地と東京駅の歴史について。"
+
+
+def _read_template():
+    with open(PROMPT_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _joined_text(messages):
+    return ''.join(block.get('text', '') for block in messages[0]['content'])
+
+
+def test_template_keeps_static_parts_before_text():
+    # 文書ごとに変わるのはテキストだけで、指示と出力フォーマットはすべて固定部分に入る
+    prefix, suffix = split_prompt_template(_read_template())
+    assert '<output_format>' in prefix
+    assert suffix.strip() == '</text>'
+
+
+def test_short_prefix_has_no_cache_point():
+    template = _read_template()
+    assert estimate_tokens(split_prompt_template(template)[0]) < PROMPT_CACHE_MIN_TOKENS
+    messages = build_messages(template, TEXT)
+    assert PROMPT_CACHE_POINT not in messages[0]['content']
+    assert _joined_text(messages) == build_prompt(template, TEXT)
+
+
+def test_long_prefix_has_cache_point():
+    template = "指示。" * PROMPT_CACHE_MIN_TOKENS + "<text>\n" + PROMPT_PLACEHOLDER + "\n</text>\n"
+    messages = build_messages(template, TEXT)
+    assert messages[0]['content'][1] == PROMPT_CACHE_POINT
+    assert _joined_text(messages) == build_prompt(template, TEXT)
+    assert build_messages(template, TEXT, use_prompt_cache=False)[0]['content'].count(PROMPT_CACHE_POINT) == 0
+
+
+def test_stub_reads_text_from_template():
+    keywords = extract_stub_keywords(build_prompt(_read_template(), TEXT))
+    assert keywords[0] == '東京'
+    assert '出現回数' not in keywords
@@ -0,0 +1,50 @@
+"""
+bedrock_runner の並行抽出のテスト
+Bedrock の代わりに converse を差し替えたクライアントを使い、実際にはモデルを呼び出さない
+"""
+
+import json
+import threading
+from types import SimpleNamespace
+
+from botocore.exceptions import ReadTimeoutError
+
+from bedrock_runner import BedrockCorpusRunner
+
+
+class FlakyBedrock:
+    """
+    最初の failures 回の converse で ReadTimeoutError を投げ、その後は固定の単語を返すクライアント
+    """
+
+    def __init__(self, failures, keywords):
+        self.meta = SimpleNamespace(region_name='us-east-1')
+        self.failures = failures
+        self.keywords = keywords
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def converse(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise ReadTimeoutError(endpoint_url='http://example.invalid')
+        output = json.dumps({'results': self.keywords}, ensure_ascii=False)
+        return {'output': {'message': {'role': 'assistant', 'content': [{'text': output}]}},
+                'usage': {'inputTokens': 10, 'outputTokens': 5}}
+
+
+def test_read_timeout_is_retried_and_chunk_is_kept(monkeypatch):
+    # 共有の応答キャッシュ（sample-code/.cache）には読み書きしない
+    monkeypatch.setenv('TEXT_MINING_RESPONSE_CACHE', '0')
+    monkeypatch.setattr('rate_limit.backoff_delay', lambda attempt: 0.0)
+    bedrock = FlakyBedrock(failures=1, keywords=['東京', '観光'])
+    runner = BedrockCorpusRunner(bedrock=bedrock, prompt_template='<text>{{解析対象のテキストをLLMに渡す}}</text>',
+                                 requests_per_second=100, cache=None)
+
+    analysis = runner.analyze_documents({'doc': '東京の観光。東京駅。'})['doc']
+
+    assert bedrock.calls == 2
+    assert analysis['errors'] == []
+    assert analysis['keywords'] == ['東京', '観光']
+    assert analysis['word_frequency'] == {'東京': 2, '観光': 1}
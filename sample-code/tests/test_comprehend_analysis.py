@@ -0,0 +1,94 @@
+"""
+comprehend_analysis の Batch API 呼び出しのテスト
+botocore の Stubber で応答を差し替え、実際には Comprehend を呼び出さない
+"""
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from comprehend_analysis import BATCH_SIZE, batch_detect, split_text_into_chunks
+from response_cache import ResponseCache
+
+LANGUAGE_CODE = 'ja'
+
+
+@pytest.fixture
+def comprehend():
+    client = boto3.client('comprehend', region_name='ap-northeast-1',
+                          aws_access_key_id='testing', aws_secret_access_key='testing')
+    with Stubber(client) as stubber:
+        client.stubber = stubber
+        yield client
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'))
+    yield cache
+    cache.close()
+
+
+def _long_text(n_sentences):
+    # 1文が約4000バイトあり、2文は1チャンク（4800バイト）に収まらないため1文1チャンクになる
+    return ''.join(f"{i}番目の文です。".rjust(1300, 'あ') for i in range(n_sentences))
+
+
+def _key_phrases_response(texts, failed=()):
+    result_list = [{'Index': i, 'KeyPhrases': [{'Text': text[-8:], 'Score': 0.9,
+                                                'BeginOffset': 0, 'EndOffset': 8}]}
+                   for i, text in enumerate(texts) if i not in failed]
+    error_list = [{'Index': i, 'ErrorCode': 'InternalServerException', 'ErrorMessage': 'failed'}
+                  for i in failed]
+    return {'ResultList': result_list, 'ErrorList': error_list}
+
+
+def test_batch_detect_splits_requests_and_maps_partial_errors(comprehend):
+    chunks = split_text_into_chunks(_long_text(30))
+    assert len(chunks) == 30
+
+    first, second = chunks[:BATCH_SIZE], chunks[BATCH_SIZE:]
+    comprehend.stubber.add_response('batch_detect_key_phrases', _key_phrases_response(first),
+                                    {'TextList': first, 'LanguageCode': LANGUAGE_CODE})
+    # 2回目のリクエストでは2件目だけが失敗する（Index はリクエスト内の位置）
+    comprehend.stubber.add_response('batch_detect_key_phrases', _key_phrases_response(second, failed={1}),
+                                    {'TextList': second, 'LanguageCode': LANGUAGE_CODE})
+
+    results = batch_detect(comprehend, 'batch_detect_key_phrases', chunks, LANGUAGE_CODE, use_cache=False)
+
+    assert len(results) == 30
+    assert results[BATCH_SIZE + 1] == {'Error': 'InternalServerException: failed'}
+    for i, (chunk, result) in enumerate(zip(chunks, results)):
+        if i == BATCH_SIZE + 1:
+            continue
+        assert 'Index' not in result
+        assert result['KeyPhrases'][0]['Text'] == chunk[-8:]
+
+
+def test_batch_detect_resends_only_uncached_and_failed_texts(comprehend, cache):
+    chunks = split_text_into_chunks(_long_text(27))
+    first, second = chunks[:BATCH_SIZE], chunks[BATCH_SIZE:]
+    comprehend.stubber.add_response('batch_detect_key_phrases', _key_phrases_response(first, failed={3}),
+                                    {'TextList': first, 'LanguageCode': LANGUAGE_CODE})
+    comprehend.stubber.add_response('batch_detect_key_phrases', _key_phrases_response(second),
+                                    {'TextList': second, 'LanguageCode': LANGUAGE_CODE})
+    batch_detect(comprehend, 'batch_detect_key_phrases', chunks, LANGUAGE_CODE, cache)
+
+    # 失敗した結果はキャッシュされないため、再実行ではそのテキストだけを送信する
+    comprehend.stubber.add_response('batch_detect_key_phrases', _key_phrases_response([chunks[3]]),
+                                    {'TextList': [chunks[3]], 'LanguageCode': LANGUAGE_CODE})
+    results = batch_detect(comprehend, 'batch_detect_key_phrases', chunks, LANGUAGE_CODE, cache)
+
+    assert [result['KeyPhrases'][0]['Text'] for result in results] == [chunk[-8:] for chunk in chunks]
+    assert cache.stats()['hits'] == 26
+
+
+def test_response_cache_env_is_checked_at_call_time(comprehend, monkeypatch):
+    chunks = split_text_into_chunks(_long_text(2))
+    monkeypatch.setenv('TEXT_MINING_RESPONSE_CACHE', '0')
+    # キャッシュが無効なので、同じテキストでも2回とも送信する
+    for _ in range(2):
+        comprehend.stubber.add_response('batch_detect_key_phrases', _key_phrases_response(chunks),
+                                        {'TextList': chunks, 'LanguageCode': LANGUAGE_CODE})
+        batch_detect(comprehend, 'batch_detect_key_phrases', chunks, LANGUAGE_CODE)
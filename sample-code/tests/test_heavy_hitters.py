@@ -0,0 +1,58 @@
+"""
+heavy_hitters.SpaceSavingCounter のテスト
+"""
+
+import random
+from collections import Counter
+
+from heavy_hitters import SpaceSavingCounter
+
+
+def _stream(seed=0, n=5000, vocabulary=200):
+    rng = random.Random(seed)
+    # 出現回数に偏りのある単語列（Zipf 風）
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    return rng.choices([f'w{i}' for i in range(vocabulary)], weights, k=n)
+
+
+def _true_top(true_counts, k):
+    # 同数で並ぶ単語はどれも上位k件に入りうる
+    kth = sorted(true_counts.values(), reverse=True)[k - 1]
+    return {word for word, count in true_counts.items() if count >= kth}
+
+
+def test_estimates_bound_true_counts():
+    words = _stream()
+    counter = SpaceSavingCounter(capacity=50)
+    counter.update(words)
+    true_counts = Counter(words)
+    for word, count in counter.counts.items():
+        assert count - counter.errors[word] <= true_counts[word] <= count
+        assert counter.errors[word] <= counter.max_error
+
+
+def test_guaranteed_words_are_true_top_k():
+    for seed in range(5):
+        words = _stream(seed)
+        true_counts = Counter(words)
+        for capacity, k in [(50, 5), (50, 20), (10, 10), (5, 10)]:
+            counter = SpaceSavingCounter(capacity)
+            counter.update(words)
+            top = _true_top(true_counts, k)
+            for word, _, _, guaranteed in counter.most_common(k):
+                if guaranteed:
+                    assert word in top, (seed, capacity, k, word)
+
+
+def test_capacity_not_above_k_after_evictions():
+    # 1回だけ出る単語で表を埋め直すと推定回数が水増しされ、どの単語も確定できない
+    counter = SpaceSavingCounter(capacity=2)
+    counter.update(['a', 'b', 'c', 'd', 'e'])
+    assert counter.evictions == 3
+    assert not any(guaranteed for *_, guaranteed in counter.most_common(5))
+
+
+def test_all_guaranteed_without_evictions():
+    counter = SpaceSavingCounter(capacity=10)
+    counter.update(['a', 'a', 'b'])
+    assert [(word, guaranteed) for word, _, _, guaranteed in counter.most_common(5)] == [('a', True), ('b', True)]
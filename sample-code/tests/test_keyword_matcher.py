@@ -0,0 +1,29 @@
+"""
+keyword_matcher の出現回数のカウントのテスト
+"""
+
+import re
+
+import pytest
+
+from keyword_matcher import KeywordMatcher
+
+TEXT = "東京駅から東京タワーへ。とうきょうとうきょう、Tokyo と TOKYO。aaaa"
+KEYWORDS = ["東京", "東京駅", "とうきょう", "tokyo", "aa", "なし", "東京", ""]
+
+
+def _count_by_regex(keywords, text, ignore_case):
+    fold = str.lower if ignore_case else str
+    return {keyword: len(re.findall(re.escape(fold(keyword)), fold(text)))
+            for keyword in dict.fromkeys(keyword for keyword in keywords if keyword)}
+
+
+@pytest.mark.parametrize('ignore_case', [True, False])
+def test_matcher_counts_like_findall(ignore_case):
+    assert KeywordMatcher(KEYWORDS, ignore_case=ignore_case).count(TEXT) == _count_by_regex(KEYWORDS, TEXT, ignore_case)
+
+
+def test_count_documents_totals():
+    result = KeywordMatcher(["東京", "aa"]).count_documents([("a", TEXT), ("b", "東京")])
+    assert result['documents']['b'] == {"東京": 1, "aa": 0}
+    assert result['total'] == {"東京": 3, "aa": 2}
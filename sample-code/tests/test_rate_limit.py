@@ -0,0 +1,72 @@
+"""
+rate_limit.call_with_retry の再試行のテスト（待ち時間は sleep を差し替えて省く）
+"""
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+from rate_limit import TokenBucket, call_with_retry
+
+
+class RecordingBucket(TokenBucket):
+    """
+    on_success / on_throttle の呼び出し回数を数えるトークンバケット
+    """
+
+    def __init__(self):
+        super().__init__(1000)
+        self.successes = 0
+        self.throttles = 0
+
+    def on_success(self):
+        self.successes += 1
+
+    def on_throttle(self):
+        self.throttles += 1
+
+
+def _failing(errors, result='ok'):
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return func, calls
+
+
+def _client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Converse')
+
+
+def test_retries_transport_errors_without_throttling():
+    func, calls = _failing([ReadTimeoutError(endpoint_url='http://example.invalid'),
+                            EndpointConnectionError(endpoint_url='http://example.invalid')])
+    limiter = RecordingBucket()
+    assert call_with_retry(func, limiter, max_attempts=3, sleep=lambda _: None) == 'ok'
+    assert len(calls) == 3
+    # 通信エラーはスロットリングではないため、流量は下げない
+    assert (limiter.successes, limiter.throttles) == (1, 0)
+
+
+def test_retries_throttling_and_lowers_rate():
+    func, calls = _failing([_client_error('ThrottlingException')])
+    limiter = RecordingBucket()
+    assert call_with_retry(func, limiter, max_attempts=3, sleep=lambda _: None) == 'ok'
+    assert (len(calls), limiter.throttles) == (2, 1)
+
+
+def test_gives_up_after_max_attempts():
+    func, calls = _failing([ReadTimeoutError(endpoint_url='http://example.invalid')] * 3)
+    with pytest.raises(ReadTimeoutError):
+        call_with_retry(func, max_attempts=3, sleep=lambda _: None)
+    assert len(calls) == 3
+
+
+def test_does_not_retry_other_errors():
+    func, calls = _failing([_client_error('ValidationException')])
+    with pytest.raises(ClientError):
+        call_with_retry(func, max_attempts=3, sleep=lambda _: None)
+    assert len(calls) == 1
@@ -0,0 +1,65 @@
+"""
+response_cache.ResponseCache の容量管理のテスト
+"""
+
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        cache = ResponseCache(str(tmp_path / 'responses.sqlite3'), **kwargs)
+        caches.append(cache)
+        return cache
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def _value(n):
+    # JSON にすると 100 バイトになる文字列
+    return str(n).rjust(98, 'x')
+
+
+def test_evicts_least_recently_used_over_cap(make_cache):
+    cache = make_cache(max_bytes=300)
+    for n in range(3):
+        cache.put(f'k{n}', _value(n))
+    cache.get('k0')
+    cache.put('k3', _value(3))
+
+    assert cache.get('k1') is None
+    assert [cache.get(f'k{n}') for n in (0, 2, 3)] == [_value(0), _value(2), _value(3)]
+    assert cache.stats()['bytes'] == 300
+
+
+def test_running_total_matches_table(make_cache):
+    cache = make_cache(max_bytes=1000, evict_interval=3)
+    for n in range(30):
+        # 同じキーへの上書きは差分だけ合計が増える
+        cache.put(f'k{n % 12}', 'v' * (n * 7 % 150))
+        assert cache._total_bytes == cache.stats()['bytes'] <= 1000
+
+    # 開き直すと合計サイズをテーブルから数え直す
+    reopened = make_cache(max_bytes=1000)
+    reopened.put('new', _value(0))
+    assert reopened._total_bytes == reopened.stats()['bytes']
+
+
+def test_expired_entries_are_removed_every_interval(make_cache, monkeypatch):
+    cache = make_cache(ttl_seconds=60, evict_interval=3)
+    cache.put('old', _value(0))
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    # 2回目の put では上限を超えておらず、間隔にも達していないので削除しない
+    cache.put('a', _value(1))
+    assert cache.stats()['entries'] == 2
+    cache.put('b', _value(2))
+    assert cache.stats()['entries'] == 2
+    assert cache._total_bytes == cache.stats()['bytes'] == 200
@@ -0,0 +1,106 @@
+"""
+stream_json のストリーミング JSON パーサのテスト
+fixtures/ の converse_stream_*.jsonl は converse_stream の応答ストリームのイベントを1行1件で記録したもの
+"""
+
+import json
+import os
+
+import pytest
+
+from stream_json import StreamingJSONExtractor, iter_stream_text
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+EXPECTED_RESULTS = {
+    'converse_stream_code_block': ['東京', '観光', '東京駅', '浅草'],
+    'converse_stream_stray_brace': ['東京', '観光', '浅草'],
+    'converse_stream_escaped': ['C:\\temp', '東京', '引用"符"', '数字', 35.0, True, None, {'word': '人口'}],
+}
+
+
+def _load_events(name):
+    with open(os.path.join(FIXTURE_DIR, f"{name}.jsonl"), 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _feed_all(extractor, texts):
+    items = []
+    for text in texts:
+        items.extend(extractor.feed(text))
+    return items
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED_RESULTS))
+def test_recorded_stream(name):
+    events = _load_events(name)
+    metadata = []
+    extractor = StreamingJSONExtractor('results')
+    items = _feed_all(extractor, iter_stream_text(events, on_metadata=metadata.append))
+
+    assert extractor.done
+    assert extractor.result['results'] == EXPECTED_RESULTS[name]
+    assert items == EXPECTED_RESULTS[name]
+    # 受け取ったテキストはそのまま残り、最後の metadata イベントから usage を受け取れる
+    assert extractor.text == ''.join(event['contentBlockDelta']['delta']['text']
+                                     for event in events if 'contentBlockDelta' in event)
+    assert [m['usage']['outputTokens'] for m in metadata] == [events[-1]['metadata']['usage']['outputTokens']]
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED_RESULTS))
+def test_result_does_not_depend_on_chunking(name):
+    text = ''.join(iter_stream_text(_load_events(name)))
+    whole = StreamingJSONExtractor('results')
+    whole_items = whole.feed(text)
+    by_char = StreamingJSONExtractor('results')
+    char_items = _feed_all(by_char, text)
+
+    assert by_char.result == whole.result
+    assert char_items == whole_items
+
+
+def test_stray_unclosed_brace_before_object():
+    extractor = StreamingJSONExtractor('results')
+    _feed_all(extractor, ['補足: { ここは閉じない', 'まま続く説明\n', '{"results": ["a", "b"]}'])
+    assert extractor.result == {'results': ['a', 'b']}
+
+
+def test_stray_brace_that_looks_like_json():
+    # '{' の後に JSON のような文字列が続いても、文法に合わなくなった時点で候補を捨てる
+    extractor = StreamingJSONExtractor('results')
+    extractor.feed('例えば {"results" のように返します。\n```json\n{"results": ["x"]}\n```')
+    assert extractor.result == {'results': ['x']}
+
+
+def test_broken_candidate_is_rescanned_from_next_brace():
+    # 候補の中に本物のオブジェクトがある場合も、候補の '{' の直後から探し直して見つける
+    extractor = StreamingJSONExtractor('results')
+    _feed_all(extractor, ['{途中で壊れた候補 ', '{"results": ', '["y"]}'])
+    assert extractor.result == {'results': ['y']}
+
+
+def test_object_without_key_is_skipped():
+    extractor = StreamingJSONExtractor('results')
+    items = extractor.feed('{"other": [1, 2]} {"results": ["z"]} {"results": ["ignored"]}')
+    assert extractor.result == {'results': ['z']}
+    assert items == ['z']
+
+
+@pytest.mark.parametrize('text', [
+    '{"results": ["a" "b"]}',
+    '{"results": ["a",]}',
+    '{"results": ["改\n行"]}',
+    '{"results": [tru]}',
+    '{"results": ["a"}',
+])
+def test_invalid_json_is_not_accepted(text):
+    extractor = StreamingJSONExtractor('results')
+    extractor.feed(text)
+    assert not extractor.done
+
+
+def test_incomplete_stream():
+    extractor = StreamingJSONExtractor('results')
+    items = extractor.feed('{"results": ["a", "b", "c')
+    assert not extractor.done
+    assert items == ['a', 'b']
@@ -0,0 +1,40 @@
+"""
+token_cache.TokenCache の容量管理のテスト
+"""
+
+import pickle
+
+from token_cache import TokenCache
+
+
+def test_evicts_least_recently_used_over_cap(tmp_path):
+    cache = TokenCache(str(tmp_path / 'tokens.sqlite3'), max_bytes=120)
+    try:
+        for n in range(3):
+            # JSON にすると 40 バイトになる単語リスト
+            cache.put(f'k{n}', [str(n) * 36])
+        cache.get('k0')
+        cache.put('k3', ['3' * 36])
+
+        remaining = [n for n in range(4) if cache.get(f'k{n}') is not None]
+        assert remaining == [0, 2, 3]
+        assert cache._total_bytes == 120
+    finally:
+        cache.close()
+
+
+def test_running_total_survives_replace_and_pickle(tmp_path):
+    cache = TokenCache(str(tmp_path / 'tokens.sqlite3'), max_bytes=1000)
+    try:
+        for n in range(40):
+            cache.put(f'k{n % 9}', ['w' * (n * 11 % 90)])
+            actual = cache.conn.execute('SELECT SUM(size) FROM tokens').fetchone()[0]
+            assert cache._total_bytes == actual <= 1000
+
+        # ワーカープロセスに渡したキャッシュは、接続を開き直すときに合計サイズを数え直す
+        worker = pickle.loads(pickle.dumps(cache))
+        worker.put('worker', ['x'])
+        assert worker._total_bytes == worker.conn.execute('SELECT SUM(size) FROM tokens').fetchone()[0]
+        worker.close()
+    finally:
+        cache.close()
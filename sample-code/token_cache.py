@@ -0,0 +1,144 @@
+"""
+形態素解析結果（フィルタリング済みの単語リスト）のディスクキャッシュ
+文書の内容ハッシュ・MeCab辞書・フィルタ設定をキーにして SQLite に保存します
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import metrics
+
+# --- 設定 ---
+TOKEN_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'tokens.sqlite3')
+TOKEN_CACHE_MAX_BYTES = 256 * 1024 * 1024  # キャッシュ全体の上限サイズ（超えたら古いものから削除）
+
+FILE_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_text(text):
+    """
+    テキストの内容ハッシュ（SHA-256）を返す
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_file(path):
+    """
+    ファイルを全文メモリに載せずに内容ハッシュ（SHA-256）を計算する
+    """
+    digest = hashlib.sha256()
+    with metrics.timer('file_read', purpose='hash'), open(path, 'rb') as f:
+        for block in iter(lambda: f.read(FILE_HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TokenCache:
+    """
+    単語リストを SQLite に保存する LRU キャッシュ
+    合計サイズは接続を開いたときに1度だけ数え、以降は追加・削除のたびに差分で更新する
+    """
+
+    def __init__(self, path=TOKEN_CACHE_PATH, max_bytes=TOKEN_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._total_bytes = 0  # キャッシュ全体の合計サイズ
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            # 複数プロセスからの同時読み書きに備えて WAL モードにする
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tokens ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS tokens_last_access ON tokens (last_access)')
+            conn.commit()
+            self._total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM tokens').fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def __getstate__(self):
+        # 接続はプロセスをまたげないため、ワーカー側で開き直す
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_total_bytes'] = 0
+        return state
+
+    @staticmethod
+    def make_key(content_hash, tokenizer, extra=''):
+        """
+        内容ハッシュ・辞書/フィルタ設定のフィンガープリント・追加条件からキーを作る
+        """
+        raw = f"{content_hash}|{tokenizer.config_fingerprint()}|{extra}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute('SELECT value FROM tokens WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self.conn:
+            self.conn.execute('UPDATE tokens SET last_access = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode('utf-8'))
+        with self.conn:
+            old = self.conn.execute('SELECT size FROM tokens WHERE key = ?', (key,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO tokens (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                (key, payload, size, time.time())
+            )
+        self._total_bytes += size - (old[0] if old else 0)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def get_or_compute(self, key, compute):
+        """
+        キャッシュにあればそれを返し、なければ compute() の結果を保存して返す
+        """
+        value = self.get(key)
+        if value is not None:
+            metrics.inc('token_cache_requests_total', result='hit')
+            return value
+
+        metrics.inc('token_cache_requests_total', result='miss')
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def evict(self):
+        """
+        合計サイズが上限を超えていれば、最後に参照されたのが古い順に削除する
+        """
+        total = self._total_bytes
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for key, size in self.conn.execute('SELECT key, size FROM tokens ORDER BY last_access ASC'):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+
+        with self.conn:
+            self.conn.executemany('DELETE FROM tokens WHERE key = ?', victims)
+        self._total_bytes = total
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self._total_bytes = 0
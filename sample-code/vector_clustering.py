@@ -0,0 +1,155 @@
+"""
+ベクトル集合のクラスタリング（コサイン類似度による k-means）
+単語ベクトルのような数千〜数十万件のベクトルを、ミニバッチ単位で重心を更新する
+k-means でまとめ、クラスタ番号・重心・代表的な要素を返します
+"""
+
+import numpy as np
+
+from similarity_search import SIMILARITY_MEMORY_BUDGET, iter_similarity_blocks, normalize_rows
+
+# --- 設定 ---
+KMEANS_ITERATIONS = 10          # 全件 k-means の反復回数
+MINIBATCH_SIZE = 1024           # ミニバッチ k-means で1回に使うベクトル数
+MINIBATCH_ITERATIONS = 100      # ミニバッチ k-means の最大反復回数
+MINIBATCH_TOLERANCE = 1e-4      # 重心の移動量がこれを下回ったら打ち切る
+CLUSTERING_SEED = 42
+
+
+def default_n_clusters(n_vectors):
+    """
+    要素数に応じたクラスタ数の目安（およそ √(n/2)）
+    """
+    return max(1, int(np.sqrt(n_vectors / 2)))
+
+
+def assign_clusters(vectors, centroids, memory_budget=SIMILARITY_MEMORY_BUDGET):
+    """
+    各ベクトルに最も近い重心の番号と、その重心とのコサイン類似度を返す
+    """
+    labels = np.empty(len(vectors), dtype=np.int64)
+    similarities = np.empty(len(vectors), dtype=np.float32)
+    for start, block in iter_similarity_blocks(vectors, centroids, memory_budget):
+        end = start + len(block)
+        labels[start:end] = block.argmax(axis=1)
+        similarities[start:end] = block[np.arange(len(block)), labels[start:end]]
+    return labels, similarities
+
+
+def init_centroids(vectors, n_clusters, rng, sample_size=None):
+    """
+    k-means++ で初期重心を選ぶ（既に選んだ重心からの距離の2乗に比例した確率で選ぶ）
+    要素数が多い場合は標本から選ぶ
+    """
+    sample_size = sample_size or max(10 * n_clusters, MINIBATCH_SIZE)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+    chosen = [rng.integers(len(vectors))]
+    distances = np.maximum(1.0 - vectors @ vectors[chosen[0]], 0.0)
+    for _ in range(1, n_clusters):
+        weights = distances.astype(np.float64) ** 2
+        total = weights.sum()
+        if total > 0:
+            index = rng.choice(len(vectors), p=weights / total)
+        else:
+            index = rng.integers(len(vectors))
+        chosen.append(index)
+        distances = np.minimum(distances, np.maximum(1.0 - vectors @ vectors[index], 0.0))
+    return vectors[chosen].copy()
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=CLUSTERING_SEED,
+                     memory_budget=SIMILARITY_MEMORY_BUDGET):
+    """
+    正規化済みベクトルをコサイン類似度で k-means クラスタリングし、正規化した重心を返す
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = init_centroids(vectors, n_clusters, rng)
+
+    for _ in range(iterations):
+        labels, _ = assign_clusters(vectors, centroids, memory_budget)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+        # 空になったクラスタはランダムなベクトルで置き直す
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def minibatch_spherical_kmeans(vectors, n_clusters, batch_size=MINIBATCH_SIZE,
+                               iterations=MINIBATCH_ITERATIONS, tolerance=MINIBATCH_TOLERANCE,
+                               seed=CLUSTERING_SEED):
+    """
+    正規化済みベクトルをミニバッチ k-means でクラスタリングし、正規化した重心を返す
+    1回の反復で扱うのは batch_size 件だけなので、要素数が多くてもメモリ使用量は一定
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    batch_size = min(batch_size, len(vectors))
+    centroids = init_centroids(vectors, n_clusters, rng)
+    # 重心ごとにこれまで割り当てられた件数（多いほど1回の更新幅が小さくなる）
+    seen = np.zeros(n_clusters, dtype=np.int64)
+
+    for _ in range(iterations):
+        batch = vectors[rng.choice(len(vectors), batch_size, replace=False)]
+        labels = (batch @ centroids.T).argmax(axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+        counts = np.bincount(labels, minlength=n_clusters)
+        seen += counts
+
+        updated = counts > 0
+        rate = counts[updated] / seen[updated]
+        means = sums[updated] / counts[updated, None]
+        previous = centroids.copy()
+        centroids[updated] += rate[:, None] * (means - centroids[updated])
+        centroids = normalize_rows(centroids)
+
+        if np.abs(centroids - previous).max() < tolerance:
+            break
+    return centroids
+
+
+def cluster_vectors(vectors, names, n_clusters=None, min_similarity=None, n_representatives=5,
+                    seed=CLUSTERING_SEED, memory_budget=SIMILARITY_MEMORY_BUDGET):
+    """
+    ベクトル集合をクラスタリングし、次のキーを持つ辞書を返す
+        'labels'      要素ごとのクラスタ番号（重心との類似度が min_similarity 未満なら -1）
+        'similarities' 要素ごとの所属クラスタの重心との類似度
+        'centroids'   クラスタごとの正規化した重心
+        'clusters'    クラスタごとの {'label', 'size', 'representatives': [(名前, 類似度), ...]}
+                      （要素数の多い順。代表は重心に近い順に n_representatives 件）
+    """
+    normed = normalize_rows(vectors)
+    n_clusters = n_clusters or default_n_clusters(len(normed))
+    if len(normed) > MINIBATCH_SIZE:
+        centroids = minibatch_spherical_kmeans(normed, n_clusters, seed=seed)
+    else:
+        centroids = spherical_kmeans(normed, n_clusters, seed=seed, memory_budget=memory_budget)
+
+    labels, similarities = assign_clusters(normed, centroids, memory_budget)
+    if min_similarity is not None:
+        labels[similarities < min_similarity] = -1
+
+    # クラスタ番号ごと・重心に近い順に並べ、各クラスタの先頭を代表とする
+    order = np.lexsort((-similarities, labels))
+    sorted_labels = labels[order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    clusters = []
+    for members in np.split(order, boundaries):
+        if len(members) == 0 or labels[members[0]] < 0:
+            continue
+        clusters.append({
+            'label': int(labels[members[0]]),
+            'size': len(members),
+            'representatives': [(names[i], float(similarities[i])) for i in members[:n_representatives]],
+        })
+    clusters.sort(key=lambda cluster: (-cluster['size'], cluster['label']))
+
+    return {'labels': labels, 'similarities': similarities, 'centroids': centroids, 'clusters': clusters}